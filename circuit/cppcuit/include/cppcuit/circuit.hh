@@ -5,9 +5,11 @@
 #include <variant>
 
 #include "array_input.hh"
+#include "cycle_counter.hh"
 #include "optional_reference.hh"
 #include "output_handle.hh"
 #include "overload.hh"
+#include "validity_bits.hh"
 
 #include "timer/timer_queue.hh"
 
@@ -20,6 +22,10 @@ template <class T>
 using DiscoveredCallback =
     std::variant<CircuitCall<T>, NoCallbackFound, WrongCallbackType>;
 
+template <class T>
+using DiscoveredBatchCallback =
+    std::variant<CircuitBatchCall<T>, NoCallbackFound, WrongCallbackType>;
+
 using RawDiscoveredCallback =
     std::variant<void *, NoCallbackFound, WrongCallbackType>;
 
@@ -72,10 +78,21 @@ public:
   optional_reference<const T> load_from_handle(OutputHandle<T> handle) const {
     const T *value_ptr = reinterpret_cast<const T *>(
         handle.get_offset() + reinterpret_cast<const char *>(this));
-    const bool *valid_ptr = reinterpret_cast<const bool *>(
+    const std::uint8_t *valid_ptr = reinterpret_cast<const std::uint8_t *>(
         handle.get_valid_offset() + reinterpret_cast<const char *>(this));
 
-    return optional_reference(value_ptr, *valid_ptr);
+    return optional_reference(value_ptr,
+                              (*valid_ptr & handle.get_valid_mask()) != 0);
+  }
+
+  // Only filled in by circuits generated with cycle_counts in the loader config
+  virtual std::span<const CycleCount> cycle_counts() const { return {}; }
+  virtual std::span<const CycleCountName> cycle_count_names() const {
+    return {};
+  }
+
+  void write_cycle_counts(std::ostream &out) const {
+    ::write_cycle_counts(out, cycle_count_names(), cycle_counts());
   }
 
   template <class T>
@@ -94,4 +111,19 @@ public:
             [](auto x) -> DiscoveredCallback<T> { return x; }},
         raw_address);
   }
+
+  // Batch entry points are only generated with batch_calls in the loader config
+  template <class T>
+  DiscoveredBatchCallback<T>
+  load_batch_callback(const std::string &name) const {
+    RawDiscoveredCallback raw_address =
+        do_real_call_lookup(name + "_batch", typeid(T));
+
+    return std::visit(
+        overloaded{[](void *p) -> DiscoveredBatchCallback<T> {
+                     return (CircuitBatchCall<T>)p;
+                   },
+                   [](auto x) -> DiscoveredBatchCallback<T> { return x; }},
+        raw_address);
+  }
 };
\ No newline at end of file
@@ -0,0 +1,58 @@
+#pragma once
+
+#include <array>
+#include <chrono>
+#include <cstdint>
+#include <ostream>
+#include <span>
+#include <string_view>
+
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
+
+// Circuits generated with cycle_counts in the loader config time every
+// component call with these, into one counter per (call or timer, component)
+
+// A cheap timestamp counter. It isn't serializing, so individual readings can
+// be off by a few instructions, which washes out over many calls
+inline std::uint64_t read_cycle_counter() {
+#if defined(__x86_64__) || defined(__i386__)
+  return __rdtsc();
+#elif defined(__aarch64__)
+  std::uint64_t ticks;
+  asm volatile("mrs %0, cntvct_el0" : "=r"(ticks));
+  return ticks;
+#else
+  return std::chrono::steady_clock::now().time_since_epoch().count();
+#endif
+}
+
+struct CycleCount {
+  std::uint64_t cycles = 0;
+  std::uint64_t calls = 0;
+
+  void record(std::uint64_t elapsed) {
+    cycles += elapsed;
+    calls += 1;
+  }
+};
+
+struct CycleCountName {
+  std::string_view trigger;
+  std::string_view component;
+};
+
+// Writes the json read by pycircuit.loader.cycle_count_report
+inline void write_cycle_counts(std::ostream &out,
+                               std::span<const CycleCountName> names,
+                               std::span<const CycleCount> counts) {
+  out << "[";
+  for (std::size_t i = 0; i < names.size() && i < counts.size(); i++) {
+    out << (i == 0 ? "\n" : ",\n") << "  {\"trigger\": \"" << names[i].trigger
+        << "\", \"component\": \"" << names[i].component
+        << "\", \"cycles\": " << counts[i].cycles
+        << ", \"calls\": " << counts[i].calls << "}";
+  }
+  out << "\n]\n";
+}
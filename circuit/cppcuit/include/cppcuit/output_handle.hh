@@ -1,28 +1,46 @@
 #pragma once
 
 #include <cstdint>
+#include <span>
 
 #include "raw_call.hh"
 
 class RawOutputHandle {
   std::uint32_t offset;
   std::uint32_t valid_offset;
+  // Validity is the byte at valid_offset masked with this,
+  // which is a single bit when markers are packed
+  std::uint8_t valid_mask;
 
 public:
   std::uint32_t get_offset() const { return offset; }
   std::uint32_t get_valid_offset() const { return valid_offset; }
+  std::uint8_t get_valid_mask() const { return valid_mask; }
 
-  RawOutputHandle(std::uint32_t offset, std::uint32_t valid_offset)
-      : offset(offset), valid_offset(valid_offset) {}
+  RawOutputHandle(std::uint32_t offset, std::uint32_t valid_offset,
+                  std::uint8_t valid_mask = 1)
+      : offset(offset), valid_offset(valid_offset), valid_mask(valid_mask) {}
 };
 
 template <class T> class OutputHandle : public RawOutputHandle {
 public:
   OutputHandle(RawOutputHandle h)
-      : RawOutputHandle(h.get_offset(), h.get_valid_offset()) {}
+      : RawOutputHandle(h.get_offset(), h.get_valid_offset(),
+                        h.get_valid_mask()) {}
 };
 
 class Circuit;
 template <class T>
 using CircuitCall = void (*)(Circuit *, std::uint64_t, T,
-                             RawCall<const Circuit *>);
\ No newline at end of file
+                             RawCall<const Circuit *>);
+
+// One input of a batch, with the time it is applied at
+template <class T> struct Timestamped {
+  std::uint64_t time;
+  T input;
+};
+
+// Applies each input of the batch in order, as if the call were made for each
+template <class T>
+using CircuitBatchCall = void (*)(Circuit *, std::span<const Timestamped<T>>,
+                                  RawCall<const Circuit *>);
@@ -0,0 +1,40 @@
+#pragma once
+
+#include <bit>
+#include <cstdint>
+
+// Validity markers of a circuit generated with packed validity are stored
+// as bits of ValidityWords, instead of one bool each
+using ValidityWord = std::uint64_t;
+constexpr std::uint32_t VALIDITY_WORD_BITS = 64;
+
+// Reads and writes a single packed marker like the bool it replaces
+class ValidityBit {
+  ValidityWord &word;
+  ValidityWord mask;
+
+public:
+  ValidityBit(ValidityWord &word, std::uint32_t bit)
+      : word(word), mask(ValidityWord(1) << bit) {}
+
+  operator bool() const { return (word & mask) != 0; }
+
+  ValidityBit &operator=(bool valid) {
+    word = (word & ~mask) | (-ValidityWord(valid) & mask);
+    return *this;
+  }
+};
+
+// Output handles test validity with a single byte load and mask,
+// these find the byte of a word holding a bit and its mask within that byte
+constexpr std::uint32_t validity_byte_of(std::uint32_t bit) {
+  if constexpr (std::endian::native == std::endian::little) {
+    return bit / 8;
+  } else {
+    return sizeof(ValidityWord) - 1 - bit / 8;
+  }
+}
+
+constexpr std::uint8_t validity_mask_of(std::uint32_t bit) {
+  return std::uint8_t(1) << (bit % 8);
+}
@@ -0,0 +1,377 @@
+"""A compact binary encoding of CircuitData
+
+The JSON encoding spells out every name and definition in full and decodes
+through dataclasses_json one field at a time. The binary encoding instead interns
+every string (component names, output names, generics, ...) into a single table
+and every definition into a definition table, so that components are stored as
+flat records of little-endian u32 words indexing into those tables.
+
+Layout:
+    header: MAGIC, version, then (offset, length) of each section
+    string offsets: u32 start of each string in the string data, plus one end
+    string data: utf-8 of every interned string, back to back
+    words: u32 words, being
+        the index of the json string describing externals, call groups and structs
+        number of definitions, then (name, definition json) string pairs
+        number of components, then one record per component
+
+A component record is
+    name, definition index,
+    number of inputs, then per input
+        input name, SINGLE_INPUT, parent, output name
+        | input name, ARRAY_INPUT, number of batches,
+            then per batch: number of fields, then (field, parent, output name)
+    number of output options, then (output name, option flags)
+    number of generics, then (generic name, value)
+    params json string, or NO_STRING
+
+Strings are decoded at most once, straight out of the (optionally memory-mapped)
+buffer, and each definition is decoded and validated once no matter how many
+components share it.
+"""
+
+import json
+import mmap
+import struct
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+from argparse_dataclass import ArgumentParser
+from frozendict import frozendict
+from frozenlist import FrozenList
+
+from pycircuit.circuit_builder.component import (
+    ArrayComponentInput,
+    Component,
+    ComponentInput,
+    ComponentOutput,
+    ExternalInput,
+    InputBatch,
+    OutputOptions,
+    SingleComponentInput,
+)
+from pycircuit.circuit_builder.definition import Definition
+
+MAGIC = b"PYCIRCB\x00"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sI6Q")
+
+NO_STRING = 0xFFFFFFFF
+
+SINGLE_INPUT = 0
+ARRAY_INPUT = 1
+
+FORCE_STORED = 1
+BLOCK_PROPAGATION = 2
+
+
+def is_binary_circuit(data: bytes) -> bool:
+    return data[: len(MAGIC)] == MAGIC
+
+
+class _StringTable:
+    def __init__(self):
+        self.strings: List[str] = []
+        self.lookup: Dict[str, int] = {}
+
+    def intern(self, s: str) -> int:
+        idx = self.lookup.get(s)
+        if idx is None:
+            idx = len(self.strings)
+            self.strings.append(s)
+            self.lookup[s] = idx
+        return idx
+
+    def encode(self) -> Tuple[bytes, bytes]:
+        offsets = [0]
+        data = bytearray()
+        for s in self.strings:
+            data += s.encode("utf-8")
+            offsets.append(len(data))
+        return (struct.pack(f"<{len(offsets)}I", *offsets), bytes(data))
+
+
+def encode_circuit(circuit) -> bytes:
+    from pycircuit.circuit_builder.circuit import CircuitData
+
+    c: CircuitData = circuit
+    c.validate()
+
+    strings = _StringTable()
+    words: List[int] = []
+    s = strings.intern
+
+    tables = {
+        "externals": {
+            name: external.to_dict() for (name, external) in c.external_inputs.items()
+        },
+        "call_groups": {
+            name: group.to_dict() for (name, group) in c.call_groups.items()
+        },
+        "call_structs": {
+            name: call_struct.to_dict()
+            for (name, call_struct) in c.call_structs.items()
+        },
+    }
+    words.append(s(json.dumps(tables)))
+
+    # Several names can share equal definitions, so prefer the exact object
+    def_ids: Dict[int, int] = {}
+    def_indices: Dict[Definition, int] = {}
+    words.append(len(c.definitions))
+    for idx, (defin_name, defin) in enumerate(c.definitions.items()):
+        def_ids[id(defin)] = idx
+        def_indices.setdefault(defin, idx)
+        words.append(s(defin_name))
+        words.append(s(defin.to_json()))
+
+    words.append(len(c.components))
+    for component in c.components.values():
+        words.append(s(component.name))
+        def_idx = def_ids.get(id(component.definition))
+        if def_idx is None:
+            def_idx = def_indices[component.definition]
+        words.append(def_idx)
+
+        words.append(len(component.inputs))
+        for input_name, comp_input in component.inputs.items():
+            words.append(s(input_name))
+            match comp_input:
+                case SingleComponentInput(input=output):
+                    words.extend(
+                        [SINGLE_INPUT, s(output.parent), s(output.output_name)]
+                    )
+                case ArrayComponentInput(inputs=batches):
+                    words.extend([ARRAY_INPUT, len(batches)])
+                    for batch in batches:
+                        words.append(len(batch.inputs))
+                        for field, output in batch.inputs.items():
+                            words.extend(
+                                [s(field), s(output.parent), s(output.output_name)]
+                            )
+
+        words.append(len(component.output_options))
+        for output_name, options in component.output_options.items():
+            flags = (FORCE_STORED if options.force_stored else 0) | (
+                BLOCK_PROPAGATION if options.block_propagation else 0
+            )
+            words.extend([s(output_name), flags])
+
+        words.append(len(component.class_generics))
+        for generic, value in component.class_generics.items():
+            words.extend([s(generic), s(value)])
+
+        if component.params is None:
+            words.append(NO_STRING)
+        else:
+            words.append(s(json.dumps(dict(component.params))))
+
+    string_offsets, string_data = strings.encode()
+    word_data = struct.pack(f"<{len(words)}I", *words)
+
+    offset = _HEADER.size
+    sections = []
+    for section in [string_offsets, string_data, word_data]:
+        # Keep every section 4-byte aligned so it can be viewed as u32 in place
+        sections.append(section + b"\x00" * (-len(section) % 4))
+
+    header_fields = []
+    for raw, padded in zip([string_offsets, string_data, word_data], sections):
+        header_fields.extend([offset, len(raw)])
+        offset += len(padded)
+
+    return _HEADER.pack(MAGIC, VERSION, *header_fields) + b"".join(sections)
+
+
+class _StringReader:
+    def __init__(self, offsets: memoryview, data: memoryview):
+        self._offsets = offsets
+        self._data = data
+        self._decoded: List[Optional[str]] = [None] * (len(offsets) - 1)
+
+    def __getitem__(self, idx: int) -> str:
+        decoded = self._decoded[idx]
+        if decoded is None:
+            decoded = str(
+                self._data[self._offsets[idx] : self._offsets[idx + 1]], "utf-8"
+            )
+            self._decoded[idx] = decoded
+        return decoded
+
+
+def decode_circuit(data: Any, validate: bool = True):
+    """Decodes a circuit from anything supporting the buffer protocol"""
+    with memoryview(data) as view:
+        return _decode_circuit_from(view, validate)
+
+
+def _decode_circuit_from(view: memoryview, validate: bool):
+    magic, version, *sections = _HEADER.unpack_from(view)
+
+    if magic != MAGIC:
+        raise ValueError("Data is not a binary circuit")
+    if version != VERSION:
+        raise ValueError(f"Binary circuit has version {version}, expected {VERSION}")
+
+    off_start, off_len, str_start, str_len, word_start, word_len = sections
+
+    with (
+        view[off_start : off_start + off_len].cast("I") as offsets,
+        view[str_start : str_start + str_len] as string_data,
+        view[word_start : word_start + word_len].cast("I") as words,
+    ):
+        # Views into the buffer are released on exit, so an mmap can be closed
+        return _decode_sections(_StringReader(offsets, string_data), words, validate)
+
+
+def _decode_sections(strings: _StringReader, words: memoryview, validate: bool):
+    from pycircuit.circuit_builder.circuit import CallGroup, CallStruct, CircuitData
+
+    pos = 0
+
+    def take() -> int:
+        nonlocal pos
+        word = words[pos]
+        pos += 1
+        return word
+
+    outputs: Dict[tuple, ComponentOutput] = {}
+
+    def output_of(parent: int, output_name: int) -> ComponentOutput:
+        key = (parent, output_name)
+        output = outputs.get(key)
+        if output is None:
+            output = ComponentOutput(
+                parent=strings[parent], output_name=strings[output_name]
+            )
+            outputs[key] = output
+        return output
+
+    tables = json.loads(strings[take()])
+
+    definitions: Dict[str, Definition] = {}
+    def_list: List[Definition] = []
+    for _ in range(take()):
+        defin_name = strings[take()]
+        defin = Definition.from_dict(json.loads(strings[take()]))
+        defin.validate()
+        definitions[defin_name] = defin
+        def_list.append(defin)
+
+    components: Dict[str, Component] = OrderedDict()
+    for _ in range(take()):
+        name = strings[take()]
+        definition = def_list[take()]
+
+        inputs: Dict[str, ComponentInput] = {}
+        for _ in range(take()):
+            input_name = strings[take()]
+            kind = take()
+            if kind == SINGLE_INPUT:
+                inputs[input_name] = SingleComponentInput(
+                    input=output_of(take(), take()), input_name=input_name
+                )
+            elif kind == ARRAY_INPUT:
+                batches: FrozenList = FrozenList()
+                for _ in range(take()):
+                    batch = {}
+                    for _ in range(take()):
+                        field = strings[take()]
+                        batch[field] = output_of(take(), take())
+                    batches.append(InputBatch(frozendict(batch)))
+                batches.freeze()
+                inputs[input_name] = ArrayComponentInput(
+                    inputs=batches, input_name=input_name
+                )
+            else:
+                raise ValueError(f"Component {name} has unknown input kind {kind}")
+
+        output_options = {}
+        for _ in range(take()):
+            output_name = strings[take()]
+            flags = take()
+            output_options[output_name] = OutputOptions(
+                force_stored=bool(flags & FORCE_STORED),
+                block_propagation=bool(flags & BLOCK_PROPAGATION),
+            )
+
+        class_generics = {}
+        for _ in range(take()):
+            generic = strings[take()]
+            class_generics[generic] = strings[take()]
+
+        params_idx = take()
+        params = (
+            None
+            if params_idx == NO_STRING
+            else frozendict(json.loads(strings[params_idx]))
+        )
+
+        components[name] = Component(
+            inputs=inputs,
+            output_options=output_options,
+            definition=definition,
+            name=name,
+            class_generics=class_generics,
+            params=params,
+        )
+
+    circuit = CircuitData(
+        external_inputs={
+            name: ExternalInput.from_dict(external)
+            for (name, external) in tables["externals"].items()
+        },
+        components=components,
+        definitions=definitions,
+        call_groups={
+            name: CallGroup.from_dict(group)
+            for (name, group) in tables["call_groups"].items()
+        },
+        call_structs={
+            name: CallStruct.from_dict(call_struct)
+            for (name, call_struct) in tables["call_structs"].items()
+        },
+    )
+
+    if validate:
+        circuit.validate()
+
+    return circuit
+
+
+def load_circuit_file(path: str, validate: bool = True):
+    """Loads a circuit from either a binary or json file
+
+    Binary files are memory-mapped rather than read
+    """
+    from pycircuit.circuit_builder.circuit import CircuitData
+
+    with open(path, "rb") as circuit_file:
+        if not is_binary_circuit(circuit_file.read(len(MAGIC))):
+            circuit_file.seek(0)
+            return CircuitData.from_dict(json.load(circuit_file))
+
+        with mmap.mmap(circuit_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return decode_circuit(mapped, validate=validate)
+
+
+@dataclass
+class ConvertOptions:
+    circuit_json: str
+    out: str
+
+
+def main():
+    args = ArgumentParser(ConvertOptions).parse_args(sys.argv[1:])
+
+    circuit = load_circuit_file(args.circuit_json)
+
+    with open(args.out, "wb") as out_file:
+        out_file.write(encode_circuit(circuit))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,18 @@
 from collections import OrderedDict
-from dataclasses import dataclass
-from typing import Any, Dict, List, Mapping, Optional, Set, Union
+import hashlib
+from dataclasses import dataclass, field
+from typing import (
+    AbstractSet,
+    Any,
+    Dict,
+    FrozenSet,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from dataclasses_json import DataClassJsonMixin
 from frozendict import frozendict
@@ -22,6 +34,7 @@ from pycircuit.circuit_builder.component import (
 from pycircuit.circuit_builder.component import ComponentOutput
 from pycircuit.circuit_builder.component import ComponentIndex
 
+from .binary_format import decode_circuit, encode_circuit
 from .signals.constant import (
     generate_constant_definition,
     generate_parameter_definition,
@@ -87,6 +100,33 @@ class CallGroup(DataClassJsonMixin):
         return set(self.external_field_mapping.values())
 
 
+def _decode_component_input(the_input: Any) -> ComponentInput:
+    # dataclasses_json can't decode the ComponentInput union and leaves it as a dict
+    match the_input:
+        case SingleComponentInput() | ArrayComponentInput():
+            return the_input
+        case {"input": output, "input_name": input_name}:
+            return SingleComponentInput(
+                input=ComponentOutput.from_dict(output), input_name=input_name
+            )
+        case {"inputs": batches, "input_name": input_name}:
+            frozen_inputs = FrozenList(
+                InputBatch(
+                    frozendict(
+                        {
+                            batch_key: ComponentOutput.from_dict(batch_val)
+                            for (batch_key, batch_val) in batch["inputs"].items()
+                        }
+                    )
+                )
+                for batch in batches
+            )
+            frozen_inputs.freeze()
+            return ArrayComponentInput(inputs=frozen_inputs, input_name=input_name)
+
+    raise ValueError(f"Cannot decode component input {the_input}")
+
+
 @dataclass
 class _PartialJsonCircuit(DataClassJsonMixin):
     externals: Dict[str, ExternalInput]
@@ -108,6 +148,184 @@ class OutputArray:
 
 InputForComponent = Union[HasOutput, OutputSingle, OutputArray]
 
+
+@dataclass(eq=True, frozen=True)
+class ConsumerEdge:
+    """A single link from an output into the input of a component
+
+    Attributes:
+        component: Name of the consuming component
+
+        input_name: Input of the consuming component that references the output
+
+        triggering: Whether writing the output can trigger the consumer
+    """
+
+    component: str
+    input_name: str
+    triggering: bool
+
+
+class CircuitIndex:
+    """Reverse-dependency lookups for a circuit
+
+    Maps every output to the components consuming it, and remembers
+    the insertion order of components so traversals can break ties deterministically
+    """
+
+    def __init__(self):
+        # parent -> output name -> consumers, so all consumers of a component
+        # can be found without knowing which of its outputs are used
+        self._consumers: Dict[str, Dict[str, List[ConsumerEdge]]] = {}
+        self._order: Dict[str, int] = {}
+        self._running_order = 0
+
+    @staticmethod
+    def from_components(components: Dict[str, Component]) -> "CircuitIndex":
+        index = CircuitIndex()
+        for component in components.values():
+            index.add_component(component)
+        return index
+
+    def add_component(self, component: Component):
+        triggering = component.definition.triggering_inputs()
+        for (input_name, input) in component.inputs.items():
+            edge = ConsumerEdge(
+                component=component.name,
+                input_name=input_name,
+                triggering=input_name in triggering,
+            )
+            for output in input.outputs():
+                self._consumers.setdefault(output.parent, {}).setdefault(
+                    output.output_name, []
+                ).append(edge)
+
+        self._order[component.name] = self._running_order
+        self._running_order += 1
+
+    def remove_component(self, component: Component):
+        """Drops the edges out of the component, which must be indexed under its current name"""
+        for input in component.inputs.values():
+            for output in input.outputs():
+                by_output = self._consumers.get(output.parent)
+                if by_output is None or output.output_name not in by_output:
+                    continue
+                remaining = [
+                    edge
+                    for edge in by_output[output.output_name]
+                    if edge.component != component.name
+                ]
+                if remaining:
+                    by_output[output.output_name] = remaining
+                else:
+                    del by_output[output.output_name]
+                    if not by_output:
+                        del self._consumers[output.parent]
+
+        del self._order[component.name]
+
+    def consumers_of(self, output: ComponentOutput) -> List[ConsumerEdge]:
+        return self._consumers.get(output.parent, {}).get(output.output_name, [])
+
+    def consumers_of_component(self, component_name: str) -> List[ConsumerEdge]:
+        """Returns the consumers of every output of the component"""
+        return [
+            edge
+            for edges in self._consumers.get(component_name, {}).values()
+            for edge in edges
+        ]
+
+    def consumed_outputs_of(self, component_name: str) -> List[ComponentOutput]:
+        return [
+            ComponentOutput(parent=component_name, output_name=output_name)
+            for output_name in self._consumers.get(component_name, {})
+        ]
+
+    def has_consumers(self, component_name: str) -> bool:
+        return component_name in self._consumers
+
+    def order_of(self, component_name: str) -> int:
+        return self._order[component_name]
+
+
+class ValidationCache:
+    """Facts remembered between validation passes over a circuit
+
+    Definitions are validated once no matter how many components share them,
+    the must-trigger outputs are computed once per pass rather than per component,
+    and components which are unchanged since they were last validated are skipped.
+    """
+
+    def __init__(self):
+        self._must_trigger: Optional[Set[ComponentOutput]] = None
+        # Keyed on id, so the definition is held to keep the id from being reused
+        self._definitions: Dict[int, Tuple[Definition, FrozenSet[str]]] = {}
+        self._components: Dict[str, Tuple[Component, Tuple]] = {}
+
+    def must_trigger(self, circuit: "CircuitData") -> Set[ComponentOutput]:
+        if self._must_trigger is None:
+            self._must_trigger = circuit._must_trigger_outputs()
+        return self._must_trigger
+
+    def refresh_must_trigger(self, circuit: "CircuitData"):
+        """Recomputes the must-trigger outputs, forgetting every component if they changed"""
+        must_trigger = circuit._must_trigger_outputs()
+        if must_trigger != self._must_trigger:
+            self._must_trigger = must_trigger
+            self._components.clear()
+
+    def observed_inputs(self, definition: Definition) -> FrozenSet[str]:
+        """Validates the definition if it's new, and returns the inputs any callset observes"""
+        cached = self._definitions.get(id(definition))
+        if cached is not None and cached[0] is definition:
+            return cached[1]
+
+        definition.validate()
+
+        observed = frozenset(
+            observed
+            for callset in definition.all_callsets()
+            for observed in callset.observes
+        )
+        self._definitions[id(definition)] = (definition, observed)
+        return observed
+
+    @staticmethod
+    def _signature(component: Component, circuit: "CircuitData") -> Tuple:
+        # Validity of a component depends on its own fields,
+        # and on the definitions of its parents (for always valid inputs)
+        parent_definitions = tuple(
+            id(circuit.components[parent].definition)
+            if parent in circuit.components
+            else None
+            for comp_input in component.inputs.values()
+            for parent in comp_input.parents()
+        )
+        return (
+            id(component.definition),
+            tuple(component.inputs.items()),
+            tuple(
+                (name, options.force_stored, options.block_propagation)
+                for (name, options) in component.output_options.items()
+            ),
+            tuple(component.class_generics.items()),
+            parent_definitions,
+        )
+
+    def validate_component(self, component: Component, circuit: "CircuitData"):
+        signature = self._signature(component, circuit)
+        cached = self._components.get(component.name)
+        if cached is not None and cached[0] is component and cached[1] == signature:
+            return
+
+        component.validate(circuit)
+        self._components[component.name] = (component, signature)
+
+    def retain(self, names: AbstractSet[str]):
+        for name in self._components.keys() - names:
+            del self._components[name]
+
+
 # TODO going to be A TON of wasted space here
 @dataclass
 class CircuitData:
@@ -117,6 +335,108 @@ class CircuitData:
     call_groups: Dict[str, CallGroup]
     call_structs: Dict[str, CallStruct]
 
+    _index: Optional[CircuitIndex] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _validation: Optional[ValidationCache] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    def index(self) -> CircuitIndex:
+        """Returns the reverse-dependency index, building it if needed
+
+        CircuitBuilder keeps the index up to date itself, anything else
+        that mutates the components of the circuit must call invalidate_index
+        """
+        if self._index is None:
+            self._index = CircuitIndex.from_components(self.components)
+        return self._index
+
+    def invalidate_index(self):
+        self._index = None
+
+    def consumers_of(self, output: HasOutput) -> List[ConsumerEdge]:
+        """Returns the inputs which reference the given output"""
+        return self.index().consumers_of(output.output())
+
+    def consumers_of_component(self, component_name: str) -> List[ConsumerEdge]:
+        """Returns the inputs which reference any output of the component"""
+        return self.index().consumers_of_component(component_name)
+
+    def validation_cache(self) -> ValidationCache:
+        """Returns the facts remembered between validation passes
+
+        Anything that changes which externals must trigger must call invalidate_validation
+        """
+        if self._validation is None:
+            self._validation = ValidationCache()
+        return self._validation
+
+    def invalidate_validation(self):
+        self._validation = None
+
+    def content_hash(self) -> str:
+        """Returns a digest of everything in the circuit that can affect code generation
+
+        This relies on the reprs of sets and is only stable within a single process.
+        It's meant for caching derived data, not for persisting
+        """
+        digest = hashlib.sha256()
+
+        definition_keys = {
+            id(defin): (name, hash(defin))
+            for (name, defin) in self.definitions.items()
+        }
+
+        for external in self.external_inputs.values():
+            digest.update(repr(external).encode())
+
+        for component in self.components.values():
+            # Definitions are shared by many components, and are immutable,
+            # so summarize them by name where we can
+            defin_key: Any = definition_keys.get(id(component.definition))
+            if defin_key is None:
+                defin_key = repr(component.definition)
+
+            digest.update(
+                repr(
+                    (
+                        component.name,
+                        defin_key,
+                        component.inputs,
+                        component.output_options,
+                        component.class_generics,
+                        component.params,
+                    )
+                ).encode()
+            )
+
+        for (name, group) in self.call_groups.items():
+            digest.update(repr((name, group)).encode())
+
+        for (name, struct) in self.call_structs.items():
+            digest.update(repr((name, struct)).encode())
+
+        return digest.hexdigest()
+
+    def _check_removable(self, names: AbstractSet[str]):
+        for name in names:
+            if name not in self.components:
+                raise ValueError(f"Trying to remove nonexistent component {name}")
+            for edge in self.consumers_of_component(name):
+                if edge.component not in names:
+                    raise ValueError(
+                        f"Trying to remove component {name} "
+                        f"but {edge.component} still depends on it"
+                    )
+
+    def remove_components(self, names: AbstractSet[str]):
+        """Removes the components, which may only be consumed by each other"""
+        self._check_removable(names)
+        for name in names:
+            del self.components[name]
+        self.invalidate_index()
+
     def _must_trigger_outputs(self) -> Set[ComponentOutput]:
         return {
             ext.output() for ext in self.external_inputs.values() if ext.must_trigger
@@ -135,7 +455,10 @@ class CircuitData:
             definitions=partial.definitions,
             components={
                 comp_name: Component(
-                    inputs=comp.inputs,
+                    inputs={
+                        input_name: _decode_component_input(comp_input)
+                        for (input_name, comp_input) in comp.inputs.items()
+                    },
                     output_options=comp.output_options,
                     name=comp.name,
                     definition=partial.definitions[comp.definition],
@@ -152,6 +475,14 @@ class CircuitData:
 
         return data
 
+    @staticmethod
+    def from_binary(data: Any, validate: bool = True) -> "CircuitData":
+        """Decodes a circuit from the binary format, see binary_format.py"""
+        return decode_circuit(data, validate=validate)
+
+    def to_binary(self) -> bytes:
+        return encode_circuit(self)
+
     def parameters(self) -> Dict[str, dict[str, Any]]:
         return {
             comp.name: {**comp.params}
@@ -212,14 +543,28 @@ class CircuitData:
                 )
 
     def validate(self):
+        """Validates every component and call group
+
+        Components which are unchanged since the last pass are not revalidated
+        """
+        cache = self.validation_cache()
+        cache.refresh_must_trigger(self)
+        cache.retain(self.components.keys())
+
         for component in self.components.values():
-            component.validate(self)
+            cache.validate_component(component, self)
 
         for name, group in self.call_groups.items():
             self.validate_call_group(name, group)
 
 
 class CircuitBuilder(CircuitData):
+    """Incrementally builds a circuit
+
+    The reverse-dependency index is kept up to date as components are inserted
+    and renamed, so consumer queries cost O(degree) while building
+    """
+
     def __init__(self, definitions: Dict[str, Definition]):
         super().__init__(
             external_inputs={},
@@ -267,6 +612,7 @@ class CircuitBuilder(CircuitData):
             return existing
 
         self.registry[index] = component
+        self.index().add_component(component)
         self.components[component.name] = component
 
         return component
@@ -290,6 +636,7 @@ class CircuitBuilder(CircuitData):
         )
         self.running_external += 1
         self.external_inputs[name] = ext
+        self.invalidate_validation()
         return ext
 
     def add_call_struct(self, name: str, struct: CallStruct):
@@ -471,6 +818,25 @@ class CircuitBuilder(CircuitData):
 
         return self._insert_component(comp, force=False)
 
+    def remove_components(self, names: AbstractSet[str]):
+        self._check_removable(names)
+
+        index = self.index()
+        for name in names:
+            index.remove_component(self.components.pop(name))
+
+        self.registry = {
+            comp_index: component
+            for (comp_index, component) in self.registry.items()
+            if component.name not in names
+        }
+
+    def rebuild_registry(self):
+        """Re-keys the registry after the inputs of components were rewritten in place"""
+        self.registry = {}
+        for component in self.components.values():
+            self.registry.setdefault(component.index(), component)
+
     # TODO introduce weak renaming - only rename if someone hasn't already
     # Much more useful when we start deduplicating
     def rename_component(self, component: Component, new_name: str):
@@ -482,21 +848,19 @@ class CircuitBuilder(CircuitData):
                 "that is not part of the circuit"
             )
 
-        # TODO add reverse mapping table to speed up this step
-        for other_component in self.components.values():
-            if other_component is component:
-                continue
-            for input in other_component.inputs.values():
-                for parent in input.parents():
-                    if parent == component.name:
-                        raise ValueError(
-                            f"Trying to rename component {component.name} to {new_name} "
-                            f"but {other_component.name} already depends on it"
-                        )
+        index = self.index()
+        for edge in index.consumers_of_component(component.name):
+            if edge.component != component.name:
+                raise ValueError(
+                    f"Trying to rename component {component.name} to {new_name} "
+                    f"but {edge.component} already depends on it"
+                )
 
+        index.remove_component(component)
         del self.components[component.name]
         component.name = new_name
         self.components[new_name] = component
+        index.add_component(component)
 
     def lookup(self, name: str) -> Component:
         return self.components[name]
@@ -226,9 +226,9 @@ class Component(HasOutput):
 
         circuit: CircuitData = _circuit
 
-        must_trigger = circuit._must_trigger_outputs()
-
-        self.definition.validate()
+        cache = circuit.validation_cache()
+        must_trigger = cache.must_trigger(circuit)
+        observed_inputs = cache.observed_inputs(self.definition)
 
         for (generic_name, generic_value) in self.class_generics.items():
             if generic_name not in self.definition.class_generics:
@@ -277,22 +277,16 @@ class Component(HasOutput):
                 circuit,
             )
 
-            all_callsets = list(self.definition.callsets) + [
-                self.definition.timer_callset,
-                self.definition.generic_callset,
-            ]
-
-            for callset in all_callsets:
-                if callset is None:
-                    continue
-                # It doesn't evenmake sense to observe an array input - need to banish
-                for observed in callset.observes:
-                    for output in self.inputs[observed].outputs():
-                        if output in must_trigger:
-                            raise ValueError(
-                                f"Component {self.name} has input {observed} which links to an output "
-                                "that requires triggering, and is not triggered"
-                            )
+        # It doesn't evenmake sense to observe an array input - need to banish
+        for observed in observed_inputs:
+            if not self.inputs:
+                break
+            for output in self.inputs[observed].outputs():
+                if output in must_trigger:
+                    raise ValueError(
+                        f"Component {self.name} has input {observed} which links to an output "
+                        "that requires triggering, and is not triggered"
+                    )
 
         for (input_name, input) in self.definition.inputs.items():
             if input_name not in self.inputs and not input.optional:
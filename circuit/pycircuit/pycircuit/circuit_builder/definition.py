@@ -89,7 +89,9 @@ def encode_input(input: InputType) -> Dict[str, Any]:
             input_type = "single"
         case ArrayInput(fields=fields):
             input_type = "array"
-            meta_dict["fields"] = fields
+            # Empty fields decode from a missing key, see decode_input
+            if fields:
+                meta_dict["fields"] = sorted(fields)
         case _:
             raise ValueError("Wrong input type passed")
 
@@ -0,0 +1,103 @@
+"""Finds and removes components whose results can never be observed
+
+A component is live if anything outside of the circuit can see what it does:
+    * it has a force-stored output (samplers, training edges, ...)
+    * it has a timer callback
+    * it has no outputs at all, so it only exists for its side effects
+    * it was explicitly asked to be kept
+or if it feeds into a live component. Everything else is dead, and would only
+take up space in the generated structs and instructions in the trigger bodies.
+"""
+
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Set
+
+from pycircuit.circuit_builder.circuit import CircuitData
+from pycircuit.circuit_builder.component import Component, HasOutput
+
+
+@dataclass
+class PruneReport:
+    """What a pruning pass removed
+
+    Attributes:
+        removed: Names of the removed components, in circuit order,
+            mapped to the class name of their definition
+
+        remaining: Number of components left in the circuit
+    """
+
+    removed: Dict[str, str]
+    remaining: int
+
+    def by_class(self) -> Dict[str, int]:
+        return dict(Counter(self.removed.values()).most_common())
+
+    def summary(self) -> str:
+        lines = [
+            f"Removed {len(self.removed)} dead components, "
+            f"{self.remaining} components remain"
+        ]
+        for (class_name, count) in self.by_class().items():
+            lines.append(f"    {class_name}: {count}")
+        return "\n".join(lines)
+
+
+def is_observable(component: Component) -> bool:
+    if component.definition.timer_callset is not None:
+        return True
+
+    if not component.definition.output_specs:
+        return True
+
+    return any(options.force_stored for options in component.output_options.values())
+
+
+def find_live_components(
+    circuit: CircuitData, keep: Iterable[HasOutput] = ()
+) -> Set[str]:
+    worklist = [
+        name
+        for (name, component) in circuit.components.items()
+        if is_observable(component)
+    ]
+    worklist += [
+        output.parent
+        for output in (kept.output() for kept in keep)
+        if output.parent in circuit.components
+    ]
+
+    live: Set[str] = set()
+    while worklist:
+        name = worklist.pop()
+        if name in live:
+            continue
+        live.add(name)
+
+        for input in circuit.components[name].inputs.values():
+            for parent in input.parents():
+                if parent in circuit.components and parent not in live:
+                    worklist.append(parent)
+
+    return live
+
+
+def find_dead_components(
+    circuit: CircuitData, keep: Iterable[HasOutput] = ()
+) -> List[str]:
+    """Returns the dead components, in circuit order"""
+    live = find_live_components(circuit, keep)
+    return [name for name in circuit.components if name not in live]
+
+
+def prune_dead_components(
+    circuit: CircuitData, keep: Iterable[HasOutput] = ()
+) -> PruneReport:
+    """Removes every dead component from the circuit, and reports what was removed"""
+    removed = {
+        name: circuit.components[name].definition.class_name
+        for name in find_dead_components(circuit, keep)
+    }
+    circuit.remove_components(removed.keys())
+    return PruneReport(removed=removed, remaining=len(circuit.components))
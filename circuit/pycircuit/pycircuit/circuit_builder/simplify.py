@@ -0,0 +1,446 @@
+"""Algebraic simplification of the arithmetic in a circuit
+
+Helpers build arithmetic one operator at a time, which leaves behind expressions
+like `make_double(1.0) * x`, `x + make_double(0.0)` or arithmetic purely over constants.
+The builder only deduplicates components which are identical when inserted,
+so rewriting inputs (or commuted operands) can still leave duplicates behind.
+
+simplify_circuit walks the circuit in topological order and
+    * folds arithmetic over double constants into a single constant
+    * replaces identities (x + 0, x - 0, x * 1, x / 1, -(-x)) with x
+    * merges components which compute the same thing, treating add and mul as commutative
+
+Components which are initialized (like parameters) are looked up by name and never merged.
+
+Components with force-stored or propagation-blocking outputs, timer callbacks, or which
+are explicitly kept, are never removed, since something outside of the circuit refers to them.
+
+Identities are only removed when x is known to be a double, since otherwise
+the operator may change the type of the output (i.e. int * 1.0).
+Folding is done with python floats, which match c++ doubles for the folded operators.
+
+Folding changes validity. Arithmetic purely over constants is never triggered,
+so its output is never valid and anything consuming it never fires. The folded
+constant is valid from init, so i.e. `x + (2.0 * 0.5 - 0.25)` fires whenever x does.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from frozendict import frozendict
+from frozenlist import FrozenList
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.component import (
+    ArrayComponentInput,
+    Component,
+    ComponentInput,
+    ComponentOutput,
+    HasOutput,
+    InputBatch,
+    OutputOptions,
+    SingleComponentInput,
+)
+from pycircuit.circuit_builder.liveness import is_observable
+
+ARITHMETIC_HEADER = "signals/basic_arithmetic.hh"
+
+DOUBLE_CLASSES = {
+    "CtorConstant<double>",
+    "TriggerableConstant<double>",
+    "DoubleParameter<true>",
+    "DoubleParameter<false>",
+}
+
+# Operators on doubles which always produce a double
+DOUBLE_PRESERVING = {"add", "sub", "mul", "div", "min", "max", "neg", "abs", "sqrt"}
+
+COMMUTATIVE = {"add", "mul"}
+
+# Mirrors basic_arithmetic.hh, std::min/max return a unless b is strictly better
+BINARY_FOLDS: Dict[str, Callable[[float, float], float]] = {
+    "add": lambda a, b: a + b,
+    "sub": lambda a, b: a - b,
+    "mul": lambda a, b: a * b,
+    "div": lambda a, b: a / b,
+    "min": lambda a, b: b if b < a else a,
+    "max": lambda a, b: b if a < b else a,
+}
+
+# exp and log are approximated in c++, so can't be folded exactly
+UNARY_FOLDS: Dict[str, Callable[[float], float]] = {
+    "neg": lambda a: -a,
+    "abs": abs,
+    "sqrt": math.sqrt,
+}
+
+# (operator, input which is the constant, constant value), the other input is the result
+IDENTITIES = {
+    ("add", "a", 0.0),
+    ("add", "b", 0.0),
+    ("sub", "b", 0.0),
+    ("mul", "a", 1.0),
+    ("mul", "b", 1.0),
+    ("div", "b", 1.0),
+}
+
+
+@dataclass
+class SimplifyReport:
+    """What a simplification pass removed
+
+    Each attribute maps a removed component to the component replacing it
+    """
+
+    folded: Dict[str, str] = field(default_factory=dict)
+    identities: Dict[str, str] = field(default_factory=dict)
+    merged: Dict[str, str] = field(default_factory=dict)
+
+    def removed(self) -> int:
+        return len(self.folded) + len(self.identities) + len(self.merged)
+
+    def summary(self) -> str:
+        return (
+            f"Simplified away {self.removed()} components: "
+            f"{len(self.folded)} folded constants, "
+            f"{len(self.identities)} identities, "
+            f"{len(self.merged)} common subexpressions"
+        )
+
+
+def _operator_of(component: Component) -> Optional[str]:
+    if component.definition.header != ARITHMETIC_HEADER:
+        return None
+    return component.definition.differentiable_operator_name
+
+
+def _topological_order(circuit: CircuitBuilder) -> List[Component]:
+    in_degree: Dict[str, int] = {}
+    for (name, component) in circuit.components.items():
+        in_degree[name] = sum(
+            1
+            for comp_input in component.inputs.values()
+            for parent in comp_input.parents()
+            if parent in circuit.components
+        )
+
+    ordered = [
+        component
+        for (name, component) in circuit.components.items()
+        if in_degree[name] == 0
+    ]
+    idx = 0
+    while idx < len(ordered):
+        for edge in circuit.consumers_of_component(ordered[idx].name):
+            in_degree[edge.component] -= 1
+            if in_degree[edge.component] == 0:
+                ordered.append(circuit.components[edge.component])
+        idx += 1
+
+    if len(ordered) != len(circuit.components):
+        raise ValueError("Cannot simplify a circuit containing a cycle")
+
+    return ordered
+
+
+def _restore_topological_order(circuit: CircuitBuilder):
+    """Moves components which were appended by the pass in front of their first consumer
+
+    Code generation declares components in circuit order,
+    so everything else keeps its position
+    """
+    ordered: Dict[str, Component] = {}
+    for root in circuit.components.keys():
+        stack = [(root, False)]
+        while stack:
+            (name, expanded) = stack.pop()
+            if name in ordered:
+                continue
+            component = circuit.components[name]
+            if expanded:
+                ordered[name] = component
+                continue
+            stack.append((name, True))
+            for comp_input in reversed(list(component.inputs.values())):
+                for parent in sorted(comp_input.parents(), reverse=True):
+                    if parent in circuit.components and parent not in ordered:
+                        stack.append((parent, False))
+
+    if list(ordered.keys()) != list(circuit.components.keys()):
+        circuit.components.clear()
+        circuit.components.update(ordered)
+        circuit.invalidate_index()
+
+
+class _Simplifier:
+    def __init__(self, circuit: CircuitBuilder, keep: Iterable[HasOutput]):
+        self.circuit = circuit
+        self.kept = {kept.output().parent for kept in keep}
+        self.replacements: Dict[ComponentOutput, ComponentOutput] = {}
+        self.candidates: Dict[str, Tuple[Dict[str, str], str]] = {}
+        self.is_double: Dict[str, bool] = {}
+        self.seen: Dict[Tuple, Component] = {}
+        self.report = SimplifyReport()
+        # Set when an already visited component was merged into a later one,
+        # so its consumers have to be substituted again
+        self.resubstitute = False
+
+    def _protected(self, component: Component) -> bool:
+        return (
+            component.name in self.kept
+            or is_observable(component)
+            or any(
+                options.block_propagation
+                for options in component.output_options.values()
+            )
+        )
+
+    def _component_of(self, output: ComponentOutput) -> Optional[Component]:
+        return self.circuit.components.get(output.parent)
+
+    def _constant_value(self, output: ComponentOutput) -> Optional[float]:
+        component = self._component_of(output)
+        if (
+            component is None
+            or component.definition.class_name != "CtorConstant<double>"
+        ):
+            return None
+        try:
+            return float(component.definition.metadata["constant_value"])
+        except ValueError:
+            return None
+
+    def _known_double(self, output: ComponentOutput) -> bool:
+        component = self._component_of(output)
+        if component is None:
+            return False
+
+        # Components are visited in topological order, so inputs are already known
+        known = self.is_double.get(component.name)
+        if known is None:
+            known = component.definition.class_name in DOUBLE_CLASSES
+            self.is_double[component.name] = known
+        return known
+
+    def _substitute(self, comp_input: ComponentInput) -> ComponentInput:
+        match comp_input:
+            case SingleComponentInput(input=output) if output in self.replacements:
+                return SingleComponentInput(
+                    input=self.replacements[output], input_name=comp_input.input_name
+                )
+            case ArrayComponentInput(inputs=batches):
+                if not any(out in self.replacements for out in comp_input.outputs()):
+                    return comp_input
+                new_batches = FrozenList(
+                    InputBatch(
+                        frozendict(
+                            {
+                                batch_key: self.replacements.get(output, output)
+                                for (batch_key, output) in batch.inputs.items()
+                            }
+                        )
+                    )
+                    for batch in batches
+                )
+                new_batches.freeze()
+                substituted = ArrayComponentInput(
+                    inputs=new_batches, input_name=comp_input.input_name
+                )
+                # Outputs within an input must be distinct, so leave this one be
+                # and keep whatever it refers to alive
+                outputs = substituted.outputs()
+                if len(set(outputs)) != len(outputs):
+                    return comp_input
+                return substituted
+        return comp_input
+
+    def _replace(self, component: Component, by: ComponentOutput, kind: Dict[str, str]):
+        self.replacements[component.output()] = by
+        self.candidates[component.name] = (kind, by.parent)
+
+    def _try_fold(self, component: Component, operator: str) -> bool:
+        values = {
+            input_name: self._constant_value(comp_input.outputs()[0])
+            for (input_name, comp_input) in component.inputs.items()
+        }
+        if any(value is None for value in values.values()):
+            return False
+
+        try:
+            match values:
+                case {"a": a, "b": b} if operator in BINARY_FOLDS:
+                    result = BINARY_FOLDS[operator](a, b)
+                case {"a": a} if operator in UNARY_FOLDS and len(values) == 1:
+                    result = UNARY_FOLDS[operator](a)
+                case _:
+                    return False
+        except (ValueError, ZeroDivisionError):
+            return False
+
+        if not math.isfinite(result):
+            return False
+
+        constant = self.circuit.make_constant("double", repr(result))
+        self.is_double[constant.name] = True
+        self._replace(component, constant.output(), self.report.folded)
+        return True
+
+    def _try_identity(self, component: Component, operator: str) -> bool:
+        if operator == "neg":
+            inner = self._component_of(component.inputs["a"].outputs()[0])
+            if inner is None or _operator_of(inner) != "neg":
+                return False
+            result = inner.inputs["a"].outputs()[0]
+            if not self._known_double(result):
+                return False
+            self._replace(component, result, self.report.identities)
+            return True
+
+        for (identity_op, constant_input, identity) in IDENTITIES:
+            if identity_op != operator:
+                continue
+            other_input = "b" if constant_input == "a" else "a"
+            constant = self._constant_value(
+                component.inputs[constant_input].outputs()[0]
+            )
+            result = component.inputs[other_input].outputs()[0]
+            if constant == identity and self._known_double(result):
+                self._replace(component, result, self.report.identities)
+                return True
+
+        return False
+
+    def _try_merge(self, component: Component, operator: Optional[str]) -> bool:
+        # Initialization looks components up by name (i.e. parameters),
+        # so identical looking ones can still differ
+        if component.definition.init_spec is not None:
+            return False
+
+        if operator in COMMUTATIVE:
+            inputs_key: object = frozenset(
+                output
+                for comp_input in component.inputs.values()
+                for output in comp_input.outputs()
+            )
+        else:
+            inputs_key = frozendict(component.inputs)
+
+        key = (
+            component.definition,
+            inputs_key,
+            frozendict(component.class_generics),
+            component.params,
+        )
+
+        existing = self.seen.get(key)
+        if existing is None:
+            self.seen[key] = component
+            return False
+
+        # Protected components are never removed, only merged into
+        if self._protected(component):
+            if self._protected(existing):
+                return False
+            self.seen[key] = component
+            self._merge(existing, component, retarget=True)
+            self.resubstitute = True
+        else:
+            self._merge(component, existing)
+        return True
+
+    def _merge(self, removed: Component, into: Component, retarget: bool = False):
+        for (output_name, options) in removed.output_options.items():
+            into.output_options[output_name] = into.output_options.get(
+                output_name, OutputOptions()
+            ).strongest_of(options)
+
+        merged_outputs = {
+            removed.output(output_name): into.output(output_name)
+            for output_name in removed.definition.outputs()
+        }
+        # Anything already merged into removed now goes to into. Only components
+        # which were seen before can have had anything merged into them
+        if retarget:
+            for (replaced, by) in self.replacements.items():
+                if by in merged_outputs:
+                    self.replacements[replaced] = merged_outputs[by]
+            for (name, (kind, by_name)) in self.candidates.items():
+                if by_name == removed.name:
+                    self.candidates[name] = (kind, into.name)
+
+        self.replacements.update(merged_outputs)
+        self.candidates[removed.name] = (self.report.merged, into.name)
+
+    def visit(self, component: Component):
+        component.inputs = {
+            input_name: self._substitute(comp_input)
+            for (input_name, comp_input) in component.inputs.items()
+        }
+
+        operator = _operator_of(component)
+
+        if operator in DOUBLE_PRESERVING:
+            self.is_double[component.name] = all(
+                self._known_double(output)
+                for comp_input in component.inputs.values()
+                for output in comp_input.outputs()
+            )
+
+        if self._protected(component):
+            self._try_merge(component, operator)
+            return
+
+        if operator is not None and (
+            self._try_fold(component, operator)
+            or self._try_identity(component, operator)
+        ):
+            return
+
+        self._try_merge(component, operator)
+
+    def removable(self) -> Set[str]:
+        # A candidate can only go if everything still consuming it goes too
+        removable = set(self.candidates.keys())
+        changed = True
+        while changed:
+            changed = False
+            for name in list(removable):
+                if any(
+                    edge.component not in removable
+                    for edge in self.circuit.consumers_of_component(name)
+                ):
+                    removable.remove(name)
+                    changed = True
+        return removable
+
+
+def simplify_circuit(
+    circuit: CircuitBuilder, keep: Iterable[HasOutput] = ()
+) -> SimplifyReport:
+    """Simplifies the arithmetic of the circuit in place, and reports what was removed"""
+    simplifier = _Simplifier(circuit, keep)
+
+    for component in _topological_order(circuit):
+        simplifier.visit(component)
+
+    if simplifier.resubstitute:
+        for component in circuit.components.values():
+            component.inputs = {
+                input_name: simplifier._substitute(comp_input)
+                for (input_name, comp_input) in component.inputs.items()
+            }
+
+    # Inputs were rewritten in place
+    circuit.invalidate_index()
+
+    removable = simplifier.removable()
+    for (name, (kind, replaced_by)) in simplifier.candidates.items():
+        if name in removable:
+            kind[name] = replaced_by
+
+    circuit.remove_components(removable)
+    circuit.rebuild_registry()
+    _restore_topological_order(circuit)
+
+    return simplifier.report
@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Sequence, Set
+from typing import List, Optional, Sequence, Set
 
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.generation_metadata import GenerationMetadata
@@ -21,13 +21,47 @@ BRACE_OPEN = RecordInfo(lines=["{"], description="brace open")
 
 BRACE_CLOSE = RecordInfo(lines=["}"], description="brace close")
 
+CYCLE_COUNTERS_VAR = "cycle_counters"
+CYCLE_START_VAR = "__cycles_start__"
+
+
+def format_records(records: Sequence[RecordInfo]) -> str:
+    all_lines = []
+
+    for line in records:
+
+        local_line = "\n".join(line.lines)
+
+        formatted_local = f"""\
+/*
+{line.description}
+*/
+
+{local_line}"""
+
+        all_lines.append(formatted_local)
+
+    return "\n\n".join(all_lines)
+
 
 class CallContext:
-    def __init__(self, metadata: GenerationMetadata):
+    def __init__(self, metadata: GenerationMetadata, hoist_invariants: bool = False):
         self._metadata = metadata
         self.lines: List[RecordInfo] = []
         self.generated_outputs: Set[ComponentOutput] = set()
 
+        # When set, output setup which is the same on every call (references
+        # into the struct and constant validity) goes in invariant_lines
+        # instead, so that batch calls run it once for the whole batch
+        self.hoist_invariants = hoist_invariants
+        self.invariant_lines: List[RecordInfo] = []
+
+    def _append_output_init(self, lines: RecordInfo, invariant: bool):
+        if self.hoist_invariants and invariant:
+            self.invariant_lines.append(lines)
+        else:
+            self.lines.append(lines)
+
     def append_lines(self, lines: RecordInfo):
         self.lines.append(lines)
 
@@ -41,24 +75,27 @@ class CallContext:
         )
 
         if output not in self.generated_outputs:
-            self.lines.append(
+            self._append_output_init(
                 RecordInfo(
                     lines=generator.generate_is_valid_init(),
                     description=f"{output.parent}::{output.output_name} valid init",
-                )
+                ),
+                invariant=generator.is_valid_init_invariant(),
             )
-            self.lines.append(
+            self._append_output_init(
                 RecordInfo(
                     lines=generator.generate_output_ref_init_lines(),
                     description=f"{output.parent}::{output.output_name} output_ref_init",
-                )
+                ),
+                invariant=not generator.output_metadata().is_value_ephemeral,
             )
 
             self.generated_outputs.add(output)
 
         return generator
 
-    def add_a_call(self, call_gen: CallGen):
+    def add_a_call(self, call_gen: CallGen, cycle_count_slot: Optional[int] = None):
+        """Adds the call, timed into the given cycle counter if there is one"""
 
         return_type = None
 
@@ -87,8 +124,19 @@ class CallContext:
         else:
             call_line = f"{full_invocation};"
 
+        call_lines = [call_line]
+        if cycle_count_slot is not None:
+            call_lines = [
+                f"const std::uint64_t {CYCLE_START_VAR} = read_cycle_counter();",
+                call_line,
+                f"__myself->{CYCLE_COUNTERS_VAR}[{cycle_count_slot}].record("
+                f"read_cycle_counter() - {CYCLE_START_VAR});",
+            ]
+
         for call in call_gen.call_datas:
-            for output in call.outputs:
+            for output in sorted(
+                call.outputs, key=lambda output: (output.parent, output.output_name)
+            ):
                 self.register_output(output)
 
         with self:
@@ -98,7 +146,7 @@ class CallContext:
                     description=f"{call_gen.call_path} local prefix",
                 ),
                 RecordInfo(
-                    lines=[call_line], description=f"{call_gen.call_path} call line"
+                    lines=call_lines, description=f"{call_gen.call_path} call line"
                 ),
                 RecordInfo(
                     lines=[call.local_postfix for call in call_gen.call_datas],
@@ -113,19 +161,7 @@ class CallContext:
         self.lines.append(BRACE_CLOSE)
 
     def generate(self) -> str:
-        all_lines = []
-
-        for line in self.lines:
-
-            local_line = "\n".join(line.lines)
-
-            formatted_local = f"""\
-/*
-{line.description}
-*/
-
-{local_line}"""
-
-            all_lines.append(formatted_local)
+        return format_records(self.lines)
 
-        return "\n\n".join(all_lines)
+    def generate_invariant(self) -> str:
+        return format_records(self.invariant_lines)
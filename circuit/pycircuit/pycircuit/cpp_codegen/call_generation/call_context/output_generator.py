@@ -61,7 +61,12 @@ class OutputGenerator:
         if output_metadata.validity_index is None:
             return f"{self.component().name}_{self.output_name}_IV"
         else:
-            return f"outputs_is_valid[{output_metadata.validity_index}]"
+            return output_metadata.validity_path()
+
+    def is_valid_init_invariant(self) -> bool:
+        """Whether the validity init is the same on every call"""
+        spec = self.component().definition.d_output_specs[self.output_name]
+        return self.output_metadata().validity_index is None and spec.always_valid
 
     def generate_is_valid_init(self) -> List[str]:
 
@@ -1,45 +1,56 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 
 from pycircuit.circuit_builder.circuit import CallGroup
+from pycircuit.cpp_codegen.generation_metadata import BATCH_POSTFIX
+from pycircuit.cpp_codegen.name_lookup import generate_name_dispatch
 
 INPUT_STR_NAME = "__name__"
 INPUT_TYPEID_NAME = "__typeid__"
 VOID_CALL_POSTFIX = "_void"
 LOAD_CALL_TYPE = "TriggerCall"
+CALL_LOOKUP_STEM = "call"
 
 
 def generate_lookup_of(call_name: str, type_name: str, prefix="", postfix="") -> str:
     return f"""\
-if ("{call_name}" == {INPUT_STR_NAME}) {{
-    const std::type_info &the_type = typeid(InputTypes::{type_name});
-    if (the_type == {INPUT_TYPEID_NAME}) {{
-        return (void *)&{prefix}{call_name}{postfix};
-    }} else {{
-        return WrongCallbackType {{
-            .type=the_type
-        }};
-    }}
+const std::type_info &the_type = typeid(InputTypes::{type_name});
+if (the_type == {INPUT_TYPEID_NAME}) {{
+    return (void *)&{prefix}{call_name}{postfix};
+}} else {{
+    return WrongCallbackType {{
+        .type=the_type
+    }};
 }}"""
 
 
 def general_load_call_for_struct(
-    groups: Dict[str, CallGroup], struct_name: str, prefix=""
-) -> str:
+    groups: Dict[str, CallGroup],
+    struct_name: str,
+    prefix="",
+    batch_calls: bool = False,
+) -> List[Tuple[str, str]]:
 
     for group in groups.values():
         assert group.struct == struct_name
 
-    ordered_groups = sorted(groups.keys())
+    call_names = sorted(groups.keys())
+    if batch_calls:
+        call_names += [f"{call_name}{BATCH_POSTFIX}" for call_name in call_names]
 
-    return "\n\n".join(
-        generate_lookup_of(
-            call_name, struct_name, prefix=prefix, postfix=VOID_CALL_POSTFIX
+    return [
+        (
+            call_name,
+            generate_lookup_of(
+                call_name, struct_name, prefix=prefix, postfix=VOID_CALL_POSTFIX
+            ),
         )
-        for call_name in ordered_groups
-    )
+        for call_name in call_names
+    ]
 
 
-def general_all_load_call_lines(groups: Dict[str, CallGroup], prefix="") -> str:
+def general_all_load_call_lines(
+    groups: Dict[str, CallGroup], prefix="", batch_calls: bool = False
+) -> List[Tuple[str, str]]:
     all_structs = sorted(set(group.struct for group in groups.values()))
 
     all_calls = []
@@ -49,17 +60,22 @@ def general_all_load_call_lines(groups: Dict[str, CallGroup], prefix="") -> str:
             call: group for (call, group) in groups.items() if group.struct == struct
         }
 
-        all_calls.append(general_load_call_for_struct(subset, struct, prefix=prefix))
+        all_calls += general_load_call_for_struct(
+            subset, struct, prefix=prefix, batch_calls=batch_calls
+        )
 
-    return "\n\n".join(all_calls)
+    return all_calls
 
 
-def generate_true_loader_body(groups: Dict[str, CallGroup], prefix: str = "") -> str:
-    load_lines = general_all_load_call_lines(groups, prefix=prefix)
-    return f"""\
-{load_lines}
-
-return NoCallbackFound{{}};"""
+def generate_true_loader_body(
+    groups: Dict[str, CallGroup], prefix: str = "", batch_calls: bool = False
+) -> str:
+    return generate_name_dispatch(
+        CALL_LOOKUP_STEM,
+        INPUT_STR_NAME,
+        general_all_load_call_lines(groups, prefix=prefix, batch_calls=batch_calls),
+        "return NoCallbackFound{};",
+    )
 
 
 def top_level_real_loader(prefix: str = "") -> str:
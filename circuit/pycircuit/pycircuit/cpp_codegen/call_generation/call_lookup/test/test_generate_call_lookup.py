@@ -3,6 +3,7 @@ from pycircuit.circuit_builder.circuit import CallGroup
 from pycircuit.cpp_codegen.call_generation.call_lookup.generate_call_lookup import (
     general_load_call_for_struct,
     generate_lookup_of,
+    generate_true_loader_body,
 )
 
 
@@ -10,15 +11,13 @@ def test_lookup_of():
     assert (
         generate_lookup_of("test_call", "test_struct", postfix="_void")
         == """\
-if ("test_call" == __name__) {
-    const std::type_info &the_type = typeid(InputTypes::test_struct);
-    if (the_type == __typeid__) {
-        return (void *)&test_call_void;
-    } else {
-        return WrongCallbackType {
-            .type=the_type
-        };
-    }
+const std::type_info &the_type = typeid(InputTypes::test_struct);
+if (the_type == __typeid__) {
+    return (void *)&test_call_void;
+} else {
+    return WrongCallbackType {
+        .type=the_type
+    };
 }"""
     )
 
@@ -30,28 +29,34 @@ def test_single_lookup_call(prefix: str):
         "test_call_a": CallGroup(struct="test_struct", external_field_mapping={}),
     }
 
+    assert general_load_call_for_struct(groups, "test_struct", prefix=prefix) == [
+        (
+            call,
+            generate_lookup_of(call, "test_struct", prefix=prefix, postfix="_void"),
+        )
+        for call in ["test_call_a", "test_call_b"]
+    ]
+
+
+def test_loader_body_dispatches_sorted_calls():
+    groups = {
+        "test_call_b": CallGroup(struct="test_struct_a", external_field_mapping={}),
+        "test_call_c": CallGroup(struct="test_struct_a", external_field_mapping={}),
+        "test_call_a": CallGroup(struct="test_struct_b", external_field_mapping={}),
+    }
+
+    body = generate_true_loader_body(groups)
+
     assert (
-        general_load_call_for_struct(groups, "test_struct", prefix=prefix)
-        == f"""\
-if ("test_call_a" == __name__) {{
-    const std::type_info &the_type = typeid(InputTypes::test_struct);
-    if (the_type == __typeid__) {{
-        return (void *)&{prefix}test_call_a_void;
-    }} else {{
-        return WrongCallbackType {{
-            .type=the_type
-        }};
-    }}
-}}
-
-if ("test_call_b" == __name__) {{
-    const std::type_info &the_type = typeid(InputTypes::test_struct);
-    if (the_type == __typeid__) {{
-        return (void *)&{prefix}test_call_b_void;
-    }} else {{
-        return WrongCallbackType {{
-            .type=the_type
-        }};
-    }}
-}}"""
+        """\
+static constexpr std::array<std::string_view, 3> __call_names__ = {
+    "test_call_a",
+    "test_call_b",
+    "test_call_c",
+};"""
+        in body
     )
+    assert "case 0: { // test_call_a\n" in body
+    assert "typeid(InputTypes::test_struct_b)" in body.split("case 1:")[0]
+    assert "case 2: { // test_call_c\n" in body
+    assert body.endswith("return NoCallbackFound{};")
@@ -97,6 +97,11 @@ def find_callset_for(
 
 def get_inputs_for_callset(
     callset: CallSpec, component: Component
-) -> Set[ComponentInput]:
+) -> List[ComponentInput]:
+    """Returns the inputs of the callset ordered by name
+
+    Set iteration order differs between processes, and the generated code
+    must not depend on which process generated it
+    """
     all_inputs = callset.observes | callset.written_set
-    return {component.inputs[name] for name in all_inputs}
+    return [component.inputs[name] for name in sorted(all_inputs)]
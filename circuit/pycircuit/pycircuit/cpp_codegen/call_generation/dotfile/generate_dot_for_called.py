@@ -58,17 +58,17 @@ def generate_dot_for_called(
 
     # First, add list of triggered
 
-    external_node_names = [
+    external_node_names = sorted(
         f"{get_parent_name(trigger)}" for trigger in external_triggered
-    ]
+    )
 
     # todo assert these are all on the same level
     for trigger_name in external_node_names:
         lines.append(f'{trigger_name} [shape=box label="{trigger_name}"]')
 
-    untriggered_external_node_names = [
+    untriggered_external_node_names = sorted(
         f"{get_parent_name(untriggered)}" for untriggered in uncalled_external
-    ]
+    )
 
     # todo assert these are all on the same level
     for trigger_name in untriggered_external_node_names:
@@ -85,12 +85,14 @@ def generate_dot_for_called(
             f'{component.component.name} [label="{component.component.name}::{component.callset.callback}"]'
         )
 
-    for uncalled_parent in uncalled_parents:
+    for uncalled_parent in sorted(uncalled_parents):
         lines.append(f"{uncalled_parent} [style=dashed]")
 
     # Generate written (i.e. non-observes) lines
     for component in all_called:
-        for input_name in component.callset.written_set | component.callset.observes:
+        for input_name in sorted(
+            component.callset.written_set | component.callset.observes
+        ):
             input = component.component.inputs[input_name]
             for output in input.outputs():
 
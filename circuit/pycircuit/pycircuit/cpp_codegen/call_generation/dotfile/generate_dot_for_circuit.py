@@ -30,19 +30,12 @@ def generate_dot_for_circuit(circuit: CircuitData) -> str:
 
     lines = []
 
-    used_outputs = set(
-        output
-        for component in circuit.components.values()
-        for input in component.inputs.values()
-        for output in input.outputs()
-    )
-
     # First, add list of triggered
 
     relevant_externals = [
         external
         for external in circuit.external_inputs.values()
-        if external.output() in used_outputs
+        if circuit.consumers_of(external)
     ]
 
     external_node_names = [
@@ -61,10 +54,12 @@ def generate_dot_for_circuit(circuit: CircuitData) -> str:
 
         lines.append(f'{component.name} [label="{component.name}"]')
 
+        triggering = component.definition.triggering_inputs()
+
         for (input_name, input) in component.inputs.items():
             for output in input.outputs():
 
-                if input in component.triggering_inputs():
+                if input_name in triggering:
                     line_style = "solid"
                 else:
                     line_style = "dashed"
@@ -1,4 +1,4 @@
-from collections import OrderedDict
+import heapq
 from dataclasses import dataclass
 from typing import Dict, List, Set
 
@@ -7,8 +7,6 @@ from pycircuit.circuit_builder.component import Component, ComponentOutput
 from pycircuit.circuit_builder.definition import CallSpec
 from pycircuit.cpp_codegen.call_generation.callset import find_callset_for
 
-# TODO start testing these
-
 
 @dataclass
 class CalledComponent:
@@ -16,51 +14,88 @@ class CalledComponent:
     component: Component
 
 
-# This is not fast, but in practice
-# there will only be one iteration of actual work since insertions into the circuit
-# already tend to happen in order
-def topologically_sort(
+def find_reachable_components(
     circuit: CircuitData, used_outputs: Set[ComponentOutput]
-) -> List[Component]:
-    used_outputs = set(used_outputs)
-    components = list(circuit.components.values())
+) -> Dict[str, Component]:
+    """Finds every component that could be triggered by the given outputs
 
-    conservatively_called: Dict[str, Component] = OrderedDict()
+    This is conservative - any component which has a triggering input
+    that might be written is assumed to write all of its outputs
+    """
+    index = circuit.index()
 
-    # 1. do a lazy, conservative, topological sort
+    reachable: Dict[str, Component] = {}
+    seen_outputs = set(used_outputs)
+    worklist = list(used_outputs)
 
-    rounds = 0
-    did_work = True
-    while (len(conservatively_called) < len(components)) and did_work:
-        rounds += 1
-        did_work = False
-        for component in components:
-            if component.name in conservatively_called:
+    while worklist:
+        output = worklist.pop()
+        for edge in index.consumers_of(output):
+            if not edge.triggering or edge.component in reachable:
                 continue
 
-            if any(
-                i_output in used_outputs
-                for i in component.triggering_inputs()
-                for i_output in i.outputs()
-            ):
-                potentially_written = {
-                    ComponentOutput(parent=component.name, output_name=field)
-                    for field in component.definition.outputs()
-                }
-                used_outputs |= potentially_written
-                did_work = True
-                conservatively_called[component.name] = component
-
-    return list(conservatively_called.values())
-
-
-# TODO as an optimization, could drop ephemeral components
-# which have no outputs?
-# Most likely it's better to warn, as this could just sort of
-# "auto-delete" down a huge tree if there was an error?
-# Alternatively, they can *only* exist as a side effect,
-# So such components should be removed anyways unless specifically marked
-# with warnings generated as such
+            component = circuit.components[edge.component]
+            reachable[component.name] = component
+
+            for field in component.definition.outputs():
+                potentially_written = ComponentOutput(
+                    parent=component.name, output_name=field
+                )
+                if potentially_written not in seen_outputs:
+                    seen_outputs.add(potentially_written)
+                    worklist.append(potentially_written)
+
+    return reachable
+
+
+# Kahn's algorithm over the reachable subgraph. Ties are broken by insertion order
+# into the circuit, so that the result is stable and matches the natural build order
+def topologically_sort(
+    circuit: CircuitData, used_outputs: Set[ComponentOutput]
+) -> List[Component]:
+    index = circuit.index()
+    reachable = find_reachable_components(circuit, used_outputs)
+
+    in_degree: Dict[str, int] = {}
+    children: Dict[str, List[str]] = {name: [] for name in reachable}
+
+    for (name, component) in reachable.items():
+        parents = {
+            parent
+            for input in component.inputs.values()
+            for parent in input.parents()
+            if parent in reachable and parent != name
+        }
+        in_degree[name] = len(parents)
+        for parent in parents:
+            children[parent].append(name)
+
+    ready = [
+        (index.order_of(name), name)
+        for (name, degree) in in_degree.items()
+        if degree == 0
+    ]
+    heapq.heapify(ready)
+
+    sorted_components: List[Component] = []
+    while ready:
+        (_, name) = heapq.heappop(ready)
+        sorted_components.append(reachable[name])
+        for child in children[name]:
+            in_degree[child] -= 1
+            if in_degree[child] == 0:
+                heapq.heappush(ready, (index.order_of(child), child))
+
+    if len(sorted_components) != len(reachable):
+        cyclic = sorted(name for (name, degree) in in_degree.items() if degree > 0)
+        raise ValueError(f"Circuit contains a cycle through components {cyclic}")
+
+    return sorted_components
+
+
+# Components whose outputs can never be observed are not dropped here,
+# see circuit_builder/liveness.py for a pass that prunes (and reports) them
+# before generation
 
 
 def find_all_children_of_from_outputs(
@@ -1,7 +1,11 @@
-from typing import Optional, Set, List
+from typing import List, Optional, Sequence, Set, Tuple
 
 from pycircuit.circuit_builder.circuit import CallGroup, CircuitData
-from pycircuit.circuit_builder.component import ArrayComponentInput, ComponentOutput
+from pycircuit.circuit_builder.component import (
+    TIME_TYPE,
+    ArrayComponentInput,
+    ComponentOutput,
+)
 from pycircuit.circuit_builder.definition import CallSpec
 from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
 from pycircuit.cpp_codegen.call_generation.single_call.generate_array_call import (
@@ -11,21 +15,29 @@ from pycircuit.cpp_codegen.call_generation.single_call.generate_single_call impo
     generate_single_call,
 )
 from pycircuit.cpp_codegen.generation_metadata import (
+    BATCH_VAR,
     CALL_VAR,
     LOCAL_DATA_LOAD_PREFIX,
     STRUCT_VAR,
+    TIME_VAR,
     AnnotatedComponent,
     GenerationMetadata,
+    generate_batch_call_signature,
     generate_true_call_signature,
+    validity_marker_path,
 )
 from pycircuit.cpp_codegen.call_generation.call_context.call_context import CallContext
-from pycircuit.cpp_codegen.call_generation.call_context.call_context import RecordInfo
+from pycircuit.cpp_codegen.call_generation.call_context.call_context import (
+    RecordInfo,
+    format_records,
+)
 from pycircuit.cpp_codegen.call_generation.call_data import CallGen
 from pycircuit.cpp_codegen.generation_metadata import LOCAL_TIME_LOAD_PREFIX
 from pycircuit.cpp_codegen.call_generation.find_children_of import (
     CalledComponent,
     find_all_children_of_from_outputs,
 )
+from pycircuit.cpp_codegen.type_names import get_alias_for
 
 # TODO generate thing to load data from external calls
 
@@ -33,16 +45,24 @@ CALL_OUTWARD = f"""if ({CALL_VAR}) {{
     {CALL_VAR}.call(__myself);
 }}"""
 
+BATCH_ELEMENT_VAR = "__timed__"
+CHANGED_VAR = "__changed__"
+
 
-def generate_init_externals(group: CallGroup, circuit: CircuitData) -> List[str]:
+def generate_init_externals(
+    group: CallGroup, circuit: CircuitData, packed_validity: bool = False
+) -> List[str]:
     lines = []
     for (field, external_name) in group.external_field_mapping.items():
         external = circuit.external_inputs[external_name]
+        valid_path = validity_marker_path(
+            "_externals.is_valid", external.index, packed_validity
+        )
         init_code = f"""if (Optionally<{external.type}>::valid({STRUCT_VAR}.{field})) [[likely]] {{
-_externals.is_valid[{external.index}] = true;
+{valid_path} = true;
 _externals.{external_name} = std::move(Optionally<{external.type}>::value({STRUCT_VAR}.{field}));
 }} else {{
-_externals.is_valid[{external.index}] = false;
+{valid_path} = false;
 }}"""
         lines.append(init_code)
 
@@ -74,7 +94,13 @@ def add_calls_to_context(
     context: CallContext,
     callable: Optional[str] = None,
     prepend_calls: List[CalledComponent] = [],
+    trigger_name: Optional[str] = None,
 ):
+    """Adds every call made when triggered changes, in call order
+
+    With cycle counts enabled, each call is timed into the counter of
+    trigger_name (the call group or timer) and the called component
+    """
     children_for_call = prepend_calls + find_all_children_of_from_outputs(
         gen_data.circuit, triggered
     )
@@ -93,8 +119,14 @@ def add_calls_to_context(
             all_outputs,
         )
 
+        cycle_count_slot = None
+        if gen_data.cycle_counts and trigger_name is not None:
+            cycle_count_slot = gen_data.cycle_count_slots[
+                (trigger_name, called_component.component.name)
+            ]
+
         for gen in call_gen:
-            context.add_a_call(gen)
+            context.add_a_call(gen, cycle_count_slot=cycle_count_slot)
 
     for called_component in children_for_call:
         if called_component.callset.skippable:
@@ -121,7 +153,9 @@ def generate_external_call_body_for(
     }
 
     external_initialization = generate_init_externals(
-        gen_data.circuit.call_groups[meta.call_name], gen_data.circuit
+        gen_data.circuit.call_groups[meta.call_name],
+        gen_data.circuit,
+        packed_validity=gen_data.packed_validity,
     )
 
     signature = generate_true_call_signature(
@@ -141,7 +175,13 @@ def generate_external_call_body_for(
         RecordInfo(lines=external_initialization, description="initialize externals")
     )
 
-    add_calls_to_context(used_outputs, gen_data, context, callable=CALL_OUTWARD)
+    add_calls_to_context(
+        used_outputs,
+        gen_data,
+        context,
+        callable=CALL_OUTWARD,
+        trigger_name=meta.call_name,
+    )
 
     call_body = context.generate()
 
@@ -149,3 +189,150 @@ def generate_external_call_body_for(
 {signature} {{
 {call_body}
 }}"""
+
+
+def watched_output_paths(
+    output: ComponentOutput, gen_data: GenerationMetadata
+) -> Tuple[str, str, str]:
+    """Returns the type, stored value and validity of an output watched by a batch"""
+    annotated = gen_data.annotated_components.get(output.parent)
+    if annotated is None or output.output_name not in annotated.output_data:
+        raise ValueError(f"Watched output {output} is not in the circuit")
+
+    metadata = annotated.output_data[output.output_name]
+    if metadata.is_value_ephemeral:
+        raise ValueError(
+            f"Watched output {output} is not stored, mark it with force_stored"
+        )
+
+    spec = annotated.component.definition.d_output_specs[output.output_name]
+    type_name = f"{get_alias_for(annotated.component)}::{spec.type_path}"
+    value = f"_outputs.{output.parent}_{output.output_name}"
+    # Outputs without a marker are always valid or have a default
+    if metadata.validity_index is None:
+        valid = "true"
+    else:
+        valid = metadata.validity_path()
+
+    return (type_name, value, valid)
+
+
+def watched_last_names(idx: int) -> Tuple[str, str]:
+    return (f"__watched_{idx}__", f"__watched_{idx}_valid__")
+
+
+def generate_watch_init(
+    watched: Sequence[ComponentOutput], gen_data: GenerationMetadata
+) -> List[str]:
+    lines = []
+    for (idx, output) in enumerate(watched):
+        (type_name, value, valid) = watched_output_paths(output, gen_data)
+        (last, last_valid) = watched_last_names(idx)
+        lines += [f"{type_name} {last} = {value};", f"bool {last_valid} = {valid};"]
+    return lines
+
+
+def generate_watched_call(
+    watched: Sequence[ComponentOutput], gen_data: GenerationMetadata
+) -> str:
+    """Calls outward only if a watched output changed validity or value"""
+    if not watched:
+        return CALL_OUTWARD
+
+    checks = []
+    for (idx, output) in enumerate(watched):
+        (_, value, valid) = watched_output_paths(output, gen_data)
+        (last, last_valid) = watched_last_names(idx)
+        checks.append(
+            f"""\
+{{
+const bool __now_valid__ = {valid};
+if (__now_valid__ != {last_valid} || (__now_valid__ && !({last} == {value}))) {{
+{CHANGED_VAR} = true;
+{last_valid} = __now_valid__;
+{last} = {value};
+}}
+}}"""
+        )
+
+    all_checks = "\n".join(checks)
+    return f"""\
+bool {CHANGED_VAR} = false;
+{all_checks}
+if ({CHANGED_VAR}) {{
+{CALL_OUTWARD}
+}}"""
+
+
+def generate_external_batch_body_for(
+    meta: CallMetaData,
+    gen_data: GenerationMetadata,
+    watched: Sequence[ComponentOutput] = (),
+) -> str:
+    """Generates the call applied to every input of a batch in turn
+
+    The struct is loaded, and references to stored outputs bound, once for the
+    whole batch. Without watched outputs the callback is called after every
+    input, otherwise only after inputs which changed one of the watched outputs.
+    """
+
+    used_outputs = {
+        ComponentOutput(parent="external", output_name=output)
+        for output in meta.triggered
+    }
+
+    group = gen_data.circuit.call_groups[meta.call_name]
+    external_initialization = generate_init_externals(
+        group,
+        gen_data.circuit,
+        packed_validity=gen_data.packed_validity,
+    )
+
+    signature = generate_batch_call_signature(
+        meta, gen_data.circuit, prefix=f"void {gen_data.struct_name}::"
+    )
+
+    context = CallContext(metadata=gen_data, hoist_invariants=True)
+
+    context.append_lines(
+        RecordInfo(lines=[LOCAL_TIME_LOAD_PREFIX], description="local time prefix")
+    )
+
+    context.append_lines(
+        RecordInfo(lines=external_initialization, description="initialize externals")
+    )
+
+    add_calls_to_context(
+        used_outputs,
+        gen_data,
+        context,
+        callable=generate_watched_call(watched, gen_data),
+        trigger_name=meta.call_name,
+    )
+
+    prologue_lines = [
+        RecordInfo(lines=[LOCAL_DATA_LOAD_PREFIX], description="local load prefix"),
+        *context.invariant_lines,
+    ]
+    if watched:
+        prologue_lines.append(
+            RecordInfo(
+                lines=generate_watch_init(watched, gen_data),
+                description="watched outputs before the batch",
+            )
+        )
+    prologue = format_records(prologue_lines)
+
+    call_body = context.generate()
+
+    return f"""\
+{signature} {{
+{prologue}
+
+for (const auto &{BATCH_ELEMENT_VAR} : {BATCH_VAR}) {{
+{TIME_TYPE} {TIME_VAR} = {BATCH_ELEMENT_VAR}.time;
+InputTypes::{group.struct} {STRUCT_VAR} = {BATCH_ELEMENT_VAR}.input;
+
+{call_body}
+}}
+}}"""
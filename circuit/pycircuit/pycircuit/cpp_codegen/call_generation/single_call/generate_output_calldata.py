@@ -18,7 +18,7 @@ def get_valid_path(component: AnnotatedComponent, output: str):
     if output_metadata.validity_index is None:
         return f"{component.component.name}_{output}_IV"
     else:
-        return f"outputs_is_valid[{output_metadata.validity_index}]"
+        return output_metadata.validity_path()
 
 
 # can I SFINAE my way into having this work for a bool OR a struct with the right name?
@@ -104,7 +104,8 @@ def generate_output_calldata(
     annotated_component: AnnotatedComponent,
     all_outputs: Set[str],
 ) -> CallData:
-    outputs = list(all_outputs)
+    # Sorted so that the generated code doesn't depend on set iteration order
+    outputs = sorted(all_outputs)
     validity_deconstruction = deconstruct_valid_output(annotated_component, outputs)
 
     output_struct = generate_output_struct(annotated_component.component, outputs)
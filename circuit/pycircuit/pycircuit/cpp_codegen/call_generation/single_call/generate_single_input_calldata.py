@@ -10,6 +10,7 @@ from pycircuit.cpp_codegen.call_generation.single_call.generate_output_calldata
 from pycircuit.cpp_codegen.generation_metadata import (
     AnnotatedComponent,
     GenerationMetadata,
+    validity_marker_path,
 )
 from pycircuit.cpp_codegen.type_names import get_alias_for, get_type_name_for_input
 from pycircuit.circuit_builder.circuit import SingleComponentInput
@@ -57,7 +58,9 @@ def get_parent_name(
 def get_valid_path_external(output: ComponentOutput, gen_data: GenerationMetadata):
     if output.parent == "external":
         the_external = gen_data.circuit.external_inputs[output.output_name]
-        return f"_externals.is_valid[{the_external.index}]"
+        return validity_marker_path(
+            "_externals.is_valid", the_external.index, gen_data.packed_validity
+        )
     else:
         return get_valid_path(
             gen_data.annotated_components[output.parent], output.output_name
@@ -105,9 +108,9 @@ def generate_single_input_prefix(
 
     all_inputs = get_inputs_for_callset(callset, component)
 
-    single_inputs = set(
+    single_inputs = [
         input for input in all_inputs if isinstance(input, SingleComponentInput)
-    )
+    ]
 
     if not single_inputs:
         return None
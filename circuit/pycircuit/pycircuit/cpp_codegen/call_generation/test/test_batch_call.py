@@ -0,0 +1,93 @@
+import pytest
+from pycircuit.circuit_builder.circuit import (
+    CallGroup,
+    CallStruct,
+    CircuitBuilder,
+    OutputOptions,
+)
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
+from pycircuit.cpp_codegen.call_generation.generate_call_for_trigger import (
+    CALL_OUTWARD,
+    generate_external_batch_body_for,
+)
+from pycircuit.cpp_codegen.generation_metadata import compute_global_metadata
+from pycircuit.loader.loader_config import CoreLoaderConfig
+from pycircuit.loader.write_circuit_call import CallStructOptions, generate_circuit_call
+
+STORED = ComponentOutput("stored", "out")
+EPHEMERAL = ComponentOutput("ephemeral", "out")
+
+
+def make_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        (a, b) = [circuit.get_external(name, "int") for name in "ab"]
+        ephemeral = a + b
+        circuit.rename_component(ephemeral, "ephemeral")
+        stored = ephemeral + b
+        circuit.rename_component(stored, "stored")
+        stored.output_options["out"] = OutputOptions(force_stored=True)
+
+    circuit.add_call_struct("AB", CallStruct.from_inputs(a="int", b="int"))
+    circuit.add_call_group("trigger_ab", CallGroup("AB", {"a": "a", "b": "b"}))
+    return circuit
+
+
+def batch_body(watched=()) -> str:
+    circuit = make_circuit()
+    meta = CallMetaData(triggered={"a", "b"}, call_name="trigger_ab")
+    metadata = compute_global_metadata(circuit, [meta], "test")
+    return generate_external_batch_body_for(meta, metadata, watched)
+
+
+def test_hoists_stored_outputs():
+    body = batch_body()
+    (prologue, loop) = body.split("for (const auto &__timed__ : __batch__) {")
+
+    assert "storedTypeAlias::Output& stored_out = _outputs.stored_out;" in prologue
+    assert "ephemeral_out_EV__" in loop
+    assert "__myself->update_time(__time_var__);" in loop
+    assert CALL_OUTWARD in loop
+
+
+def test_watched_outputs():
+    body = batch_body(watched=[STORED])
+    (prologue, loop) = body.split("for (const auto &__timed__ : __batch__) {")
+
+    assert "storedTypeAlias::Output __watched_0__ = _outputs.stored_out;" in prologue
+    assert "bool __watched_0_valid__ = outputs_is_valid[0];" in prologue
+    assert "if (__changed__) {" in loop
+
+
+def test_watched_outputs_must_be_stored():
+    with pytest.raises(ValueError, match="is not stored"):
+        batch_body(watched=[EPHEMERAL])
+
+
+def loader_config(watched_outputs) -> CoreLoaderConfig:
+    return CoreLoaderConfig.from_dict(
+        {
+            "root_cppcuit_path": "",
+            "root_signals_path": "",
+            "batch_calls": True,
+            "watched_outputs": watched_outputs,
+        }
+    )
+
+
+def test_watched_outputs_from_loader_config():
+    options = CallStructOptions(
+        struct_name="Struct", struct_header="header", call_name="trigger_ab"
+    )
+    config = loader_config({"trigger_ab": [STORED.to_dict()]})
+
+    call = generate_circuit_call(options, config, make_circuit())
+    assert "__watched_0__" in call
+
+    with pytest.raises(ValueError, match="not in circuit config"):
+        generate_circuit_call(
+            options, loader_config({"trigger_cd": []}), make_circuit()
+        )
@@ -0,0 +1,83 @@
+from collections import OrderedDict
+
+import pytest
+from pycircuit.circuit_builder.circuit import CircuitBuilder, CircuitData
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.component import SingleComponentInput
+from pycircuit.cpp_codegen.call_generation.find_children_of import (
+    find_all_children_of,
+    topologically_sort,
+)
+
+
+def make_chain_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "int")
+        b = circuit.get_external("b", "int")
+        c = circuit.get_external("c", "int")
+
+        a_b = a + b
+        circuit.rename_component(a_b, "a_b")
+
+        a_b_c = a_b + c
+        circuit.rename_component(a_b_c, "a_b_c")
+
+        b_c = b + c
+        circuit.rename_component(b_c, "b_c")
+
+    return circuit
+
+
+def called_names(external_set, circuit: CircuitData):
+    return [
+        called.component.name for called in find_all_children_of(external_set, circuit)
+    ]
+
+
+def test_finds_only_reachable():
+    circuit = make_chain_circuit()
+
+    assert called_names({"a"}, circuit) == ["a_b", "a_b_c"]
+    assert called_names({"c"}, circuit) == ["a_b_c", "b_c"]
+    assert called_names({"a", "b", "c"}, circuit) == ["a_b", "a_b_c", "b_c"]
+
+
+def test_sort_ignores_insertion_order():
+    circuit = make_chain_circuit()
+
+    reversed_circuit = CircuitData(
+        external_inputs=circuit.external_inputs,
+        components=OrderedDict(reversed(circuit.components.items())),
+        definitions=circuit.definitions,
+        call_groups=circuit.call_groups,
+        call_structs=circuit.call_structs,
+    )
+
+    used = {circuit.external_inputs["a"].output()}
+    sorted_names = [comp.name for comp in topologically_sort(reversed_circuit, used)]
+
+    assert sorted_names == ["a_b", "a_b_c"]
+
+
+def test_index_tracks_renames():
+    circuit = make_chain_circuit()
+
+    with CircuitContextManager(circuit):
+        late = circuit.lookup("b_c") + circuit.get_external("a", "int")
+        circuit.rename_component(late, "late")
+
+    assert called_names({"b"}, circuit) == ["a_b", "a_b_c", "b_c", "late"]
+
+
+def test_cycle_detected():
+    circuit = make_chain_circuit()
+    a_b = circuit.lookup("a_b")
+    a_b.inputs["b"] = SingleComponentInput(
+        input=circuit.lookup("a_b_c").output(), input_name="b"
+    )
+    circuit.invalidate_index()
+
+    with pytest.raises(ValueError, match="Circuit contains a cycle"):
+        find_all_children_of({"a"}, circuit)
@@ -7,6 +7,7 @@ from pycircuit.cpp_codegen.generation_metadata import (
     LOCAL_TIME_LOAD_PREFIX,
     AnnotatedComponent,
     GenerationMetadata,
+    timer_subgraph_name,
 )
 from pycircuit.circuit_builder.circuit import TIME_TYPE
 from pycircuit.cpp_codegen.generation_metadata import TIME_VAR, INPUT_VOID_VAR
@@ -61,7 +62,11 @@ def generate_timer_call_body_for(
     )
 
     add_calls_to_context(
-        all_outputs_of_timer, gen_data, context, prepend_calls=[timer_call_extra]
+        all_outputs_of_timer,
+        gen_data,
+        context,
+        prepend_calls=[timer_call_extra],
+        trigger_name=timer_subgraph_name(component),
     )
 
     call_body = context.generate()
@@ -1,6 +1,8 @@
 from collections import OrderedDict
-from dataclasses import dataclass
-from typing import Dict, List, Optional, Set, Tuple
+from contextlib import contextmanager
+import dataclasses
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 
 from pycircuit.circuit_builder.circuit import (
     TIME_TYPE,
@@ -25,6 +27,8 @@ TIME_VAR = "__time_var__"
 STRUCT_VAR = "__struct_var_"
 CALL_VAR = "__call__"
 INPUT_VOID_VAR = "__raw_object__"
+BATCH_VAR = "__batch__"
+BATCH_POSTFIX = "_batch"
 
 LOCAL_DATA_LOAD_PREFIX = f"""
 // This forces all of the below pointers to be based on this
@@ -54,11 +58,43 @@ LOCAL_TIME_LOAD_PREFIX = f"""
 __myself->update_time({TIME_VAR});
 """
 
+# Must match ValidityWord in cppcuit/validity_bits.hh
+VALIDITY_WORD_BITS = 64
+CACHE_LINE_BYTES = 64
+
+
+def validity_marker_path(root: str, index: int, packed: bool) -> str:
+    """Returns an expression which reads and assigns like the bool marker root[index]"""
+    if packed:
+        return (
+            f"ValidityBit({root}[{index // VALIDITY_WORD_BITS}], "
+            f"{index % VALIDITY_WORD_BITS})"
+        )
+    else:
+        return f"{root}[{index}]"
+
+
+def validity_storage_declaration(
+    markers: int, packed: bool, aligned: bool = False
+) -> str:
+    alignment = f"alignas({CACHE_LINE_BYTES}) " if aligned else ""
+    if packed:
+        words = (markers + VALIDITY_WORD_BITS - 1) // VALIDITY_WORD_BITS
+        return f"{alignment}ValidityWord is_valid[{words}];"
+    else:
+        return f"{alignment}bool is_valid[{markers}];"
+
 
 @dataclass
 class OutputMetadata:
     validity_index: Optional[int]
     is_value_ephemeral: bool
+    # The validity index is a bit of a ValidityWord instead of a bool
+    packed_validity: bool = False
+
+    def validity_path(self, root: str = "outputs_is_valid") -> str:
+        assert self.validity_index is not None
+        return validity_marker_path(root, self.validity_index, self.packed_validity)
 
 
 @dataclass
@@ -81,6 +117,21 @@ class GenerationMetadata:
 
     required_validity_markers: int
 
+    packed_validity: bool = False
+    # Cluster the state of the struct by the triggers which touch it,
+    # see struct_generation/struct_layout.py
+    trigger_layout: bool = False
+
+    # The components called by each call and timer, in call order
+    named_subgraphs: List[Tuple[str, List[CalledComponent]]] = field(
+        default_factory=list
+    )
+
+    # The counter of every (call or timer, component) pair, in call order
+    cycle_count_slots: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    # Time every component call into its counter, see cppcuit/cycle_counter.hh
+    cycle_counts: bool = False
+
 
 def get_ordered_generic_inputs(component: Component) -> List[str]:
     return sorted(
@@ -144,12 +195,51 @@ inline void {meta.call_name}(
 }}"""
 
 
+def generate_batch_call_signature(
+    meta: CallMetaData, circuit: CircuitData, prefix: str = ""
+):
+    call = circuit.call_groups[meta.call_name]
+    struct = call.struct
+
+    return f"""
+{prefix}{meta.call_name}{BATCH_POSTFIX}_void(
+    void *{INPUT_VOID_VAR},
+    std::span<const Timestamped<InputTypes::{struct}>> {BATCH_VAR},
+    RawCall<const Circuit *> {CALL_VAR}
+)"""
+
+
+def generate_batch_wrapper_call(meta: CallMetaData, circuit: CircuitData):
+    call = circuit.call_groups[meta.call_name]
+    struct = call.struct
+    batch_name = f"{meta.call_name}{BATCH_POSTFIX}"
+
+    return f"""\
+inline void {batch_name}(
+    std::span<const Timestamped<InputTypes::{struct}>> {BATCH_VAR},
+    RawCall<const Circuit *> {CALL_VAR}
+) {{
+    {batch_name}_void(static_cast<void *>(this), {BATCH_VAR}, {CALL_VAR});
+}}"""
+
+
 def find_all_subgraphs(circuit: CircuitData) -> List[List[CalledComponent]]:
+    return [subgraph for (_, subgraph) in find_all_named_subgraphs(circuit)]
+
+
+def timer_subgraph_name(component: Component) -> str:
+    return f"{component.name}_timer"
+
+
+def find_all_named_subgraphs(
+    circuit: CircuitData,
+) -> List[Tuple[str, List[CalledComponent]]]:
+    """Returns the components called by each call and timer, in call order"""
     called = []
 
-    for call_group in circuit.call_groups.values():
+    for (call_name, call_group) in circuit.call_groups.items():
         children = find_all_children_of(call_group.inputs, circuit)
-        called.append(children)
+        called.append((call_name, children))
 
     # find timer subgraphs
 
@@ -164,18 +254,87 @@ def find_all_subgraphs(circuit: CircuitData) -> List[List[CalledComponent]]:
                 callset=component.definition.timer_callset, component=component
             )
             all_timer_calls = [called_component] + timer_children
-            called.append(all_timer_calls)
+            called.append((timer_subgraph_name(component), all_timer_calls))
 
     return called
 
 
-def generate_global_metadata(
-    circuit: CircuitData, call_metas: List[CallMetaData], struct_name: str
+def find_cycle_count_slots(
+    named_subgraphs: List[Tuple[str, List[CalledComponent]]]
+) -> Dict[Tuple[str, str], int]:
+    slots: Dict[Tuple[str, str], int] = {}
+    for (name, subgraph) in named_subgraphs:
+        for called in subgraph:
+            slots.setdefault((name, called.component.name), len(slots))
+    return slots
+
+
+def group_validity_markers(
+    annotated_components: OrderedDict[str, AnnotatedComponent],
+    subgraphs: List[List[CalledComponent]],
+    group_size: int,
+) -> int:
+    """Reassigns validity indices so markers written by one trigger are contiguous
+
+    Each subgraph starts in the partially filled group of group_size markers
+    if it fits there, and otherwise in a fresh group. Returns the number of
+    markers used, including any skipped to start a fresh group
+    """
+    groups: List[List[OutputMetadata]] = [
+        [
+            metadata
+            for called in subgraph
+            for metadata in annotated_components[
+                called.component.name
+            ].output_data.values()
+        ]
+        for subgraph in subgraphs
+    ]
+    # Components which no trigger reaches
+    groups.append(
+        [
+            metadata
+            for annotated in annotated_components.values()
+            for metadata in annotated.output_data.values()
+        ]
+    )
+
+    assigned: Set[int] = set()
+    next_index = 0
+    for group in groups:
+        new_markers: List[OutputMetadata] = []
+        for metadata in group:
+            if metadata.validity_index is None or id(metadata) in assigned:
+                continue
+            assigned.add(id(metadata))
+            new_markers.append(metadata)
+
+        if not new_markers:
+            continue
+
+        used = next_index % group_size
+        if used > 0 and used + len(new_markers) > group_size:
+            next_index += group_size - used
+
+        for metadata in new_markers:
+            metadata.validity_index = next_index
+            next_index += 1
+
+    return next_index
+
+
+def compute_global_metadata(
+    circuit: CircuitData,
+    call_metas: List[CallMetaData],
+    struct_name: str,
+    packed_validity: bool = False,
+    trigger_layout: bool = False,
 ) -> GenerationMetadata:
     circuit.validate()
     all_non_ephemeral_component_outputs: Set[ComponentOutput] = set()
 
-    all_subgraphs = find_all_subgraphs(circuit)
+    named_subgraphs = find_all_named_subgraphs(circuit)
+    all_subgraphs = [subgraph for (_, subgraph) in named_subgraphs]
 
     for children in all_subgraphs:
         all_non_ephemeral_component_outputs |= find_nonephemeral_outputs(children)
@@ -236,6 +395,19 @@ def generate_global_metadata(
             class_generics=generics_str,
         )
 
+    if packed_validity or trigger_layout:
+        # Packed markers are grouped into words, and bools into cache lines
+        validity_marker_count = group_validity_markers(
+            annotated_components,
+            all_subgraphs,
+            VALIDITY_WORD_BITS if packed_validity else CACHE_LINE_BYTES,
+        )
+
+    if packed_validity:
+        for annotated in annotated_components.values():
+            for metadata in annotated.output_data.values():
+                metadata.packed_validity = metadata.validity_index is not None
+
     return GenerationMetadata(
         non_ephemeral_components=all_non_ephemeral_component_outputs,
         circuit=circuit,
@@ -243,4 +415,165 @@ def generate_global_metadata(
         struct_name=struct_name,
         call_endpoints=call_metas,
         required_validity_markers=validity_marker_count,
+        packed_validity=packed_validity,
+        trigger_layout=trigger_layout,
+        named_subgraphs=named_subgraphs,
+        cycle_count_slots=find_cycle_count_slots(named_subgraphs),
     )
+
+
+def _copy_metadata(metadata: GenerationMetadata, **changes) -> GenerationMetadata:
+    """Copies everything an emitter could mutate, so cache hits never share state
+
+    Components are still those of the circuit
+    """
+    annotated_components = OrderedDict(
+        (
+            name,
+            dataclasses.replace(
+                annotated,
+                output_data={
+                    output: dataclasses.replace(output_metadata)
+                    for (output, output_metadata) in annotated.output_data.items()
+                },
+            ),
+        )
+        for (name, annotated) in metadata.annotated_components.items()
+    )
+    return dataclasses.replace(
+        metadata,
+        non_ephemeral_components=set(metadata.non_ephemeral_components),
+        annotated_components=annotated_components,
+        named_subgraphs=[
+            (name, list(subgraph)) for (name, subgraph) in metadata.named_subgraphs
+        ],
+        cycle_count_slots=dict(metadata.cycle_count_slots),
+        **changes,
+    )
+
+
+class GenerationMetadataCache:
+    """Caches the whole-circuit analysis behind GenerationMetadata
+
+    Every emitter needs the same analysis of the circuit, and differs only in
+    the call endpoints and struct name. Entries are keyed on the content hash of the
+    circuit, so mutating a circuit (i.e. forcing an output to be stored)
+    transparently invalidates anything cached for it.
+
+    Hashing walks the whole circuit, so while a circuit is frozen its hash is
+    computed once and reused by every lookup. It must not be mutated until thawed.
+    """
+
+    def __init__(self, max_entries: int = 4):
+        self._max_entries = max_entries
+        self._entries: OrderedDict[
+            Tuple[int, str, bool, bool], GenerationMetadata
+        ] = OrderedDict()
+        self._frozen_hashes: Dict[int, str] = {}
+
+    def _content_hash(self, circuit: CircuitData) -> str:
+        frozen = self._frozen_hashes.get(id(circuit))
+        return frozen if frozen is not None else circuit.content_hash()
+
+    def freeze(self, circuit: CircuitData):
+        self._frozen_hashes[id(circuit)] = circuit.content_hash()
+
+    def thaw(self, circuit: CircuitData):
+        self._frozen_hashes.pop(id(circuit), None)
+
+    def lookup(
+        self,
+        circuit: CircuitData,
+        call_metas: List[CallMetaData],
+        struct_name: str,
+        packed_validity: bool = False,
+        trigger_layout: bool = False,
+        cycle_counts: bool = False,
+    ) -> GenerationMetadata:
+        key = (
+            id(circuit),
+            self._content_hash(circuit),
+            packed_validity,
+            trigger_layout,
+        )
+
+        cached = self._entries.get(key)
+        if cached is None:
+            cached = compute_global_metadata(
+                circuit,
+                [],
+                struct_name,
+                packed_validity=packed_validity,
+                trigger_layout=trigger_layout,
+            )
+            self._entries[key] = cached
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+
+        # Probes only change the generated code, not the analysis
+        return _copy_metadata(
+            cached,
+            call_endpoints=call_metas,
+            struct_name=struct_name,
+            cycle_counts=cycle_counts,
+        )
+
+    def insert(self, metadata: GenerationMetadata):
+        """Seeds the cache with metadata computed elsewhere, i.e. in another process"""
+        key = (
+            id(metadata.circuit),
+            self._content_hash(metadata.circuit),
+            metadata.packed_validity,
+            metadata.trigger_layout,
+        )
+        self._entries[key] = metadata
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self._frozen_hashes.clear()
+
+
+_GLOBAL_METADATA_CACHE = GenerationMetadataCache()
+
+
+def generate_global_metadata(
+    circuit: CircuitData,
+    call_metas: List[CallMetaData],
+    struct_name: str,
+    packed_validity: bool = False,
+    trigger_layout: bool = False,
+    cycle_counts: bool = False,
+) -> GenerationMetadata:
+    return _GLOBAL_METADATA_CACHE.lookup(
+        circuit,
+        call_metas,
+        struct_name,
+        packed_validity=packed_validity,
+        trigger_layout=trigger_layout,
+        cycle_counts=cycle_counts,
+    )
+
+
+def prime_global_metadata(metadata: GenerationMetadata):
+    """Seeds the global cache, i.e. in a worker process which never mutates
+    the circuit, so it stays frozen from here on"""
+    _GLOBAL_METADATA_CACHE.freeze(metadata.circuit)
+    _GLOBAL_METADATA_CACHE.insert(metadata)
+
+
+@contextmanager
+def frozen_circuit(circuit: CircuitData) -> Iterator[None]:
+    """Hashes circuit once for every global metadata lookup within the block
+
+    The circuit must not be mutated within the block
+    """
+    _GLOBAL_METADATA_CACHE.freeze(circuit)
+    try:
+        yield
+    finally:
+        _GLOBAL_METADATA_CACHE.thaw(circuit)
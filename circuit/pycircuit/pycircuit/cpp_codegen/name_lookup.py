@@ -0,0 +1,81 @@
+from typing import List, Tuple
+
+# Generated lookups used to compare the requested name against every known name
+# in turn. Instead, the names are emitted as a sorted constexpr table,
+# the requested name is binary searched and the found index switched on.
+# A name which isn't found gets the index one past the end, the default case
+
+
+def sorted_names(names: List[str]) -> List[str]:
+    # std::string_view orders by bytes, which for utf8 is the same as code points
+    return sorted(set(names))
+
+
+def generate_name_table(table_name: str, names: List[str]) -> str:
+    if names != sorted_names(names):
+        raise ValueError(f"Names of table {table_name} must be sorted and unique")
+
+    entries = "".join(f'\n    "{name}",' for name in names)
+    return f"""\
+static constexpr std::array<std::string_view, {len(names)}> {table_name} = {{{entries}
+}};
+static_assert(std::is_sorted({table_name}.begin(), {table_name}.end()));"""
+
+
+def table_name_of(stem: str) -> str:
+    return f"__{stem}_names__"
+
+
+def index_name_of(stem: str) -> str:
+    return f"__{stem}_index__"
+
+
+def generate_name_search(stem: str, input_name: str) -> str:
+    table = table_name_of(stem)
+    name = f"__{stem}_name__"
+    found = f"__{stem}_found__"
+    return f"""\
+const std::string_view {name} = {input_name};
+const auto {found} = std::lower_bound({table}.begin(), {table}.end(), {name});
+const std::size_t {index_name_of(stem)} =
+    ({found} != {table}.end() && *{found} == {name})
+        ? {found} - {table}.begin()
+        : {table}.size();"""
+
+
+def generate_name_dispatch(
+    stem: str,
+    input_name: str,
+    cases: List[Tuple[str, str]],
+    not_found: str,
+) -> str:
+    """Generates a lookup of input_name running the body of the matching case
+
+    cases are pairs of name and body, and every body must return or throw.
+    not_found is run for names which aren't in cases
+    """
+    table_name = table_name_of(stem)
+    ordered = sorted(cases, key=lambda case: case[0])
+    names = [name for (name, _) in ordered]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Names of table {table_name} must be unique")
+
+    case_strs = "".join(
+        f"""
+case {idx}: {{ // {name}
+{body}
+}}"""
+        for (idx, (name, body)) in enumerate(ordered)
+    )
+
+    return f"""\
+{generate_name_table(table_name, names)}
+
+{generate_name_search(stem, input_name)}
+
+switch ({index_name_of(stem)}) {{{case_strs}
+default:
+    break;
+}}
+
+{not_found}"""
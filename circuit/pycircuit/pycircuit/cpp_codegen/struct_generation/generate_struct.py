@@ -9,16 +9,26 @@ from pycircuit.circuit_builder.circuit import (
 from pycircuit.cpp_codegen.call_generation.call_lookup.generate_call_lookup import (
     top_level_real_loader,
 )
+from pycircuit.cpp_codegen.call_generation.call_context.call_context import (
+    CYCLE_COUNTERS_VAR,
+)
 from pycircuit.cpp_codegen.call_generation.timer import generate_timer_signature
 from pycircuit.cpp_codegen.generation_metadata import (
     AnnotatedComponent,
     GenerationMetadata,
+    generate_batch_call_signature,
+    generate_batch_wrapper_call,
     generate_true_call_signature,
     generate_wrapper_call,
+    validity_storage_declaration,
 )
 from pycircuit.cpp_codegen.struct_generation.generate_val_load import (
     generate_real_output_lookup_signature,
 )
+from pycircuit.cpp_codegen.struct_generation.struct_layout import (
+    generate_region_declarations,
+    layout_components,
+)
 from pycircuit.cpp_codegen.type_data import get_alias_for, get_using_declarations_for
 
 EXTERNALS_STRUCT_NAME = "externals"
@@ -32,7 +42,9 @@ def generate_ext_check(ext_type: str, ext_name: str):
     return f'static_assert({check}, "{msg}");'
 
 
-def generate_externals_struct(circuit: CircuitData) -> str:
+def generate_externals_struct(
+    circuit: CircuitData, packed_validity: bool = False
+) -> str:
     externals = "\n".join(
         f"{ext.type} {name};" for (name, ext) in circuit.external_inputs.items()
     )
@@ -44,7 +56,7 @@ def generate_externals_struct(circuit: CircuitData) -> str:
         )
     )
     validity = f"""
-    bool is_valid[{len(circuit.external_inputs)}];
+    {validity_storage_declaration(len(circuit.external_inputs), packed_validity)}
     """
     return f"""
         struct Externals final {{
@@ -78,16 +90,32 @@ def generate_default_constructible_static_checks_for_output(
     return f'static_assert({check}, "{msg}");'
 
 
+def generate_output_declarations(annotated: AnnotatedComponent) -> List[str]:
+    return [
+        generate_output_declarations_for_component(annotated.component, output)
+        for output in annotated.component.definition.outputs()
+        if not annotated.output_data[output].is_value_ephemeral
+    ]
+
+
 def generate_output_substruct(
     metadata: GenerationMetadata,
 ) -> str:
 
-    circuit_declarations = "\n\n".join(
-        generate_output_declarations_for_component(component.component, output)
-        for component in metadata.annotated_components.values()
-        for output in component.component.definition.outputs()
-        if not component.output_data[output].is_value_ephemeral
-    )
+    if metadata.trigger_layout:
+        # Outputs are touched both by the triggers writing and reading them
+        circuit_declarations = generate_region_declarations(
+            layout_components(metadata, include_reads=True),
+            lambda name: generate_output_declarations(
+                metadata.annotated_components[name]
+            ),
+        )
+    else:
+        circuit_declarations = "\n\n".join(
+            declaration
+            for component in metadata.annotated_components.values()
+            for declaration in generate_output_declarations(component)
+        )
 
     assert_declarations = "\n".join(
         set(
@@ -99,6 +127,12 @@ def generate_output_substruct(
         )
     )
 
+    validity = validity_storage_declaration(
+        metadata.required_validity_markers,
+        metadata.packed_validity,
+        aligned=metadata.trigger_layout,
+    )
+
     return f"""
         struct Outputs final
         {{
@@ -106,7 +140,7 @@ def generate_output_substruct(
 
             {circuit_declarations}
 
-            bool is_valid[{metadata.required_validity_markers}];
+            {validity}
 
             Outputs() = default;
         }};
@@ -141,11 +175,23 @@ def generate_objects_substruct(
         )
     )
 
-    object_declarations = "\n\n".join(
-        generate_object_declarations_for_component(component.component)
-        for component in metadata.annotated_components.values()
-        if not component.component.definition.static_call
-    )
+    def object_declarations_of(name: str) -> List[str]:
+        component = metadata.annotated_components[name].component
+        if component.definition.static_call:
+            return []
+        return [generate_object_declarations_for_component(component)]
+
+    if metadata.trigger_layout:
+        # Objects are only touched by the triggers calling them
+        object_declarations = generate_region_declarations(
+            layout_components(metadata, include_reads=False), object_declarations_of
+        )
+    else:
+        object_declarations = "\n\n".join(
+            declaration
+            for name in metadata.annotated_components.keys()
+            for declaration in object_declarations_of(name)
+        )
 
     return f"""
         struct Objects final
@@ -186,10 +232,36 @@ def generate_single_input_struct(struct_name: str, struct: CallStruct) -> str:
 }};"""
 
 
-def generate_circuit_struct(circuit: CircuitData, gen_data: GenerationMetadata):
+def generate_cycle_counters(gen_data: GenerationMetadata) -> str:
+    if not gen_data.cycle_counts:
+        return ""
+
+    slots = sorted(gen_data.cycle_count_slots.items(), key=lambda kv: kv[1])
+    names = "\n".join(
+        f'{{"{trigger}", "{component}"}},' for ((trigger, component), _) in slots
+    )
+    count = len(slots)
+
+    return f"""\
+std::array<CycleCount, {count}> {CYCLE_COUNTERS_VAR}{{}};
+static constexpr std::array<CycleCountName, {count}> CYCLE_COUNT_NAMES = {{{{
+{names}
+}}}};
+
+std::span<const CycleCount> cycle_counts() const override {{
+    return {CYCLE_COUNTERS_VAR};
+}}
+std::span<const CycleCountName> cycle_count_names() const override {{
+    return CYCLE_COUNT_NAMES;
+}}"""
+
+
+def generate_circuit_struct(
+    circuit: CircuitData, gen_data: GenerationMetadata, batch_calls: bool = False
+):
 
     usings = generate_usings_for(list(gen_data.annotated_components.values()), circuit)
-    externals = generate_externals_struct(circuit)
+    externals = generate_externals_struct(circuit, gen_data.packed_validity)
     output = generate_output_substruct(gen_data)
     objects = generate_objects_substruct(gen_data)
 
@@ -200,6 +272,15 @@ def generate_circuit_struct(circuit: CircuitData, gen_data: GenerationMetadata):
     wrapper_calls = "\n".join(
         generate_wrapper_call(call, circuit) + ";" for call in gen_data.call_endpoints
     )
+    if batch_calls:
+        calls += "\n" + "\n".join(
+            generate_batch_call_signature(call, circuit, "static void ") + ";"
+            for call in gen_data.call_endpoints
+        )
+        wrapper_calls += "\n" + "\n".join(
+            generate_batch_wrapper_call(call, circuit) + ";"
+            for call in gen_data.call_endpoints
+        )
 
     struct_calls = "\n".join(
         generate_single_input_struct(name, struct)
@@ -212,6 +293,10 @@ def generate_circuit_struct(circuit: CircuitData, gen_data: GenerationMetadata):
         if component.definition.timer_callset is not None
     )
 
+    cycle_counters = generate_cycle_counters(gen_data)
+    if cycle_counters:
+        cycle_counters = f"\n\n{cycle_counters}"
+
     top_level_loader = top_level_real_loader()
     output_loader = generate_real_output_lookup_signature("", "override")
 
@@ -234,7 +319,7 @@ struct {gen_data.struct_name} final : public Circuit {{
         {struct_calls}
     }};
 
-    bool alwaystrue = true;
+    bool alwaystrue = true;{cycle_counters}
 
     {gen_data.struct_name}(nlohmann::json);
 
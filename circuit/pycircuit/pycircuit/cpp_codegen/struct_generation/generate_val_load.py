@@ -1,11 +1,13 @@
-from typing import List
+from typing import List, Optional
 
 from pycircuit.circuit_builder.component import ComponentOutput
 from pycircuit.circuit_builder.definition import OutputSpec
 from pycircuit.cpp_codegen.generation_metadata import (
+    VALIDITY_WORD_BITS,
     AnnotatedComponent,
     GenerationMetadata,
 )
+from pycircuit.cpp_codegen.name_lookup import generate_name_dispatch
 from pycircuit.cpp_codegen.type_names import get_alias_for
 
 OUTPUT_STR_NAME = "__output__"
@@ -13,6 +15,7 @@ COMPONENT_STR_NAME = "__component__"
 TYPE_ID_NAME = "__typeid__"
 BASE_NAME = "__base__"
 REAL_COMPONENT_LOOKUP_NAME = "do_real_component_lookup"
+COMPONENT_LOOKUP_STEM = "component"
 
 
 def generate_real_output_lookup_signature(prefix: str, postfix: str) -> str:
@@ -29,15 +32,27 @@ def get_component_validity(annotated: AnnotatedComponent, output: str) -> str:
     if annotated.component.definition.d_output_specs[output].always_valid:
         return "&this->alwaystrue"
     else:
-        index = annotated.output_data[output].validity_index
+        metadata = annotated.output_data[output]
+        index = metadata.validity_index
         if index is None:
             raise ValueError(
                 f"Tried to load a validity index for output {output} "
                 f"of {annotated.component.name}, but there was no index"
             )
+        if metadata.packed_validity:
+            return f"&this->outputs.is_valid[{index // VALIDITY_WORD_BITS}]"
         return f"&this->outputs.is_valid[{index}]"
 
 
+def get_packed_validity_bit(
+    annotated: AnnotatedComponent, output: str
+) -> Optional[int]:
+    metadata = annotated.output_data[output]
+    if metadata.validity_index is None or not metadata.packed_validity:
+        return None
+    return metadata.validity_index % VALIDITY_WORD_BITS
+
+
 def generate_check_for_loadable_output(
     annotated: AnnotatedComponent, output: str, spec: OutputSpec
 ) -> str:
@@ -45,17 +60,28 @@ def generate_check_for_loadable_output(
     name = annotated.component.name
     type_name = f"{alias}::{spec.type_path}"
 
+    # Packed markers are found by the byte of their word holding them,
+    # and the handle masks out the rest of that byte
+    bit = get_packed_validity_bit(annotated, output)
+    if bit is None:
+        (valid_byte, valid_mask) = ("", "")
+    else:
+        (valid_byte, valid_mask) = (
+            f" + validity_byte_of({bit})",
+            f", validity_mask_of({bit})",
+        )
+
     # TODO add the failure mode for ephemeral
     return f"""\
 if ("{output}" == {OUTPUT_STR_NAME}) {{
     if (typeid({type_name}) == {TYPE_ID_NAME}) {{
         const char *output = reinterpret_cast<const char *>(&this->outputs.{name}_{output});
-        const char *valid = reinterpret_cast<const char *>({get_component_validity(annotated, output)});
+        const char *valid = reinterpret_cast<const char *>({get_component_validity(annotated, output)}){valid_byte};
 
         std::uint32_t value_offset = output - {BASE_NAME};
         std::uint32_t valid_offset = valid - {BASE_NAME};
 
-        return RawOutputHandle(value_offset, valid_offset);
+        return RawOutputHandle(value_offset, valid_offset{valid_mask});
     }} else {{
         throw std::runtime_error("Component {name} got wrong type requesting {output}");
     }}
@@ -88,26 +114,28 @@ def generate_checks_for_component(annotated: AnnotatedComponent):
     )
 
     return f"""\
-if ("{name}" == {COMPONENT_STR_NAME}) {{
 {check_strs}
 
-throw std::runtime_error("Could not find outputs for component {name}");
-}}"""
+throw std::runtime_error("Could not find outputs for component {name}");"""
 
 
 def generate_checks_for_all_components(
     components: List[AnnotatedComponent], struct_name: str
 ) -> str:
 
-    component_checks = "\n\n".join(
-        generate_checks_for_component(comp) for comp in components
+    component_dispatch = generate_name_dispatch(
+        COMPONENT_LOOKUP_STEM,
+        COMPONENT_STR_NAME,
+        [
+            (comp.component.name, generate_checks_for_component(comp))
+            for comp in components
+        ],
+        'throw std::runtime_error("Could not match component name");',
     )
 
     prefix = f"{struct_name}::"
 
     return f"""{generate_real_output_lookup_signature(prefix, "")} {{
 const char * {BASE_NAME} = reinterpret_cast<const char *>(this);
-{component_checks}
-
-throw std::runtime_error("Could not match component name");
+{component_dispatch}
 }}"""
@@ -0,0 +1,132 @@
+"""Orders the state of the generated struct by the triggers which touch it
+
+By default objects and outputs are declared in the order components were added
+to the circuit, so a single trigger (i.e. the depth update of one venue) touches
+state spread across the whole struct. With trigger_layout, each call and timer
+gets a region holding the state only it touches, in the order its body first
+uses it. State touched by several triggers is put in a shared region and state
+touched by none in a cold region at the end. The region of each trigger and
+the shared and cold regions start on fresh cache lines, so triggers don't
+share lines that only one of them uses.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Set, Tuple
+
+from pycircuit.cpp_codegen.generation_metadata import (
+    CACHE_LINE_BYTES,
+    GenerationMetadata,
+)
+
+SHARED_REGION = "shared"
+COLD_REGION = "cold"
+
+
+@dataclass
+class LayoutRegion:
+    name: str
+    components: List[str]
+    # Starts on a fresh cache line
+    aligned: bool = True
+
+
+def find_component_uses(
+    metadata: GenerationMetadata, include_reads: bool
+) -> List[LayoutRegion]:
+    """Returns the components used by each call and timer, in order of first use
+
+    A called component is used by its trigger, as are the components
+    it reads from when include_reads is set
+    """
+    uses = []
+    for (name, subgraph) in metadata.named_subgraphs:
+        used: Dict[str, None] = {}
+        for called in subgraph:
+            if include_reads:
+                for input in called.component.inputs.values():
+                    for parent in sorted(input.parents()):
+                        if parent in metadata.annotated_components:
+                            used.setdefault(parent)
+            used.setdefault(called.component.name)
+        uses.append(LayoutRegion(name=name, components=list(used)))
+    return uses
+
+
+def layout_components(
+    metadata: GenerationMetadata, include_reads: bool
+) -> List[LayoutRegion]:
+    uses = find_component_uses(metadata, include_reads)
+
+    # The indices into uses of the triggers using each component
+    users: Dict[str, Tuple[int, ...]] = {
+        name: () for name in metadata.annotated_components
+    }
+    for (idx, region) in enumerate(uses):
+        for name in region.components:
+            users[name] += (idx,)
+
+    regions = [
+        LayoutRegion(
+            name=region.name,
+            components=[name for name in region.components if len(users[name]) == 1],
+        )
+        for region in uses
+    ]
+
+    # Shared state is grouped by exactly which triggers use it, and the groups
+    # ordered by those triggers, so that i.e. state shared by the calls of one
+    # market sits together. The groups are packed, aligning each would waste
+    # most of a cache line on the many small ones
+    shared: Dict[Tuple[int, ...], List[str]] = {}
+    seen: Set[str] = set()
+    for region in uses:
+        for name in region.components:
+            if len(users[name]) > 1 and name not in seen:
+                seen.add(name)
+                shared.setdefault(users[name], []).append(name)
+    for (group_idx, user_indices) in enumerate(sorted(shared.keys())):
+        user_names = ", ".join(uses[idx].name for idx in user_indices)
+        regions.append(
+            LayoutRegion(
+                name=f"{SHARED_REGION} by {user_names}",
+                components=shared[user_indices],
+                aligned=group_idx == 0,
+            )
+        )
+
+    regions.append(
+        LayoutRegion(
+            name=COLD_REGION,
+            components=[name for (name, used_by) in users.items() if not used_by],
+        )
+    )
+
+    return regions
+
+
+def generate_region_declarations(
+    regions: List[LayoutRegion], declarations_of: Callable[[str], List[str]]
+) -> str:
+    """Declares the fields of every region, in order
+
+    Empty regions are skipped, passing on their alignment to the next region
+    """
+    blocks = []
+    align = False
+    for region in regions:
+        align = align or region.aligned
+        declarations = [
+            declaration
+            for name in region.components
+            for declaration in declarations_of(name)
+        ]
+        if not declarations:
+            continue
+
+        if align:
+            declarations[0] = f"alignas({CACHE_LINE_BYTES}) {declarations[0]}"
+            align = False
+        lines = "\n".join(declarations)
+        blocks.append(f"// {region.name}\n{lines}")
+
+    return "\n\n".join(blocks)
@@ -113,7 +113,6 @@ def test_whole_component_check():
     assert (
         generate_checks_for_component(annotated)
         == f"""\
-if ("{COMPONENT_NAME}" == __component__) {{
 if ("{OUT_A}" == __output__) {{
     throw std::runtime_error("Component {COMPONENT_NAME} requesting handle to ephemeral output {OUT_A}");
 }}
@@ -146,6 +145,5 @@ if ("{OUT_C}" == __output__) {{
     }}
 }}
 
-throw std::runtime_error("Could not find outputs for component {COMPONENT_NAME}");
-}}"""
+throw std::runtime_error("Could not find outputs for component {COMPONENT_NAME}");"""
     )
@@ -0,0 +1,100 @@
+from pycircuit.circuit_builder.circuit import (
+    CallGroup,
+    CallStruct,
+    CircuitBuilder,
+    OutputOptions,
+)
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.cpp_codegen.generation_metadata import compute_global_metadata
+from pycircuit.cpp_codegen.struct_generation.generate_struct import (
+    generate_output_substruct,
+)
+from pycircuit.cpp_codegen.struct_generation.struct_layout import (
+    LayoutRegion,
+    layout_components,
+)
+
+
+def two_trigger_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        (a, b, c, d, e) = [circuit.get_external(name, "int") for name in "abcde"]
+        # No call writes e
+        cold = e + e
+        circuit.rename_component(cold, "cold")
+        ab = a + b
+        circuit.rename_component(ab, "ab")
+        cd = c + d
+        circuit.rename_component(cd, "cd")
+        both = ab + cd
+        circuit.rename_component(both, "both")
+
+        for component in [cold, ab, cd, both]:
+            component.output_options["out"] = OutputOptions(force_stored=True)
+
+    circuit.add_call_struct("AB", CallStruct.from_inputs(a="int", b="int"))
+    circuit.add_call_group("trigger_ab", CallGroup("AB", {"a": "a", "b": "b"}))
+    circuit.add_call_struct("CD", CallStruct.from_inputs(c="int", d="int"))
+    circuit.add_call_group("trigger_cd", CallGroup("CD", {"c": "c", "d": "d"}))
+
+    return circuit
+
+
+def test_layout_by_trigger():
+    metadata = compute_global_metadata(
+        two_trigger_circuit(), [], "test", trigger_layout=True
+    )
+    assert [name for (name, _) in metadata.named_subgraphs] == [
+        "trigger_ab",
+        "trigger_cd",
+    ]
+
+    assert layout_components(metadata, include_reads=False) == [
+        LayoutRegion(name="trigger_ab", components=["ab"]),
+        LayoutRegion(name="trigger_cd", components=["cd"]),
+        LayoutRegion(name="shared by trigger_ab, trigger_cd", components=["both"]),
+        LayoutRegion(name="cold", components=["cold"]),
+    ]
+
+    # trigger_cd reads ab to compute both, and trigger_ab reads cd
+    assert layout_components(metadata, include_reads=True) == [
+        LayoutRegion(name="trigger_ab", components=[]),
+        LayoutRegion(name="trigger_cd", components=[]),
+        LayoutRegion(
+            name="shared by trigger_ab, trigger_cd", components=["ab", "cd", "both"]
+        ),
+        LayoutRegion(name="cold", components=["cold"]),
+    ]
+
+
+def test_layout_groups_validity_by_trigger():
+    metadata = compute_global_metadata(
+        two_trigger_circuit(), [], "test", trigger_layout=True
+    )
+
+    indices = {
+        name: annotated.output_data["out"].validity_index
+        for (name, annotated) in metadata.annotated_components.items()
+    }
+    assert indices == {"ab": 0, "both": 1, "cd": 2, "cold": 3}
+
+
+def test_aligned_output_regions():
+    metadata = compute_global_metadata(
+        two_trigger_circuit(), [], "test", trigger_layout=True
+    )
+    outputs = generate_output_substruct(metadata)
+
+    assert (
+        """\
+// shared by trigger_ab, trigger_cd
+alignas(64) abTypeAlias::Output ab_out;
+cdTypeAlias::Output cd_out;
+bothTypeAlias::Output both_out;
+
+// cold
+alignas(64) coldTypeAlias::Output cold_out;"""
+        in outputs
+    )
+    assert "alignas(64) bool is_valid[4];" in outputs
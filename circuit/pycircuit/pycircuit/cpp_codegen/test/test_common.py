@@ -132,6 +132,7 @@ def basic_component() -> Component:
         definition=basic_definition(),
         name="test",
         class_generics={},
+        params=None,
     )
     return comp
 
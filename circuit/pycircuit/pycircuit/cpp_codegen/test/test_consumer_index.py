@@ -0,0 +1,64 @@
+import pytest
+from pycircuit.circuit_builder.circuit import CircuitBuilder, CircuitIndex
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+
+
+def make_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "int")
+        b = circuit.get_external("b", "int")
+
+        a_b = a + b
+        circuit.rename_component(a_b, "a_b")
+        a_b_b = a_b + b
+        circuit.rename_component(a_b_b, "a_b_b")
+
+    return circuit
+
+
+def consumers(index: CircuitIndex, circuit: CircuitBuilder):
+    return {
+        name: sorted(
+            (edge.component, edge.input_name, edge.triggering)
+            for edge in index.consumers_of_component(name)
+        )
+        for name in list(circuit.components.keys()) + ["external"]
+    }
+
+
+def test_index_maintained_while_building():
+    circuit = make_circuit()
+    rebuilt = CircuitIndex.from_components(circuit.components)
+
+    assert consumers(circuit.index(), circuit) == consumers(rebuilt, circuit)
+    # Only the relative order is used to break ties
+    names = list(circuit.components.keys())
+    assert sorted(names, key=circuit.index().order_of) == sorted(
+        names, key=rebuilt.order_of
+    )
+
+
+def test_consumer_queries():
+    circuit = make_circuit()
+
+    assert [edge.component for edge in circuit.consumers_of(circuit.lookup("a_b"))] == [
+        "a_b_b"
+    ]
+    assert not circuit.consumers_of_component("a_b_b")
+    assert {
+        edge.component for edge in circuit.consumers_of(circuit.external_inputs["b"])
+    } == {"a_b", "a_b_b"}
+
+
+def test_rename_with_consumers_rejected():
+    circuit = make_circuit()
+
+    with pytest.raises(ValueError, match="a_b_b already depends on it"):
+        circuit.rename_component(circuit.lookup("a_b"), "renamed")
+
+    circuit.rename_component(circuit.lookup("a_b_b"), "renamed")
+    assert [edge.component for edge in circuit.consumers_of(circuit.lookup("a_b"))] == [
+        "renamed"
+    ]
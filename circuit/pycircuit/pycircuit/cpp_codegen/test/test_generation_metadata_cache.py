@@ -0,0 +1,131 @@
+from typing import List
+
+from pycircuit.circuit_builder.circuit import CallGroup, CallStruct, CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.cpp_codegen.generation_metadata import GenerationMetadataCache
+from pycircuit.loader.emit_circuit import (
+    CallEmission,
+    InitEmission,
+    StructEmission,
+    emit_circuit_files,
+)
+from pycircuit.loader.loader_config import CoreLoaderConfig
+from pycircuit.loader.write_circuit_call import CallStructOptions
+from pycircuit.loader.write_circuit_init import InitStructOptions
+
+
+def make_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "int")
+        b = circuit.get_external("b", "int")
+
+        a_b = a + b
+        circuit.rename_component(a_b, "a_b")
+
+    return circuit
+
+
+def test_cache_reuses_analysis():
+    circuit = make_circuit()
+    cache = GenerationMetadataCache()
+
+    first = cache.lookup(circuit, [], "first")
+    second = cache.lookup(circuit, [], "second")
+
+    assert first.struct_name == "first"
+    assert second.struct_name == "second"
+    assert first.annotated_components == second.annotated_components
+    assert (
+        first.annotated_components["a_b"].component
+        is second.annotated_components["a_b"].component
+    )
+
+
+def test_cache_hits_share_no_state():
+    circuit = make_circuit()
+    cache = GenerationMetadataCache()
+
+    first = cache.lookup(circuit, [], "first")
+    first.annotated_components["a_b"].output_data["out"].validity_index = 7
+    first.annotated_components.pop("a_b")
+    first.non_ephemeral_components.clear()
+
+    second = cache.lookup(circuit, [], "second")
+    assert second.annotated_components["a_b"].output_data["out"].validity_index is None
+    assert second.required_validity_markers == 0
+
+
+def test_cache_invalidated_by_mutation():
+    circuit = make_circuit()
+    cache = GenerationMetadataCache()
+
+    before = cache.lookup(circuit, [], "Struct")
+    assert before.required_validity_markers == 0
+
+    circuit.lookup("a_b").force_stored()
+
+    after = cache.lookup(circuit, [], "Struct")
+    assert after.annotated_components is not before.annotated_components
+    assert after.required_validity_markers == 1
+
+
+def no_format(contents: List[str]) -> List[str]:
+    return contents
+
+
+def count_hashes(monkeypatch, circuit: CircuitBuilder) -> List[int]:
+    calls = [0]
+    content_hash = circuit.content_hash
+
+    def counted() -> str:
+        calls[0] += 1
+        return content_hash()
+
+    monkeypatch.setattr(circuit, "content_hash", counted)
+    return calls
+
+
+def test_frozen_circuit_hashed_once(monkeypatch):
+    circuit = make_circuit()
+    cache = GenerationMetadataCache()
+    calls = count_hashes(monkeypatch, circuit)
+
+    cache.freeze(circuit)
+    first = cache.lookup(circuit, [], "first")
+    second = cache.lookup(circuit, [], "second")
+
+    assert calls[0] == 1
+    assert first.annotated_components == second.annotated_components
+
+    cache.thaw(circuit)
+    circuit.lookup("a_b").force_stored()
+
+    assert cache.lookup(circuit, [], "Struct").required_validity_markers == 1
+    assert calls[0] == 2
+
+
+def test_emission_hashes_once(monkeypatch, tmp_path):
+    circuit = make_circuit()
+    circuit.add_call_struct("AB", CallStruct.from_inputs(a="int", b="int"))
+    circuit.add_call_group("trigger_ab", CallGroup("AB", {"a": "a", "b": "b"}))
+    calls = count_hashes(monkeypatch, circuit)
+
+    options = CallStructOptions(
+        struct_name="Struct", struct_header="header", call_name="trigger_ab"
+    )
+    emissions = [
+        CallEmission("trigger_ab.cc", options),
+        StructEmission("header.hh", "Struct"),
+        InitEmission(
+            "init.cc", InitStructOptions(struct_name="Struct", struct_header="header")
+        ),
+    ]
+    config = CoreLoaderConfig(root_cppcuit_path="", root_signals_path="")
+
+    emit_circuit_files(
+        emissions, str(tmp_path), config, circuit, no_format, max_workers=1
+    )
+
+    assert calls[0] == 1
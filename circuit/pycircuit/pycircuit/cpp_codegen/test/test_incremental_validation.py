@@ -0,0 +1,58 @@
+import pytest
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.definition import Definition
+
+
+def make_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "int")
+        b = circuit.get_external("b", "int")
+
+        a_b = a + b
+        circuit.rename_component(a_b, "a_b")
+        a_b_b = a_b + b
+        circuit.rename_component(a_b_b, "a_b_b")
+
+    return circuit
+
+
+def test_definitions_validated_once(monkeypatch):
+    circuit = make_circuit()
+
+    validated = []
+    original = Definition.validate
+
+    def counting_validate(self):
+        validated.append(self)
+        original(self)
+
+    monkeypatch.setattr(Definition, "validate", counting_validate)
+
+    circuit.invalidate_validation()
+    circuit.validate()
+    circuit.validate()
+
+    assert len(validated) == len({id(defin) for defin in validated})
+
+
+def test_unchanged_components_skipped(monkeypatch):
+    circuit = make_circuit()
+    circuit.validate()
+
+    component = circuit.lookup("a_b")
+    monkeypatch.setattr(component, "validate", lambda _: pytest.fail("revalidated a_b"))
+
+    circuit.validate()
+
+
+def test_mutated_component_revalidated():
+    circuit = make_circuit()
+    circuit.validate()
+
+    circuit.lookup("a_b").class_generics["bogus"] = "int"
+
+    with pytest.raises(ValueError, match="bogus"):
+        circuit.validate()
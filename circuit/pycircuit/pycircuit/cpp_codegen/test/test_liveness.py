@@ -0,0 +1,51 @@
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.liveness import (
+    find_dead_components,
+    prune_dead_components,
+)
+from pycircuit.cpp_codegen.generation_metadata import generate_global_metadata
+
+
+def make_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "int")
+        b = circuit.get_external("b", "int")
+
+        a_b = a + b
+        circuit.rename_component(a_b, "a_b")
+        stored = a_b * b
+        circuit.rename_component(stored, "stored")
+        stored.force_stored()
+
+        dead = a_b - b
+        circuit.rename_component(dead, "dead")
+        dead_child = dead * a
+        circuit.rename_component(dead_child, "dead_child")
+
+    return circuit
+
+
+def test_finds_dead_components():
+    circuit = make_circuit()
+
+    assert find_dead_components(circuit) == ["dead", "dead_child"]
+    assert find_dead_components(circuit, keep=[circuit.lookup("dead")]) == [
+        "dead_child"
+    ]
+
+
+def test_prune_removes_from_generation():
+    circuit = make_circuit()
+
+    report = prune_dead_components(circuit)
+
+    assert list(report.removed.keys()) == ["dead", "dead_child"]
+    assert report.remaining == 2
+    assert list(circuit.components.keys()) == ["a_b", "stored"]
+    assert not circuit.consumers_of_component("dead")
+
+    metadata = generate_global_metadata(circuit, [], "Struct")
+    assert set(metadata.annotated_components.keys()) == {"a_b", "stored"}
@@ -0,0 +1,59 @@
+import pytest
+from pycircuit.cpp_codegen.name_lookup import (
+    generate_name_dispatch,
+    generate_name_table,
+)
+
+
+def test_name_dispatch():
+    assert (
+        generate_name_dispatch(
+            "thing",
+            "__input__",
+            [("b", "return 2;"), ("a", "return 1;")],
+            "return 0;",
+        )
+        == """\
+static constexpr std::array<std::string_view, 2> __thing_names__ = {
+    "a",
+    "b",
+};
+static_assert(std::is_sorted(__thing_names__.begin(), __thing_names__.end()));
+
+const std::string_view __thing_name__ = __input__;
+const auto __thing_found__ = std::lower_bound(__thing_names__.begin(), __thing_names__.end(), __thing_name__);
+const std::size_t __thing_index__ =
+    (__thing_found__ != __thing_names__.end() && *__thing_found__ == __thing_name__)
+        ? __thing_found__ - __thing_names__.begin()
+        : __thing_names__.size();
+
+switch (__thing_index__) {
+case 0: { // a
+return 1;
+}
+case 1: { // b
+return 2;
+}
+default:
+    break;
+}
+
+return 0;"""
+    )
+
+
+def test_empty_dispatch():
+    dispatch = generate_name_dispatch("thing", "__input__", [], "return 0;")
+
+    assert "std::array<std::string_view, 0> __thing_names__ = {\n};" in dispatch
+    assert "case" not in dispatch
+
+
+def test_rejects_duplicate_names():
+    with pytest.raises(ValueError):
+        generate_name_dispatch("thing", "__input__", [("a", ""), ("a", "")], "")
+
+
+def test_rejects_unsorted_table():
+    with pytest.raises(ValueError):
+        generate_name_table("__thing_names__", ["b", "a"])
@@ -0,0 +1,98 @@
+import dataclasses
+from collections import OrderedDict
+
+from pycircuit.cpp_codegen.call_generation.find_children_of import CalledComponent
+from pycircuit.cpp_codegen.generation_metadata import (
+    VALIDITY_WORD_BITS,
+    AnnotatedComponent,
+    OutputMetadata,
+    group_validity_markers,
+    validity_marker_path,
+    validity_storage_declaration,
+)
+from pycircuit.cpp_codegen.struct_generation.generate_val_load import (
+    generate_check_for_loadable_output,
+)
+from pycircuit.cpp_codegen.test.test_common import (
+    AB_CALLSET,
+    OUT_B,
+    basic_annotated,
+    basic_component,
+)
+
+
+def annotated_with_markers(name: str, markers: int) -> AnnotatedComponent:
+    return AnnotatedComponent(
+        component=dataclasses.replace(basic_component(), name=name),
+        output_data={
+            f"out_{idx}": OutputMetadata(validity_index=idx, is_value_ephemeral=False)
+            for idx in range(markers)
+        },
+        call_root="",
+        class_generics="",
+    )
+
+
+def called(annotated: AnnotatedComponent) -> CalledComponent:
+    return CalledComponent(callset=AB_CALLSET, component=annotated.component)
+
+
+def indices_of(annotated: AnnotatedComponent):
+    return [metadata.validity_index for metadata in annotated.output_data.values()]
+
+
+def test_marker_paths():
+    assert validity_marker_path("root", 70, packed=False) == "root[70]"
+    assert validity_marker_path("root", 70, packed=True) == "ValidityBit(root[1], 6)"
+
+    assert validity_storage_declaration(65, packed=False) == "bool is_valid[65];"
+    assert validity_storage_declaration(65, packed=True) == "ValidityWord is_valid[2];"
+
+
+def test_packs_each_trigger_into_words():
+    (a, b, c, shared, unreached) = (
+        annotated_with_markers("a", 40),
+        annotated_with_markers("b", 30),
+        annotated_with_markers("c", 10),
+        annotated_with_markers("shared", 2),
+        annotated_with_markers("unreached", 1),
+    )
+    components = OrderedDict(
+        (annotated.component.name, annotated)
+        for annotated in [unreached, a, b, c, shared]
+    )
+
+    bits = group_validity_markers(
+        components,
+        [
+            [called(a), called(shared)],
+            # Doesn't fit in what a leaves of the first word
+            [called(b), called(shared)],
+            [called(c)],
+        ],
+        VALIDITY_WORD_BITS,
+    )
+
+    assert indices_of(a) == list(range(40))
+    assert indices_of(shared) == [40, 41]
+    assert indices_of(b) == list(range(64, 94))
+    assert indices_of(c) == list(range(94, 104))
+    assert indices_of(unreached) == [104]
+    assert bits == 105
+
+
+def test_packed_output_handle():
+    annotated = basic_annotated()
+    annotated.output_data[OUT_B] = OutputMetadata(
+        validity_index=70, is_value_ephemeral=False, packed_validity=True
+    )
+
+    check = generate_check_for_loadable_output(
+        annotated, OUT_B, annotated.component.definition.output_specs[OUT_B]
+    )
+
+    assert (
+        "reinterpret_cast<const char *>(&this->outputs.is_valid[1]) "
+        "+ validity_byte_of(6);" in check
+    )
+    assert "RawOutputHandle(value_offset, valid_offset, validity_mask_of(6));" in check
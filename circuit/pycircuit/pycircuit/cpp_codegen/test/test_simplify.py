@@ -0,0 +1,181 @@
+from pycircuit.circuit_builder.circuit import CallGroup, CallStruct, CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.constant import make_double
+from pycircuit.circuit_builder.simplify import simplify_circuit
+from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
+from pycircuit.cpp_codegen.call_generation.generate_call_for_trigger import (
+    generate_external_call_body_for,
+)
+from pycircuit.cpp_codegen.generation_metadata import compute_global_metadata
+
+
+def parents_of(circuit: CircuitBuilder, name: str):
+    return [
+        output.parent
+        for comp_input in circuit.lookup(name).inputs.values()
+        for output in comp_input.outputs()
+    ]
+
+
+def test_folds_constants():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        folded = make_double(2.0) * make_double(0.5) - make_double(0.25)
+        out = x + folded
+        circuit.rename_component(out, "out")
+
+    report = simplify_circuit(circuit)
+
+    assert len(report.folded) == 2
+    assert parents_of(circuit, "out") == ["external", "constant_double_0_75"]
+    assert list(circuit.components.keys()).index("constant_double_0_75") < list(
+        circuit.components.keys()
+    ).index("out")
+    circuit.validate()
+
+
+def x_call_body(simplify: bool) -> str:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        folded = make_double(2.0) * make_double(0.5) - make_double(0.25)
+        out = x + folded
+        circuit.rename_component(out, "out")
+        out.force_stored()
+
+    circuit.add_call_struct("X", CallStruct.from_inputs(x="double"))
+    circuit.add_call_group("trigger_x", CallGroup("X", {"x": "x"}))
+
+    if simplify:
+        simplify_circuit(circuit)
+
+    meta = CallMetaData(triggered={"x"}, call_name="trigger_x")
+    return generate_external_call_body_for(
+        meta, compute_global_metadata(circuit, [meta], "Struct")
+    )
+
+
+def test_folding_makes_constant_arithmetic_valid():
+    # Nothing triggers the arithmetic over constants, so out never sees it valid
+    unfolded = x_call_body(simplify=False)
+    assert "bool is_b_v = outputs_is_valid[0];" in unfolded
+    assert unfolded.count("TypeAlias::call(") == 1
+
+    # Once folded, out fires with x
+    folded = x_call_body(simplify=True)
+    assert "constexpr bool constant_double_0_75_out_IV = true;" in folded
+    assert "bool is_b_v = constant_double_0_75_out_IV;" in folded
+
+
+def test_removes_identities_of_doubles():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "int")
+        param = circuit.make_parameter("param")
+
+        param_out = (make_double(1.0) * param) + make_double(0.0)
+        circuit.rename_component(param_out, "param_out")
+        x_out = (x * make_double(1.0)) / make_double(2.0)
+        circuit.rename_component(x_out, "x_out")
+
+        out = param_out + x_out
+        circuit.rename_component(out, "out")
+
+    report = simplify_circuit(circuit, keep=[param_out])
+
+    # The product is removed, but the kept sum isn't, and x might be an int
+    assert len(report.identities) == 1
+    assert parents_of(circuit, "param_out") == ["param", "constant_double_0_0"]
+    assert len(parents_of(circuit, "x_out")) == 2
+    circuit.validate()
+
+
+def test_merges_commuted_operands():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.make_parameter("a")
+        b = circuit.make_parameter("b")
+
+        a_b = a * b
+        b_a = b * a
+        out = a_b - b_a
+        circuit.rename_component(out, "out")
+
+        stored = b + a
+        stored.force_stored()
+        stored_dup = a + b
+        stored_out = stored - stored_dup
+        circuit.rename_component(stored_out, "stored_out")
+
+    report = simplify_circuit(circuit)
+
+    assert report.merged == {b_a.name: a_b.name, stored_dup.name: stored.name}
+    assert parents_of(circuit, "out") == [a_b.name, a_b.name]
+    assert parents_of(circuit, "stored_out") == [stored.name, stored.name]
+    # Parameters look identical, but are initialized by name
+    assert "a" in circuit.components and "b" in circuit.components
+    circuit.validate()
+
+
+def test_merges_into_later_stored_duplicate():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.make_parameter("a")
+        b = circuit.make_parameter("b")
+
+        edge = a + b
+        doubled = edge * edge
+        circuit.rename_component(doubled, "doubled")
+
+        sampled = b + a
+        circuit.rename_component(sampled, "sampled_edge")
+        sampled.force_stored()
+        out = sampled - doubled
+        circuit.rename_component(out, "out")
+
+    report = simplify_circuit(circuit)
+
+    assert report.merged == {edge.name: "sampled_edge"}
+    assert edge.name not in circuit.components
+    assert circuit.components["sampled_edge"].output_options["out"].force_stored
+    assert parents_of(circuit, "doubled") == ["sampled_edge", "sampled_edge"]
+    assert parents_of(circuit, "out") == ["sampled_edge", "doubled"]
+    circuit.validate()
+
+
+def kept_products(keep_first: bool, keep_second: bool):
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.make_parameter("a")
+        b = circuit.make_parameter("b")
+
+        first = a * b
+        second = b * a
+        out = first + second
+        circuit.rename_component(out, "out")
+
+    keep = [c for (c, kept) in [(first, keep_first), (second, keep_second)] if kept]
+    report = simplify_circuit(circuit, keep=keep)
+    circuit.validate()
+    return (circuit, report, first.name, second.name)
+
+
+def test_never_merges_kept_components():
+    (circuit, report, first, second) = kept_products(True, True)
+    assert report.merged == {}
+    assert parents_of(circuit, "out") == [first, second]
+
+    (circuit, report, first, second) = kept_products(False, True)
+    assert report.merged == {first: second}
+    assert parents_of(circuit, "out") == [second, second]
+
+    (circuit, report, first, second) = kept_products(True, False)
+    assert report.merged == {second: first}
+    assert parents_of(circuit, "out") == [first, first]
@@ -0,0 +1,128 @@
+"""Finds where non-finite values first appear in a model, for every row at once
+
+Instead of re-running the model on a single bad row and printing every operator,
+a hook on the schedule of the model checks each operator output as it runs.
+For each row, the first operator whose output is non-finite there is recorded,
+along with summary statistics of every operator output.
+"""
+
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.operator import OperatorFn, OperatorSchedule
+from pycircuit.differentiator.tensor import CircuitTensor
+
+
+@dataclass
+class NodeSummary:
+    output: Optional[ComponentOutput]
+    operator_name: str
+    # Non-finite values, counting every element of stacked outputs
+    nonfinite: int
+    # Statistics of the finite values, nan if there are none
+    minimum: float
+    maximum: float
+    mean: float
+
+
+@dataclass
+class NanDiagnostics:
+    summaries: List[NodeSummary]
+    # Per row, the index into summaries of the first non-finite output, or -1
+    first_nonfinite: torch.Tensor
+
+    def bad_rows(self) -> torch.Tensor:
+        return torch.nonzero(self.first_nonfinite >= 0).reshape(-1)
+
+    def first_output(self, row: int) -> Optional[NodeSummary]:
+        idx = int(self.first_nonfinite[row])
+        if idx < 0:
+            return None
+        return self.summaries[idx]
+
+    def culprits(self) -> Dict[int, int]:
+        """Returns how many rows first went non-finite at each index of summaries"""
+        (indices, counts) = torch.unique(
+            self.first_nonfinite[self.first_nonfinite >= 0], return_counts=True
+        )
+        return {
+            int(idx): int(count)
+            for (idx, count) in sorted(
+                zip(indices, counts), key=lambda pair: -int(pair[1])
+            )
+        }
+
+    def report(self, limit: int = 10) -> str:
+        bad_rows = self.bad_rows()
+        lines = [f"{len(bad_rows)} of {len(self.first_nonfinite)} rows are non-finite"]
+
+        for (idx, count) in list(self.culprits().items())[:limit]:
+            summary = self.summaries[idx]
+            rows = bad_rows[self.first_nonfinite[bad_rows] == idx][:5].tolist()
+            lines.append(
+                f"{count} rows first non-finite at operator {idx} "
+                f"{summary.operator_name} {summary.output}, i.e. rows {rows}. "
+                f"Finite values in [{summary.minimum}, {summary.maximum}] "
+                f"with mean {summary.mean}"
+            )
+
+        return "\n".join(lines)
+
+
+def _summarize(operator: OperatorFn, output: CircuitTensor) -> NodeSummary:
+    finite = torch.isfinite(output)
+    values = output[finite].double()
+    if len(values) > 0:
+        (minimum, maximum, mean) = (
+            float(values.min()),
+            float(values.max()),
+            float(values.mean()),
+        )
+    else:
+        (minimum, maximum, mean) = (float("nan"),) * 3
+    return NodeSummary(
+        output=operator.output,
+        operator_name=operator.name(),
+        nonfinite=int(output.numel() - int(finite.sum())),
+        minimum=minimum,
+        maximum=maximum,
+        mean=mean,
+    )
+
+
+def diagnose(
+    schedule: OperatorSchedule, rows: int, run: Callable[[], object]
+) -> NanDiagnostics:
+    """Calls run with a hook on schedule, which must evaluate rows rows
+
+    Outputs without a row dimension (i.e. summaries and parameters) are
+    non-finite for every row if they are anywhere. Stacked outputs are
+    non-finite for a row if any value stacked for it is
+    """
+    summaries: List[NodeSummary] = []
+    first_nonfinite = torch.full((rows,), -1, dtype=torch.long)
+
+    def hook(operator: OperatorFn, output: CircuitTensor):
+        idx = len(summaries)
+        summaries.append(_summarize(operator, output))
+        if summaries[-1].nonfinite == 0:
+            return
+
+        nonfinite = ~torch.isfinite(output)
+        if nonfinite.dim() > 1:
+            nonfinite = nonfinite.reshape(-1, nonfinite.shape[-1]).any(dim=0)
+        if nonfinite.numel() == 1:
+            nonfinite = nonfinite.reshape(-1).expand(rows)
+        first_nonfinite[nonfinite & (first_nonfinite < 0)] = idx
+
+    schedule.hooks.append(hook)
+    try:
+        with torch.no_grad():
+            run()
+    finally:
+        schedule.hooks.remove(hook)
+
+    return NanDiagnostics(summaries=summaries, first_nonfinite=first_nonfinite)
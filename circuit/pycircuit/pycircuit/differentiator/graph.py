@@ -1,6 +1,16 @@
 from dataclasses import dataclass, field
 from dataclasses_json import DataClassJsonMixin, config
-from typing import Any, Dict, List, Sequence, Set
+from typing import (
+    Any,
+    Callable,
+    Container,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.circuit_builder.component import (
     HasOutput,
@@ -9,15 +19,19 @@ from pycircuit.circuit_builder.component import (
     ArrayComponentInput,
 )
 from pycircuit.differentiator.operators.all_operators import ALL_OPERATORS
-from pycircuit.circuit_builder.component import InputBatch
 from pycircuit.differentiator.tensor import CircuitTensor
 
 from pycircuit.differentiator.tensor import (
     CircuitParameter,
+    Precision,
     make_parameter,
     make_constant,
 )
-from pycircuit.differentiator.operator import OperatorFn, DagOperator
+from pycircuit.differentiator.operator import (
+    BatchedDagOperator,
+    DagOperator,
+    OperatorFn,
+)
 from pycircuit.differentiator.tensor import Module
 from pycircuit.differentiator.tensor import make_empty
 
@@ -88,64 +102,92 @@ class OperatorNode(DataClassJsonMixin):
 Node = EdgeNode | OperatorNode | ParamNode | ConstantNode
 
 
-def _extract_array_batch(
-    circuit: CircuitData,
-    array: Sequence[InputBatch],
-    cache: Dict[ComponentOutput, Node],
-    block_propagating: Set[ComponentOutput],
-) -> List[NodeBatch]:
-    batches = [NodeBatch(nodes=batch.d_inputs.copy()) for batch in array]
-
-    for batch in batches:
-        for output in batch.nodes.values():
-            _traverse_circuit_from(circuit, output, cache, block_propagating)
-
-    return batches
+def node_inputs(node: Node) -> List[ComponentOutput]:
+    if not isinstance(node, OperatorNode):
+        return []
+    inputs = list(node.single_inputs.values())
+    for batches in node.array_inputs.values():
+        for batch in batches:
+            inputs += batch.nodes.values()
+    return inputs
+
+
+def post_order(
+    root: ComponentOutput,
+    inputs_of: Callable[[ComponentOutput], List[ComponentOutput]],
+    done: Container[ComponentOutput],
+) -> Iterator[ComponentOutput]:
+    """Yields root and everything it reads that isn't done, each after its inputs
+
+    Outputs come in the order a recursive traversal would finish them in,
+    without being limited by the depth of the graph. Callers are expected
+    to mark each output done (i.e. cache it) before taking the next one
+    """
+    expanding: Set[ComponentOutput] = set()
+    stack = [(root, False)]
+    while stack:
+        (output, expanded) = stack.pop()
+        if output in done:
+            continue
+        if expanded:
+            expanding.discard(output)
+            yield output
+            continue
+        if output in expanding:
+            raise ValueError(f"Graph has a cycle through {output}")
+        expanding.add(output)
+        stack.append((output, True))
+        for input in reversed(inputs_of(output)):
+            if input not in done:
+                stack.append((input, False))
 
 
 def _do_traverse_circuit_from(
     circuit: CircuitData,
     root_output: ComponentOutput,
-    cache: Dict[ComponentOutput, Node],
     block_propagating: Set[ComponentOutput],
-) -> Node:
+) -> Tuple[Node, List[ComponentOutput]]:
+    """Returns the node for root_output, and the outputs it reads in input order"""
 
     root_parent = root_output.parent
 
     if root_parent == "external":
-        return EdgeNode(output=root_output)
+        return (EdgeNode(output=root_output), [])
 
     if root_output in block_propagating:
-        return EdgeNode(output=root_output)
+        return (EdgeNode(output=root_output), [])
 
     component = circuit.components[root_parent]
 
     if component.options(root_output.output_name).block_propagation:
-        return EdgeNode(output=root_output)
+        return (EdgeNode(output=root_output), [])
 
     op_name = component.definition.differentiable_operator_name
     match op_name:
         case None:
-            return EdgeNode(output=root_output)
+            return (EdgeNode(output=root_output), [])
         case "constant":
-            return ConstantNode(float(component.definition.metadata["constant_value"]))
+            value = float(component.definition.metadata["constant_value"])
+            return (ConstantNode(value), [])
         case "parameter":
-            return ParamNode(name=root_parent)
+            return (ParamNode(name=root_parent), [])
         case name if name in ALL_OPERATORS:
             single_inputs: Dict[str, ComponentOutput] = {}
             array_inputs: Dict[str, List[NodeBatch]] = {}
+            reads: List[ComponentOutput] = []
 
             for (input_name, input) in component.inputs.items():
                 match input:
                     case SingleComponentInput(input=single):
                         single_inputs[input_name] = single
-                        _traverse_circuit_from(
-                            circuit, single, cache, block_propagating
-                        )
+                        reads.append(single)
                     case ArrayComponentInput(inputs=array):
-                        array_inputs[input_name] = _extract_array_batch(
-                            circuit, array, cache, block_propagating
-                        )
+                        batches = [
+                            NodeBatch(nodes=batch.d_inputs.copy()) for batch in array
+                        ]
+                        array_inputs[input_name] = batches
+                        for batch in batches:
+                            reads += batch.nodes.values()
 
             rval = OperatorNode(
                 output=root_output,
@@ -156,7 +198,7 @@ def _do_traverse_circuit_from(
                     "include_param_names", True
                 ),
             )
-            return rval
+            return (rval, reads)
 
     raise ValueError(f"Operator name {op_name} not in known tensor operators")
 
@@ -167,17 +209,19 @@ def _traverse_circuit_from(
     cache: Dict[ComponentOutput, Node],
     block_propagating: Set[ComponentOutput],
 ):
-    if root_output in cache:
-        return cache[root_output]
-    rval = _do_traverse_circuit_from(circuit, root_output, cache, block_propagating)
-    cache[root_output] = rval
-    return rval
+    # Nodes are built when first reached, but only cached once their inputs are
+    pending: Dict[ComponentOutput, Node] = {}
 
+    def inputs_of(output: ComponentOutput) -> List[ComponentOutput]:
+        (pending[output], reads) = _do_traverse_circuit_from(
+            circuit, output, block_propagating
+        )
+        return reads
+
+    for output in post_order(root_output, inputs_of, cache):
+        cache[output] = pending.pop(output)
 
-# TODO - should consider how to create minimal trees
-# Much of the 'differentiable' computation is not attached to parameters
-# and just condenses already-sampled data down.
-# We should instead try and discover the minimum-sampling graph
+    return cache[root_output]
 
 
 @dataclass
@@ -193,18 +237,31 @@ class Graph(DataClassJsonMixin):
         circuit: CircuitData,
         root: HasOutput,
         block_propagating: Set[ComponentOutput] = set(),
+        minimal_sampling: bool = False,
     ) -> "Graph":
+        """Discovers the graph computing root, up to externals and blocked outputs
+
+        With minimal_sampling, parameter-free subgraphs are collapsed into
+        the fewest recorded edges (see minimal_sampling_graph)
+        """
         circuit.validate()
         node_map: Dict[ComponentOutput, Node] = {}
         _traverse_circuit_from(circuit, root.output(), node_map, block_propagating)
-        return Graph(root=root.output(), nodes=node_map)
+        graph = Graph(root=root.output(), nodes=node_map)
+
+        if minimal_sampling:
+            from pycircuit.differentiator.minimal_sampling import (
+                minimal_sampling_graph,
+            )
+
+            graph = minimal_sampling_graph(graph)
+
+        return graph
 
     def find_edges(self) -> List[ComponentOutput]:
 
         all_edge_outputs = {
-            output
-            for (output, node) in self.nodes.items()
-            if isinstance(node, EdgeNode)
+            node.output for node in self.nodes.values() if isinstance(node, EdgeNode)
         }
         return sorted(all_edge_outputs, key=output_to_name)
 
@@ -221,14 +278,61 @@ class Graph(DataClassJsonMixin):
         self,
         data: Dict[ComponentOutput, CircuitTensor],
         parameters: Dict[str, CircuitParameter],
+        checkpoint_segments: int = 0,
+        precision: Optional[Precision] = None,
     ) -> DagOperator:
+        """Builds a module evaluating the graph over data
+
+        With a precision, data and constants are cast to its dtype and reductions
+        accumulate in its accumulation dtype. Parameters are used as they are
+        """
         running_storage: List[CircuitTensor] = []
         ordered_operators: List[OperatorFn] = []
         self._traverse_model(
             self.root, data, parameters, dict(), running_storage, ordered_operators
         )
+        _apply_precision(running_storage, ordered_operators, precision)
 
-        return DagOperator(ordered=ordered_operators, storage=running_storage)
+        return DagOperator(
+            ordered=ordered_operators,
+            storage=running_storage,
+            checkpoint_segments=checkpoint_segments,
+        )
+
+    def traverse_model_batched(
+        self,
+        parameters: Dict[str, CircuitParameter],
+        roots: Optional[List[ComponentOutput]] = None,
+        checkpoint_segments: int = 0,
+        precision: Optional[Precision] = None,
+    ) -> BatchedDagOperator:
+        """Like traverse_model_into, but the edges are passed in on every forward
+
+        If roots are given, the module computes all of them
+        (sharing any common nodes) and returns a list of their values
+        """
+        placeholders = {edge: make_empty() for edge in self.find_edges()}
+        running_storage: List[CircuitTensor] = []
+        ordered_operators: List[OperatorFn] = []
+        cache: Dict[ComponentOutput, int] = dict()
+        for root in roots if roots is not None else [self.root]:
+            self._traverse_model(
+                root,
+                placeholders,
+                parameters,
+                cache,
+                running_storage,
+                ordered_operators,
+            )
+        _apply_precision(running_storage, ordered_operators, precision)
+
+        return BatchedDagOperator(
+            ordered=ordered_operators,
+            storage=running_storage,
+            edge_slots={edge: cache[edge] for edge in placeholders if edge in cache},
+            output_slots=[cache[root] for root in roots] if roots is not None else None,
+            checkpoint_segments=checkpoint_segments,
+        )
 
     def mark_stored(self, circuit: CircuitData):
         for edge in self.find_edges():
@@ -252,17 +356,14 @@ class Graph(DataClassJsonMixin):
                 array_inputs=array,
                 param_names=True,
             ):
-                if output in cache:
-                    return cache[output]
                 single_ops = {
-                    s_name: self._traverse_pretty(s_node, cache)
-                    for (s_name, s_node) in single.items()
+                    s_name: cache[s_node] for (s_name, s_node) in single.items()
                 }
 
                 array_ops = {
                     a_name: [
                         {
-                            b_name: self._traverse_pretty(b_node, cache)
+                            b_name: cache[b_node]
                             for (b_name, b_node) in batch.nodes.items()
                         }
                         for batch in a_batches
@@ -283,18 +384,11 @@ class Graph(DataClassJsonMixin):
                 param_names=False,
             ):
 
-                if output in cache:
-                    return cache[output]
-                single_ops_l = [
-                    self._traverse_pretty(s_node, cache) for s_node in single.values()
-                ]
+                single_ops_l = [cache[s_node] for s_node in single.values()]
 
                 array_ops_l = [
                     [
-                        [
-                            self._traverse_pretty(b_node, cache)
-                            for b_node in batch.nodes.values()
-                        ]
+                        [cache[b_node] for b_node in batch.nodes.values()]
                         for batch in a_batches
                     ]
                     for a_batches in array.values()
@@ -302,15 +396,15 @@ class Graph(DataClassJsonMixin):
 
                 return {opname: single_ops_l + array_ops_l}
 
+    def _inputs_of(self, output: ComponentOutput) -> List[ComponentOutput]:
+        return node_inputs(self.nodes[output])
+
     def _traverse_pretty(
         self, node_output: ComponentOutput, cache: Dict[ComponentOutput, Any]
     ) -> Any:
-        if node_output in cache:
-            return cache[node_output]
-
-        rval = self._do_traverse_pretty(node_output, cache)
-        cache[node_output] = rval
-        return rval
+        for output in post_order(node_output, self._inputs_of, cache):
+            cache[output] = self._do_traverse_pretty(output, cache)
+        return cache[node_output]
 
     def _do_traverse_model(
         self,
@@ -346,22 +440,13 @@ class Graph(DataClassJsonMixin):
                 operator = ALL_OPERATORS[opname]
 
                 singles = {
-                    s_name: self._traverse_model(
-                        s_node, data, parameters, cache, running_storage, operator_list
-                    )
+                    s_name: cache[s_node]
                     for (s_name, s_node) in node.single_inputs.items()
                 }
                 arrays = {
                     b_name: [
                         {
-                            b_id_name: self._traverse_model(
-                                b_node,
-                                data,
-                                parameters,
-                                cache,
-                                running_storage,
-                                operator_list,
-                            )
+                            b_id_name: cache[b_node]
                             for (b_id_name, b_node) in batch.nodes.items()
                         }
                         for batch in array
@@ -385,30 +470,73 @@ class Graph(DataClassJsonMixin):
         node_output: ComponentOutput,
         data: Dict[ComponentOutput, CircuitTensor],
         parameters: Dict[str, CircuitParameter],
-        cache: Dict[ComponentOutput, OperatorFn],
+        cache: Dict[ComponentOutput, int],
         running_storage: List[CircuitTensor],
         operator_list: List[OperatorFn],
-    ) -> OperatorFn:
-        if node_output in cache:
-            return cache[node_output]
-        rval = self._do_traverse_model(
-            node_output, data, parameters, cache, running_storage, operator_list
-        )
-        cache[node_output] = rval
-        return rval
+    ) -> int:
+        for output in post_order(node_output, self._inputs_of, cache):
+            cache[output] = self._do_traverse_model(
+                output, data, parameters, cache, running_storage, operator_list
+            )
+        return cache[node_output]
+
+
+def _apply_precision(
+    storage: List[CircuitTensor],
+    operators: List[OperatorFn],
+    precision: Optional[Precision],
+):
+    if precision is None:
+        return
+
+    for (slot, tensor) in enumerate(storage):
+        # Parameters are shared with the model, so can't be replaced by a cast copy
+        if tensor.is_floating_point() and not isinstance(tensor, CircuitParameter):
+            storage[slot] = tensor.to(precision.dtype())
+
+    for operator in operators:
+        operator.set_accumulate_dtype(precision.accumulate_dtype())
 
 
 class Model:
-    def __init__(self, graph: Graph, initial_values: Dict[str, CircuitTensor] = {}):
+    def __init__(
+        self,
+        graph: Graph,
+        initial_values: Dict[str, CircuitTensor] = {},
+        vectorize: bool = True,
+        roots: Optional[List[ComponentOutput]] = None,
+        precision: Precision = Precision.Float64,
+    ):
+        if vectorize:
+            from pycircuit.differentiator.vectorize import vectorize_graph
+
+            graph = vectorize_graph(graph, keep=roots or [])
+
         self._graph = graph
+        self._roots = roots
+        self._precision = precision
         parameter_names = graph.find_parameter_names()
 
         self._parameters = {
-            name: make_parameter(initial_values.get(name)) for name in parameter_names
+            name: make_parameter(initial_values.get(name), precision.dtype())
+            for name in parameter_names
         }
 
-    def create_module(self, data: Dict[ComponentOutput, CircuitTensor]):
-        return self._graph.traverse_model_into(data, self._parameters)
+    def create_module(
+        self, data: Dict[ComponentOutput, CircuitTensor], checkpoint_segments: int = 0
+    ):
+        return self._graph.traverse_model_into(
+            data, self._parameters, checkpoint_segments, self._precision
+        )
+
+    def create_batched_module(self, checkpoint_segments: int = 0) -> BatchedDagOperator:
+        """Edges of each batch should already be in the dtype of the precision"""
+        return self._graph.traverse_model_batched(
+            self._parameters, self._roots, checkpoint_segments, self._precision
+        )
+
+    def precision(self) -> Precision:
+        return self._precision
 
     def parameters(self) -> Dict[str, CircuitParameter]:
         return self._parameters.copy()
@@ -0,0 +1,113 @@
+"""Merges graphs which share parts of a circuit, so they can be trained together
+
+Graphs discovered from one circuit (i.e. trade pressure, depth and the overall
+prediction of a market) share most of their nodes. Training each separately
+recomputes the shared nodes once per graph.
+
+merge_graphs combines graphs into one with a root per head. Nodes are shared
+when they compute the same thing, meaning the same output, operator and
+(recursively) shared inputs. An output can differ between graphs, i.e. when one
+graph blocks propagation through it and samples it as an edge, and the other
+computes it. The first graph keeps the original output for those, and the others
+get a copy named after their head.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Set
+
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.graph import (
+    Graph,
+    Node,
+    NodeBatch,
+    OperatorNode,
+    node_inputs,
+    post_order,
+)
+
+
+@dataclass
+class JointGraph:
+    graph: Graph
+    heads: Dict[str, ComponentOutput]
+
+    def roots(self) -> List[ComponentOutput]:
+        return list(self.heads.values())
+
+
+def _post_order(graph: Graph) -> List[ComponentOutput]:
+    ordered: List[ComponentOutput] = []
+    visited: Set[ComponentOutput] = set()
+    for output in post_order(
+        graph.root, lambda output: node_inputs(graph.nodes[output]), visited
+    ):
+        visited.add(output)
+        ordered.append(output)
+    return ordered
+
+
+def _rename_inputs(node: Node, renamed: Dict[ComponentOutput, ComponentOutput]) -> Node:
+    if not isinstance(node, OperatorNode):
+        return node
+    return OperatorNode(
+        output=node.output,
+        operator_name=node.operator_name,
+        single_inputs={
+            input_name: renamed[input]
+            for (input_name, input) in node.single_inputs.items()
+        },
+        array_inputs={
+            input_name: [
+                NodeBatch(
+                    nodes={
+                        batch_name: renamed[input]
+                        for (batch_name, input) in batch.nodes.items()
+                    }
+                )
+                for batch in batches
+            ]
+            for (input_name, batches) in node.array_inputs.items()
+        },
+        param_names=node.param_names,
+    )
+
+
+def merge_graphs(graphs: Dict[str, Graph]) -> JointGraph:
+    if not graphs:
+        raise ValueError("No graphs to merge")
+
+    nodes: Dict[ComponentOutput, Node] = {}
+    # Every merged output a graph output was placed at, to share identical nodes
+    variants: Dict[ComponentOutput, List[ComponentOutput]] = {}
+    heads: Dict[str, ComponentOutput] = {}
+
+    for (head, graph) in graphs.items():
+        renamed: Dict[ComponentOutput, ComponentOutput] = {}
+        for output in _post_order(graph):
+            node = _rename_inputs(graph.nodes[output], renamed)
+
+            candidates = variants.setdefault(output, [])
+            shared = [merged for merged in candidates if nodes[merged] == node]
+            if shared:
+                renamed[output] = shared[0]
+                continue
+
+            merged = output
+            if merged in nodes:
+                merged = ComponentOutput(
+                    parent=f"{head}_{output.parent}", output_name=output.output_name
+                )
+                if merged in nodes:
+                    raise ValueError(
+                        f"Head {head} has two versions of {output}, "
+                        f"or its copy collides with another output"
+                    )
+            nodes[merged] = node
+            candidates.append(merged)
+            renamed[output] = merged
+
+        heads[head] = renamed[graph.root]
+
+    return JointGraph(
+        graph=Graph(nodes=nodes, root=next(iter(heads.values()))), heads=heads
+    )
@@ -0,0 +1,156 @@
+"""Collapses the parameter-free parts of a graph into sampled edges
+
+Discovery walks from the root all the way up to externals (or blocked outputs),
+so much of a graph isn't attached to any parameter and just condenses already
+sampled data down, i.e. decaying trades into a trade pressure. Training
+recomputes those subgraphs every epoch, and every external they read is
+recorded as a column of the samples.
+
+Since nothing about a parameter-free node changes during training, any such
+node can instead be recorded as it's computed by the circuit. The set
+of nodes to record is found as a minimum vertex cut between the sampled edges
+and the parameter-free nodes read by the rest of the graph. Of the cuts
+recording the fewest columns, the one closest to the parameters is taken,
+so as little as possible is left to compute in torch.
+
+Summary operators (mean, std) are parameters in the circuit and computed from
+the samples in torch, so they and everything downstream of them are kept.
+"""
+
+from typing import Dict, List, Set
+
+import networkx as nx
+
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.graph import (
+    ConstantNode,
+    EdgeNode,
+    Graph,
+    Node,
+    OperatorNode,
+    ParamNode,
+    node_inputs,
+)
+from pycircuit.differentiator.operators.summary_operators import SUMMARY_OPERATORS
+
+_SOURCE = "source"
+_SINK = "sink"
+
+
+def _is_trained(node: Node) -> bool:
+    match node:
+        case ParamNode():
+            return True
+        case OperatorNode(operator_name=name):
+            return name in SUMMARY_OPERATORS
+    return False
+
+
+def _find_trained(graph: Graph) -> Set[ComponentOutput]:
+    """Returns every output which is a parameter or depends on one"""
+    trained: Dict[ComponentOutput, bool] = {}
+
+    for start in graph.nodes:
+        stack = [start]
+        while stack:
+            output = stack[-1]
+            if output in trained:
+                stack.pop()
+                continue
+            pending = [
+                input
+                for input in node_inputs(graph.nodes[output])
+                if input not in trained
+            ]
+            if pending:
+                stack += pending
+                continue
+            stack.pop()
+            node = graph.nodes[output]
+            trained[output] = _is_trained(node) or any(
+                trained[input] for input in node_inputs(node)
+            )
+
+    return {output for (output, is_trained) in trained.items() if is_trained}
+
+
+def _find_cut(graph: Graph, trained: Set[ComponentOutput]) -> Set[ComponentOutput]:
+    """Returns the parameter-free outputs to record as edges"""
+    # Required outputs are parameter-free inputs of the trained part of the graph
+    required: Set[ComponentOutput] = set()
+    for output in trained:
+        for input in node_inputs(graph.nodes[output]):
+            if input not in trained:
+                required.add(input)
+    if graph.root not in trained:
+        required.add(graph.root)
+
+    # Every output is split into an in and out node joined by an edge of capacity 1,
+    # so cutting it costs one recorded column. Edges without a capacity are infinite
+    network = nx.DiGraph()
+    for (output, node) in graph.nodes.items():
+        if output in trained or isinstance(node, ConstantNode):
+            continue
+        network.add_edge(("in", output), ("out", output), capacity=1)
+        for input in node_inputs(node):
+            if not isinstance(graph.nodes[input], ConstantNode):
+                network.add_edge(("out", input), ("in", output))
+        if isinstance(node, EdgeNode):
+            network.add_edge(_SOURCE, ("in", output))
+
+    for output in required:
+        # Constants are free, there's nothing to record
+        if not isinstance(graph.nodes[output], ConstantNode):
+            network.add_edge(("out", output), _SINK)
+
+    if _SOURCE not in network or _SINK not in network:
+        return set()
+
+    (_, flow) = nx.maximum_flow(network, _SOURCE, _SINK)
+
+    # Nodes which can still reach the sink in the residual network.
+    # The cut is taken right below them, to record as close to the parameters as can be
+    reaches_sink = {_SINK}
+    stack = [_SINK]
+    while stack:
+        node = stack.pop()
+        for pred in network.predecessors(node):
+            capacity = network.edges[pred, node].get("capacity", float("inf"))
+            if pred not in reaches_sink and flow[pred][node] < capacity:
+                reaches_sink.add(pred)
+                stack.append(pred)
+        for succ in network.successors(node):
+            if succ not in reaches_sink and flow[node][succ] > 0:
+                reaches_sink.add(succ)
+                stack.append(succ)
+
+    return {
+        output
+        for output in graph.nodes
+        if ("out", output) in reaches_sink and ("in", output) not in reaches_sink
+    }
+
+
+def minimal_sampling_graph(graph: Graph) -> Graph:
+    """Returns a graph recording the fewest edges needed to train graph
+
+    Parameter-free nodes become edges where that records fewer columns,
+    and anything only they read is dropped
+    """
+    trained = _find_trained(graph)
+    cut = _find_cut(graph, trained)
+
+    nodes: Dict[ComponentOutput, Node] = {}
+    stack: List[ComponentOutput] = [graph.root]
+    while stack:
+        output = stack.pop()
+        if output in nodes:
+            continue
+        if output in cut:
+            nodes[output] = EdgeNode(output=output)
+            continue
+        node = graph.nodes[output]
+        nodes[output] = node
+        stack += node_inputs(node)
+
+    return Graph(nodes=nodes, root=graph.root)
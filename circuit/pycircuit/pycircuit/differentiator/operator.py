@@ -1,10 +1,17 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Set
+from dataclasses import dataclass
+from functools import partial
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set
 
 from pycircuit.circuit_builder.component import ComponentOutput
 
-from .tensor import CircuitTensor
+from .tensor import CircuitParameter, CircuitTensor
 import torch
+import torch.fx
+import torch.utils.checkpoint
+
+if TYPE_CHECKING:
+    from pycircuit.differentiator.diagnostics import NanDiagnostics
 
 VERBOSE = False
 
@@ -29,11 +36,30 @@ class OperatorFn(ABC, torch.nn.Module):
     def do_forward(self, tensors: List[CircuitTensor]):
         pass
 
+    @abstractmethod
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        """Emits this operator into graph, reading the nodes that do_forward reads the tensors of"""
+        pass
+
     # need to refactor this to not have hacks
 
     def set_output(self, output: ComponentOutput):
         self.output = output
 
+    def set_accumulate_dtype(self, dtype: Optional[torch.dtype]):
+        """Sets the dtype reductions (i.e. mean, std, sums) accumulate in
+
+        Results are still returned in the dtype of the inputs
+        """
+        self.accumulate_dtype = dtype
+
+    def input_slots(self) -> List[int]:
+        slots = list(self.single_mapping.values())
+        for batches in self.array_mapping.values():
+            for batch in batches:
+                slots += batch.values()
+        return slots
+
     def forward(self, tensors: List[CircuitTensor]):
         rval = self.do_forward(tensors)
         if VERBOSE:
@@ -65,6 +91,7 @@ class OperatorFn(ABC, torch.nn.Module):
         self.fill_idx = fill_idx
 
         self.output = None
+        self.accumulate_dtype: Optional[torch.dtype] = None
 
         self.single_mapping = single_inputs
         self.array_mapping = array_inputs
@@ -99,17 +126,283 @@ class OperatorFn(ABC, torch.nn.Module):
                     )
 
 
+@dataclass
+class _Segment:
+    start: int
+    end: int
+    # Slots read by the segment but filled before it
+    inputs: List[int]
+    # Slots filled by the segment and read after it
+    outputs: List[int]
+    # Slots which nothing after the segment reads
+    released: List[int]
+
+
+class OperatorSchedule:
+    """Runs operators over storage, releasing intermediates as soon as they are dead
+
+    Storage has a slot for every node, so holding onto every intermediate
+    costs rows * nodes of memory. After each operator, slots which no later
+    operator reads (and which aren't kept as outputs) are cleared,
+    so only tensors autograd saved for backward stay alive.
+
+    With checkpoint_segments, the operators are split into that many segments
+    which run under activation checkpointing. Only tensors flowing between
+    segments are kept for backward, and each segment is recomputed during it.
+    """
+
+    def __init__(
+        self,
+        ordered: List[OperatorFn],
+        storage_size: int,
+        keep: Iterable[int],
+        checkpoint_segments: int = 0,
+    ):
+        self.ordered = ordered
+        self.storage_size = storage_size
+        # Called with each operator and its output as it runs.
+        # Operators are called through forward directly, since module hooks
+        # cost a noticeable fraction of evaluating small batches
+        self.hooks: List[Callable[[OperatorFn, CircuitTensor], None]] = []
+
+        kept = set(keep)
+        last_read: Dict[int, int] = {}
+        for (idx, operator) in enumerate(ordered):
+            for slot in operator.input_slots():
+                last_read[slot] = idx
+
+        self.release_after: List[List[int]] = [[] for _ in ordered]
+        for (slot, idx) in last_read.items():
+            if slot not in kept:
+                self.release_after[idx].append(slot)
+
+        self.segments: List[_Segment] = []
+        if checkpoint_segments > 1 and ordered:
+            length = -(-len(ordered) // checkpoint_segments)
+            for start in range(0, len(ordered), length):
+                self.segments.append(
+                    self._make_segment(start, min(start + length, len(ordered)), kept)
+                )
+
+    def _make_segment(self, start: int, end: int, kept: Set[int]) -> _Segment:
+        filled = {operator.fill_idx for operator in self.ordered[start:end]}
+        inputs = {
+            slot
+            for operator in self.ordered[start:end]
+            for slot in operator.input_slots()
+            if slot not in filled
+        }
+        read_after = {
+            slot
+            for operator in self.ordered[end:]
+            for slot in operator.input_slots()
+        }
+        return _Segment(
+            start=start,
+            end=end,
+            inputs=sorted(inputs),
+            outputs=sorted(filled & (read_after | kept)),
+            released=[
+                slot
+                for idx in range(start, end)
+                for slot in self.release_after[idx]
+                if slot not in filled
+            ],
+        )
+
+    def _run_range(self, storage: List[CircuitTensor], start: int, end: int):
+        for idx in range(start, end):
+            operator = self.ordered[idx]
+            output = operator.forward(storage)
+            for hook in self.hooks:
+                hook(operator, output)
+            for slot in self.release_after[idx]:
+                storage[slot] = None
+
+    def _run_segment(self, segment: _Segment, *inputs: CircuitTensor):
+        storage: List[CircuitTensor] = [None] * self.storage_size
+        for (slot, tensor) in zip(segment.inputs, inputs):
+            storage[slot] = tensor
+        self._run_range(storage, segment.start, segment.end)
+        return tuple(storage[slot] for slot in segment.outputs)
+
+    def run(self, storage: List[CircuitTensor]):
+        if not self.segments:
+            self._run_range(storage, 0, len(self.ordered))
+            return
+
+        for segment in self.segments:
+            outputs = torch.utils.checkpoint.checkpoint(
+                partial(self._run_segment, segment),
+                *[storage[slot] for slot in segment.inputs],
+                use_reentrant=False,
+            )
+            for (slot, tensor) in zip(segment.outputs, outputs):
+                storage[slot] = tensor
+            for slot in segment.released:
+                storage[slot] = None
+
+
 class DagOperator(torch.nn.Module):
-    def __init__(self, storage: List[CircuitTensor], ordered: List[OperatorFn]):
+    def __init__(
+        self,
+        storage: List[CircuitTensor],
+        ordered: List[OperatorFn],
+        checkpoint_segments: int = 0,
+    ):
         super(DagOperator, self).__init__()
 
         self.storage = storage
         self.ordered = ordered
+        self.schedule = OperatorSchedule(
+            ordered, len(storage), [len(storage) - 1], checkpoint_segments
+        )
 
     def forward(self):
+        # Intermediates are written into a copy, so they don't outlive the call
+        storage = list(self.storage)
+        self.schedule.run(storage)
+        return storage[-1]
+
+    def lower(self) -> torch.fx.GraphModule:
+        """Lowers into a straight-line module taking no arguments, with the data as buffers"""
+        return lower_operators(self.storage, self.ordered, [])
+
+    def diagnose(self) -> "NanDiagnostics":
+        """Runs forward once, recording where each row first turns non-finite"""
+        from pycircuit.differentiator.diagnostics import diagnose
+
+        rows = max([len(tensor) for tensor in self.storage if tensor.dim() > 0] + [1])
+        return diagnose(self.schedule, rows, self)
+
+
+class BatchedDagOperator(torch.nn.Module):
+    """A DagOperator whose edges are handed to each call instead of stored in it
+
+    The storage holds parameters, constants and a placeholder per edge.
+    Each forward evaluates the graph over a fresh copy of it,
+    so the same module can be run over any number of batches of edges
+
+    With output_slots, forward returns the tensors in each of those
+    instead of the last one (i.e. for graphs with several roots)
+    """
+
+    def __init__(
+        self,
+        storage: List[CircuitTensor],
+        ordered: List[OperatorFn],
+        edge_slots: Dict[ComponentOutput, int],
+        output_slots: Optional[List[int]] = None,
+        checkpoint_segments: int = 0,
+    ):
+        super(BatchedDagOperator, self).__init__()
+
+        self.storage = storage
+        self.ordered = ordered
+        self.edge_slots = edge_slots
+        self.output_slots = output_slots
+        self.schedule = OperatorSchedule(
+            ordered,
+            len(storage),
+            output_slots if output_slots is not None else [len(storage) - 1],
+            checkpoint_segments,
+        )
+
+    def forward(self, edges: Dict[ComponentOutput, CircuitTensor]):
+        storage = list(self.storage)
+        for (output, slot) in self.edge_slots.items():
+            if output not in edges:
+                raise ValueError(f"Batch is missing edge {output}")
+            storage[slot] = edges[output]
+
+        self.schedule.run(storage)
+
+        if self.output_slots is not None:
+            return [storage[slot] for slot in self.output_slots]
+
+        return storage[-1]
+
+    def diagnose(self, edges: Dict[ComponentOutput, CircuitTensor]) -> "NanDiagnostics":
+        """Runs forward over edges once, recording where each row turns non-finite"""
+        from pycircuit.differentiator.diagnostics import diagnose
+
+        rows = max([len(tensor) for tensor in edges.values() if tensor.dim() > 0] + [1])
+        return diagnose(self.schedule, rows, lambda: self(edges))
+
+    def lower(self) -> "LoweredDagOperator":
+        edges = list(self.edge_slots.keys())
+        return LoweredDagOperator(
+            lower_operators(
+                self.storage,
+                self.ordered,
+                [self.edge_slots[edge] for edge in edges],
+                self.output_slots,
+            ),
+            edges,
+        )
+
+
+class LoweredDagOperator(torch.nn.Module):
+    """A BatchedDagOperator lowered into a straight-line module
+
+    The lowered module takes the edges positionally, in the order of edges
+    """
+
+    def __init__(self, lowered: torch.fx.GraphModule, edges: List[ComponentOutput]):
+        super(LoweredDagOperator, self).__init__()
+
+        self.lowered = lowered
+        self.edges = edges
+
+    def forward(self, edges: Dict[ComponentOutput, CircuitTensor]):
+        for output in self.edges:
+            if output not in edges:
+                raise ValueError(f"Batch is missing edge {output}")
+        return self.lowered(*[edges[output] for output in self.edges])
+
+
+def lower_operators(
+    storage: List[CircuitTensor],
+    ordered: List[OperatorFn],
+    input_slots: List[int],
+    output_slots: Optional[List[int]] = None,
+) -> torch.fx.GraphModule:
+    """Lowers a list of operators over storage into an fx graph
+
+    Evaluating the DAG dispatches through a python module per node and indexes into
+    storage for every input. The lowered graph is a single generated function
+    with one call per operator, which torch.compile can trace and fuse as a whole.
+
+    Slots in input_slots become positional arguments, parameters become
+    parameters of the module (so they are still shared with the model)
+    and every other filled slot becomes a buffer.
+    The module returns the last slot, or a list of output_slots if given.
+    """
+    root = torch.nn.Module()
+    graph = torch.fx.Graph()
+    nodes: List[Optional[torch.fx.Node]] = [None] * len(storage)
+
+    for (idx, slot) in enumerate(input_slots):
+        nodes[slot] = graph.placeholder(f"edge_{idx}")
+
+    filled = {operator.fill_idx for operator in ordered}
+    for (slot, tensor) in enumerate(storage):
+        if nodes[slot] is not None or slot in filled:
+            continue
+        if isinstance(tensor, CircuitParameter):
+            name = f"param_{slot}"
+            root.register_parameter(name, tensor)
+        else:
+            name = f"constant_{slot}"
+            root.register_buffer(name, tensor)
+        nodes[slot] = graph.get_attr(name)
 
-        for operator in self.ordered:
-            last_returned = operator.forward(self.storage)
+    for operator in ordered:
+        nodes[operator.fill_idx] = operator.lower(graph, nodes)
 
-        assert last_returned is self.storage[-1]
-        return last_returned
+    if output_slots is not None:
+        graph.output([nodes[slot] for slot in output_slots])
+    else:
+        graph.output(nodes[-1])
+    graph.lint()
+    return torch.fx.GraphModule(root, graph)
@@ -3,6 +3,7 @@ from typing import Dict, Type
 from .binary_math_operators import BINARY_OPERATORS
 from .unary_math_operators import UNARY_OPERATORS
 from .summary_operators import SUMMARY_OPERATORS
+from .reduction_operators import REDUCTION_OPERATORS
 from .select import Select
 from pycircuit.differentiator.operator import OperatorFn
 
@@ -12,3 +13,4 @@ ALL_OPERATORS: Dict[str, Type[OperatorFn]] = {"select": Select}
 ALL_OPERATORS.update(BINARY_OPERATORS)
 ALL_OPERATORS.update(UNARY_OPERATORS)
 ALL_OPERATORS.update(SUMMARY_OPERATORS)
+ALL_OPERATORS.update(REDUCTION_OPERATORS)
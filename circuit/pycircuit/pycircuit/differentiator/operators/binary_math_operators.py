@@ -1,6 +1,7 @@
 from abc import abstractmethod
 from typing import Dict, List, Set, Type
 from pycircuit.differentiator.operator import OperatorFn
+import torch.fx
 from pycircuit.differentiator.tensor import (
     tensor_max,
     tensor_min,
@@ -36,6 +37,11 @@ class BinaryOp(OperatorFn):
     def do_forward(self, tensors: List[CircuitTensor]) -> CircuitTensor:
         return self.do_op(tensors[self.a_module], tensors[self.b_module])
 
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(
+            self.do_op, (nodes[self.a_module], nodes[self.b_module])
+        )
+
 
 class Add(BinaryOp):
     @classmethod
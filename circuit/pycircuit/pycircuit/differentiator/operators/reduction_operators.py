@@ -0,0 +1,148 @@
+from typing import Dict, List, Optional, Set, Type
+from pycircuit.differentiator.operator import OperatorFn
+from pycircuit.differentiator.tensor import CircuitTensor, accumulation_dtype
+
+import torch
+import torch.fx
+
+
+def stack_broadcast(*tensors: CircuitTensor) -> CircuitTensor:
+    # Only broadcast against the other stacked values, so a stack of parameters
+    # stays a column instead of being expanded to the length of the data
+    return torch.stack(torch.broadcast_tensors(*tensors))
+
+
+def sum_stacked(
+    a: CircuitTensor, accumulate_dtype: Optional[torch.dtype] = None
+) -> CircuitTensor:
+    upcast = accumulation_dtype(a.dtype, accumulate_dtype)
+    if upcast != a.dtype:
+        return torch.sum(a, dim=0, dtype=upcast).to(a.dtype)
+    return torch.sum(a, dim=0)
+
+
+def dot_stacked(
+    a: CircuitTensor,
+    b: CircuitTensor,
+    accumulate_dtype: Optional[torch.dtype] = None,
+) -> CircuitTensor:
+    dtype = torch.result_type(a, b)
+    if dtype.is_floating_point:
+        compute = accumulation_dtype(dtype, accumulate_dtype)
+        # Weighting data by a column of scalars (i.e. the factors of a regression)
+        # is a vector-matrix product, without materializing every product
+        if b[0].numel() == 1:
+            dotted = torch.tensordot(b.reshape(-1).to(compute), a.to(compute), dims=1)
+            return dotted.to(dtype)
+        if a[0].numel() == 1:
+            dotted = torch.tensordot(a.reshape(-1).to(compute), b.to(compute), dims=1)
+            return dotted.to(dtype)
+        return torch.sum(a.to(compute) * b.to(compute), dim=0).to(dtype)
+    return torch.sum(a * b, dim=0)
+
+
+class Stack(OperatorFn):
+    @classmethod
+    def name(cls) -> str:
+        return "stack"
+
+    @classmethod
+    def single_inputs(cls) -> Set[str]:
+        return set()
+
+    @classmethod
+    def array_inputs(cls) -> Dict[str, Set[str]]:
+        return {"values": {"a"}}
+
+    def __init__(
+        self,
+        single_inputs: Dict[str, int],
+        array_inputs: Dict[str, List[Dict[str, int]]],
+        fill_idx: int,
+    ):
+        super(Stack, self).__init__(single_inputs, array_inputs, fill_idx)
+
+        self.values = [batch["a"] for batch in array_inputs["values"]]
+
+    def do_forward(self, tensors: List[CircuitTensor]):
+        return stack_broadcast(*[tensors[idx] for idx in self.values])
+
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(
+            stack_broadcast, tuple(nodes[idx] for idx in self.values)
+        )
+
+
+class Sum(OperatorFn):
+    @classmethod
+    def name(cls) -> str:
+        return "sum"
+
+    @classmethod
+    def single_inputs(cls) -> Set[str]:
+        return {"a"}
+
+    @classmethod
+    def array_inputs(cls) -> Dict[str, Set[str]]:
+        return {}
+
+    def __init__(
+        self,
+        single_inputs: Dict[str, int],
+        array_inputs: Dict[str, List[Dict[str, int]]],
+        fill_idx: int,
+    ):
+        super(Sum, self).__init__(single_inputs, array_inputs, fill_idx)
+
+        self.a_module = single_inputs["a"]
+
+    def do_forward(self, tensors: List[CircuitTensor]):
+        return sum_stacked(tensors[self.a_module], self.accumulate_dtype)
+
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(
+            sum_stacked, (nodes[self.a_module], self.accumulate_dtype)
+        )
+
+
+class Dot(OperatorFn):
+    @classmethod
+    def name(cls) -> str:
+        return "dot"
+
+    @classmethod
+    def single_inputs(cls) -> Set[str]:
+        return {"a", "b"}
+
+    @classmethod
+    def array_inputs(cls) -> Dict[str, Set[str]]:
+        return {}
+
+    def __init__(
+        self,
+        single_inputs: Dict[str, int],
+        array_inputs: Dict[str, List[Dict[str, int]]],
+        fill_idx: int,
+    ):
+        super(Dot, self).__init__(single_inputs, array_inputs, fill_idx)
+
+        self.a_module = single_inputs["a"]
+        self.b_module = single_inputs["b"]
+
+    def do_forward(self, tensors: List[CircuitTensor]):
+        return dot_stacked(
+            tensors[self.a_module], tensors[self.b_module], self.accumulate_dtype
+        )
+
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(
+            dot_stacked,
+            (nodes[self.a_module], nodes[self.b_module], self.accumulate_dtype),
+        )
+
+
+REDUCTION_OPERATORS: Dict[str, Type[OperatorFn]] = {
+    "stack": Stack,
+    "sum": Sum,
+    "dot": Dot,
+}
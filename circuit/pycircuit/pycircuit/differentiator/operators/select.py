@@ -3,6 +3,7 @@ from pycircuit.differentiator.operator import OperatorFn
 from pycircuit.differentiator.tensor import CircuitTensor
 
 import torch
+import torch.fx
 
 
 class Select(OperatorFn):
@@ -34,3 +35,9 @@ class Select(OperatorFn):
         return torch.where(
             tensors[self.select_a], tensors[self.a_module], tensors[self.b_module]
         )
+
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(
+            torch.where,
+            (nodes[self.select_a], nodes[self.a_module], nodes[self.b_module]),
+        )
@@ -1,12 +1,34 @@
-from typing import Dict, List, Type
+from abc import abstractmethod
+from typing import Dict, List, Optional, Type
 from pycircuit.differentiator.operators.unary_math_operators import AUnaryOp
+from pycircuit.differentiator.tensor import CircuitTensor, accumulation_dtype
 
 import torch
+import torch.fx
 
 from pycircuit.differentiator.operator import OperatorFn
 
 
-class Mean(AUnaryOp):
+class ASummaryOp(AUnaryOp):
+    """A reduction over all values of its input, accumulated in accumulate_dtype"""
+
+    @classmethod
+    @abstractmethod
+    def do_op(
+        cls, a: CircuitTensor, dtype: Optional[torch.dtype] = None
+    ) -> CircuitTensor:
+        pass
+
+    def do_forward(self, tensors: List[CircuitTensor]):
+        return self.do_op(tensors[self.a_module], self.accumulate_dtype)
+
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(
+            self.do_op, (nodes[self.a_module], self.accumulate_dtype)
+        )
+
+
+class Mean(ASummaryOp):
     @classmethod
     def name(cls) -> str:
         return "mean"
@@ -20,11 +42,14 @@ class Mean(AUnaryOp):
         super(Mean, self).__init__(single_inputs, array_inputs, fill_idx)
 
     @classmethod
-    def do_op(self, a):
+    def do_op(self, a, dtype=None):
+        upcast = accumulation_dtype(a.dtype, dtype)
+        if upcast != a.dtype:
+            return torch.mean(a, dtype=upcast).to(a.dtype)
         return torch.mean(a)
 
 
-class Std(AUnaryOp):
+class Std(ASummaryOp):
     @classmethod
     def name(cls) -> str:
         return "std"
@@ -38,9 +63,12 @@ class Std(AUnaryOp):
         super(Std, self).__init__(single_inputs, array_inputs, fill_idx)
 
     @classmethod
-    def do_op(self, a):
+    def do_op(self, a, dtype=None):
         if len(a) <= 1:
             return torch.tensor([1])
+        upcast = accumulation_dtype(a.dtype, dtype)
+        if upcast != a.dtype:
+            return torch.std(a.to(upcast)).to(a.dtype)
         return torch.std(a)
 
 
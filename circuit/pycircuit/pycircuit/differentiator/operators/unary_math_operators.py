@@ -5,6 +5,7 @@ from pycircuit.differentiator.tensor import CircuitTensor
 from pycircuit.differentiator.tensor import tensor_max, tensor_min
 
 import torch
+import torch.fx
 
 
 class AUnaryOp(OperatorFn):
@@ -24,6 +25,9 @@ class AUnaryOp(OperatorFn):
     def do_forward(self, tensors: List[CircuitTensor]):
         return self.do_op(tensors[self.a_module])
 
+    def lower(self, graph: torch.fx.Graph, nodes: List[torch.fx.Node]) -> torch.fx.Node:
+        return graph.call_function(self.do_op, (nodes[self.a_module],))
+
     def __init__(
         self,
         single_inputs: Dict[str, int],
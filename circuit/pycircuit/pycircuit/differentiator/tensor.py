@@ -1,3 +1,4 @@
+from enum import Enum
 from typing import List, Optional, TypeAlias
 import torch
 import torch.random
@@ -7,6 +8,43 @@ CircuitParameter: TypeAlias = torch.nn.parameter.Parameter
 Module: TypeAlias = torch.nn.Module
 
 
+class Precision(Enum):
+    """How the tensors of a model are stored, and what reductions accumulate in"""
+
+    Float64 = "float64"
+    Float32 = "float32"
+    # Stored as float32, but mean, std and sums accumulate in float64
+    Mixed = "mixed"
+
+    def dtype(self) -> torch.dtype:
+        if self == Precision.Float64:
+            return torch.float64
+        return torch.float32
+
+    def accumulate_dtype(self) -> torch.dtype:
+        if self == Precision.Float32:
+            return torch.float32
+        return torch.float64
+
+    def numpy_dtype(self) -> str:
+        return str(self.dtype()).removeprefix("torch.")
+
+    def __str__(self):
+        return self.value
+
+    def __repr__(self):
+        return self.value
+
+
+def accumulation_dtype(
+    dtype: torch.dtype, accumulate_dtype: Optional[torch.dtype]
+) -> torch.dtype:
+    """Returns the dtype to reduce values of dtype in"""
+    if accumulate_dtype is None or not dtype.is_floating_point:
+        return dtype
+    return accumulate_dtype
+
+
 def tensor_min(a: CircuitTensor, b: CircuitTensor):
     return torch.minimum(a, b)
 
@@ -15,10 +53,15 @@ def tensor_max(a: CircuitTensor, b: CircuitTensor):
     return torch.maximum(a, b)
 
 
-def make_parameter(initial_value: Optional[CircuitTensor] = None):
+def make_parameter(
+    initial_value: Optional[CircuitTensor] = None, dtype: Optional[torch.dtype] = None
+):
     # Mypy is weird about this optional parameter
     if initial_value is None:
+        # Drawn the same way for every dtype, so a seed gives the same start
         initial_value = torch.rand(1)
+    if dtype is not None:
+        initial_value = initial_value.to(dtype)
     return CircuitParameter(data=initial_value, requires_grad=True)
 
 
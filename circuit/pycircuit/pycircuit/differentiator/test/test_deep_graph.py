@@ -0,0 +1,27 @@
+import sys
+
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.differentiator.graph import Graph, Model
+
+
+def test_traverses_past_recursion_limit():
+    depth = 2 * sys.getrecursionlimit()
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        value = circuit.get_external("x", "double")
+        param = circuit.make_parameter("p")
+        for _ in range(depth):
+            value = value + param
+
+    graph = Graph.discover_from_circuit(circuit, value)
+    assert len(graph.nodes) == depth + 2
+
+    model = Model(graph, {"p": torch.tensor([0.5], dtype=torch.float64)})
+    data = {edge: torch.zeros(3, dtype=torch.float64) for edge in graph.find_edges()}
+    output = model.create_module(data)()
+
+    assert torch.allclose(output, torch.full((3,), 0.5 * depth, dtype=torch.float64))
@@ -0,0 +1,58 @@
+import math
+
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.unary_arithmetic import clog
+from pycircuit.differentiator.graph import Graph, Model
+
+
+def make_model():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        y = circuit.get_external("y", "double")
+        p = circuit.make_parameter("p")
+
+        logged = clog(x)
+        circuit.rename_component(logged, "logged")
+        divided = p / y
+        circuit.rename_component(divided, "divided")
+        pred = logged + divided
+        circuit.rename_component(pred, "pred")
+
+    graph = Graph.discover_from_circuit(circuit, pred)
+    return Model(graph, {"p": torch.tensor([1.0], dtype=torch.float64)})
+
+
+def test_finds_first_nonfinite_operator_per_row():
+    model = make_model()
+    (x, y) = model.edges()
+    data = {
+        # log(-1) is nan, the division by 0 is inf
+        x: torch.tensor([1.0, -1.0, 2.0, -1.0, 1.0], dtype=torch.float64),
+        y: torch.tensor([1.0, 1.0, 0.0, 0.0, 1.0], dtype=torch.float64),
+    }
+
+    module = model.create_module(data)
+    diagnostics = module.diagnose()
+
+    first = [diagnostics.first_output(row) for row in range(5)]
+    assert first[0] is None and first[4] is None
+    assert first[1].output.parent == "logged"
+    assert first[2].output.parent == "divided"
+    # Both go bad, the first operator run is blamed
+    assert first[3].output.parent in ("logged", "divided")
+
+    assert diagnostics.bad_rows().tolist() == [1, 2, 3]
+    assert sum(diagnostics.culprits().values()) == 3
+
+    summaries = {summary.output.parent: summary for summary in diagnostics.summaries}
+    assert summaries["logged"].nonfinite == 2
+    assert summaries["logged"].maximum == math.log(2.0)
+    assert summaries["pred"].nonfinite == 3
+
+    batched = model.create_batched_module().diagnose(data)
+    assert torch.equal(batched.first_nonfinite, diagnostics.first_nonfinite)
@@ -0,0 +1,71 @@
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.graph import EdgeNode, Graph, Model
+from pycircuit.differentiator.joint import merge_graphs
+
+
+def make_graphs():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        y = circuit.get_external("y", "double")
+        p = circuit.make_parameter("p")
+        q = circuit.make_parameter("q")
+
+        scaled = x * p
+        circuit.rename_component(scaled, "scaled")
+        pred = scaled * q
+        circuit.rename_component(pred, "pred")
+        other = scaled + y
+        circuit.rename_component(other, "other")
+
+    return {
+        "sampled": Graph.discover_from_circuit(
+            circuit, pred, block_propagating={scaled.output()}
+        ),
+        "computed": Graph.discover_from_circuit(circuit, pred),
+        "other": Graph.discover_from_circuit(circuit, other),
+    }
+
+
+def test_merges_shared_nodes():
+    graphs = make_graphs()
+    joint = merge_graphs(graphs)
+
+    scaled = ComponentOutput(parent="scaled", output_name="out")
+    computed_scaled = ComponentOutput(parent="computed_scaled", output_name="out")
+
+    # Sampled in the first graph, and computed in the others
+    assert joint.graph.nodes[scaled] == EdgeNode(output=scaled)
+    assert computed_scaled in joint.graph.nodes
+    assert joint.heads == {
+        "sampled": ComponentOutput(parent="pred", output_name="out"),
+        "computed": ComponentOutput(parent="computed_pred", output_name="out"),
+        "other": ComponentOutput(parent="other", output_name="out"),
+    }
+    # x, y, p, q, both versions of scaled, both versions of pred and other
+    assert len(joint.graph.nodes) == 9
+    assert set(joint.graph.find_edges()) == {
+        scaled,
+        ComponentOutput(parent="external", output_name="x"),
+        ComponentOutput(parent="external", output_name="y"),
+    }
+
+
+def test_joint_model_matches_heads():
+    graphs = make_graphs()
+    joint = merge_graphs(graphs)
+
+    initial = {"p": torch.tensor([2.0]), "q": torch.tensor([3.0])}
+    data = {edge: torch.randn(10) for edge in joint.graph.find_edges()}
+
+    model = Model(joint.graph, initial, roots=joint.roots())
+    outputs = model.create_batched_module()(data)
+
+    for ((head, graph), output) in zip(graphs.items(), outputs):
+        expected = Model(graph, initial).create_batched_module()(data)
+        assert torch.allclose(output, expected), head
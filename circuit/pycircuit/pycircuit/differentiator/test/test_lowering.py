@@ -0,0 +1,106 @@
+import pytest
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.constant import make_double
+from pycircuit.circuit_builder.signals.regressions.activations import relu
+from pycircuit.circuit_builder.signals.regressions.mlp import Layer, mlp
+from pycircuit.circuit_builder.signals.tree_sum import tree_sum
+from pycircuit.circuit_builder.signals.unary_arithmetic import cabs, cexp, clog
+from pycircuit.differentiator.graph import Graph, Model
+from pycircuit.differentiator.trainer.train_graph_on import check_compile_options
+
+
+def make_graph() -> Graph:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        inputs = [circuit.get_external(f"x{idx}", "double") for idx in range(3)]
+        (x, y, z) = inputs
+        hidden = mlp(
+            inputs, [Layer.parameter_layer(4, 3, activation=relu, prefix="hidden")]
+        )
+        scale = circuit.make_parameter("scale")
+
+        centered = (x - circuit.summarize(x, "mean")) / circuit.summarize(x, "std")
+        picked = cexp(centered * scale) - clog(cabs(y) + make_double(1.0))
+        root = tree_sum(hidden + [picked, z * scale])
+
+    return Graph.discover_from_circuit(circuit, root)
+
+
+def make_model() -> Model:
+    graph = make_graph()
+    torch.manual_seed(0)
+    initial = {
+        name: torch.randn(1, dtype=torch.float64) * 0.5
+        for name in graph.find_parameter_names()
+    }
+    return Model(graph, initial)
+
+
+def make_data(model: Model):
+    return {edge: torch.randn(50, dtype=torch.float64) for edge in model.edges()}
+
+
+def output_and_grads(model: Model, run):
+    for param in model.parameters_list():
+        param.grad = None
+
+    output = run()
+    output.sum().backward()
+    return (output.detach(), [param.grad.clone() for param in model.parameters_list()])
+
+
+def assert_matches(expected, lowered):
+    (expected_output, expected_grads) = expected
+    (lowered_output, lowered_grads) = lowered
+
+    assert torch.allclose(expected_output, lowered_output)
+    for (grad, lowered_grad) in zip(expected_grads, lowered_grads):
+        assert torch.allclose(grad, lowered_grad)
+
+
+def assert_shares_parameters(model: Model, lowered: torch.nn.Module):
+    lowered_params = {id(param) for param in lowered.parameters()}
+    assert lowered_params == {id(param) for param in model.parameters_list()}
+
+
+def test_lowered_module_matches():
+    model = make_model()
+    module = model.create_module(make_data(model))
+    lowered = module.lower()
+
+    assert_matches(output_and_grads(model, module), output_and_grads(model, lowered))
+    assert_shares_parameters(model, lowered)
+
+
+def test_lowered_batched_module_matches():
+    model = make_model()
+    batched = model.create_batched_module()
+    lowered = batched.lower()
+
+    for _ in range(2):
+        data = make_data(model)
+        assert_matches(
+            output_and_grads(model, lambda: batched(data)),
+            output_and_grads(model, lambda: lowered(data)),
+        )
+    assert_shares_parameters(model, lowered)
+
+
+def test_lowered_batched_module_checks_edges():
+    model = make_model()
+    lowered = model.create_batched_module().lower()
+
+    with pytest.raises(ValueError, match="missing edge"):
+        lowered({})
+
+
+def test_compile_rejects_checkpointing():
+    check_compile_options(torch_compile=True, checkpoint_segments=0)
+    check_compile_options(torch_compile=False, checkpoint_segments=4)
+
+    with pytest.raises(ValueError, match="checkpoint_segments"):
+        check_compile_options(torch_compile=True, checkpoint_segments=4)
@@ -0,0 +1,75 @@
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.circuit_builder.signals.normalizer import Normalizer
+from pycircuit.circuit_builder.signals.unary_arithmetic import cexp
+from pycircuit.differentiator.graph import Graph, Model
+
+
+def make_circuit():
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "double")
+        b = circuit.get_external("b", "double")
+        c = circuit.get_external("c", "double")
+        p = circuit.make_parameter("p")
+        q = circuit.make_parameter("q")
+
+        # Reads three externals, but is one column once recorded
+        static = a * b + c
+        circuit.rename_component(static, "static")
+        decayed = cexp(static)
+        circuit.rename_component(decayed, "decayed")
+        normalized = Normalizer(decayed).normalize(decayed)
+
+        pred = normalized * p + static * q + a
+        circuit.rename_component(pred, "pred")
+
+    return (circuit, pred, decayed)
+
+
+def test_collapses_parameter_free_subgraphs():
+    (circuit, pred, decayed) = make_circuit()
+
+    full = Graph.discover_from_circuit(circuit, pred)
+    minimal = Graph.discover_from_circuit(circuit, pred, minimal_sampling=True)
+
+    static = ComponentOutput(parent="static", output_name="out")
+    a = ComponentOutput(parent="external", output_name="a")
+
+    assert len(full.find_edges()) == 3
+    # decayed is read by the mean and std, which aren't known until training
+    assert minimal.find_edges() == [a, static]
+    assert decayed.output() in minimal.nodes
+    assert minimal.find_parameter_names() == full.find_parameter_names()
+
+    torch.manual_seed(0)
+    data = {edge: torch.randn(50, dtype=torch.float64) for edge in full.find_edges()}
+    initial = {
+        name: torch.randn(1, dtype=torch.float64)
+        for name in full.find_parameter_names()
+    }
+
+    # The circuit would record what the full graph computes for the new edges
+    recorded = {
+        edge: Model(Graph(nodes=full.nodes, root=edge)).create_module(data)()
+        if edge not in data
+        else data[edge]
+        for edge in minimal.find_edges()
+    }
+
+    full_out = Model(full, initial).create_module(data)()
+    minimal_out = Model(minimal, initial).create_module(recorded)()
+    assert torch.allclose(full_out, minimal_out)
+
+
+def test_parameter_free_root_is_one_edge():
+    (circuit, _, decayed) = make_circuit()
+
+    minimal = Graph.discover_from_circuit(circuit, decayed, minimal_sampling=True)
+
+    assert minimal.find_edges() == [decayed.output()]
+    assert list(minimal.nodes.keys()) == [decayed.output()]
@@ -0,0 +1,63 @@
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.unary_arithmetic import cexp
+from pycircuit.differentiator.graph import Graph, Model
+
+
+def make_graph() -> Graph:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        y = circuit.get_external("y", "double")
+        value = x
+        for idx in range(10):
+            param = circuit.make_parameter(f"p{idx}")
+            value = cexp(value * param) - y
+
+    return Graph.discover_from_circuit(circuit, value)
+
+
+def evaluate(checkpoint_segments: int):
+    graph = make_graph()
+    initial = {
+        name: torch.tensor([0.1], dtype=torch.float64)
+        for name in graph.find_parameter_names()
+    }
+    data = {
+        edge: torch.linspace(0, 1, 20, dtype=torch.float64)
+        for edge in graph.find_edges()
+    }
+
+    model = Model(graph, initial)
+    module = model.create_module(data, checkpoint_segments)
+    storage = list(module.storage)
+
+    output = module()
+    output.sum().backward()
+
+    # Intermediates are never written back into the module
+    assert all(before is after for (before, after) in zip(storage, module.storage))
+
+    return (output.detach(), [param.grad for param in model.parameters_list()])
+
+
+def test_releases_dead_intermediates():
+    model = Model(make_graph())
+    module = model.create_module({edge: torch.ones(3) for edge in model.edges()})
+
+    released = [slot for slots in module.schedule.release_after for slot in slots]
+    assert len(released) == len(set(released))
+    assert len(module.storage) - 1 not in released
+
+
+def test_checkpointing_matches():
+    output, grads = evaluate(0)
+
+    for checkpoint_segments in [2, 3, 100]:
+        checkpointed_output, checkpointed_grads = evaluate(checkpoint_segments)
+        assert torch.equal(output, checkpointed_output)
+        for (grad, checkpointed_grad) in zip(grads, checkpointed_grads):
+            assert torch.allclose(grad, checkpointed_grad)
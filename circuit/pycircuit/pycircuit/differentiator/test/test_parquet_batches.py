@@ -0,0 +1,126 @@
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.differentiator.graph import Graph, Model, output_to_name
+from pycircuit.differentiator.trainer.data_writer_config import WriterConfig
+from pycircuit.differentiator.trainer.parquet_batches import ParquetSampleLoader
+from pycircuit.differentiator.trainer.train_graph_on import load_full_batch
+
+ROWS = 40
+MISSING = [2, 11, 20]
+SKIP_ROWS = 5
+TRAIN_FRAC = 0.75
+
+
+def make_graph() -> Graph:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        y = circuit.get_external("y", "double")
+        p = circuit.make_parameter("p")
+
+        pred = x * p + y
+        circuit.rename_component(pred, "pred")
+
+    return Graph.discover_from_circuit(circuit, pred)
+
+
+def write_samples(path: str, graph: Graph) -> WriterConfig:
+    edges = graph.find_edges()
+    rng = np.random.default_rng(0)
+
+    data = {output_to_name(edge): rng.normal(size=ROWS) for edge in edges}
+    data["target"] = rng.uniform(100, 101, size=ROWS)
+    data["target_future"] = data["target"] + rng.normal(size=ROWS)
+    data["time"] = np.arange(ROWS)
+    data[output_to_name(edges[0])][MISSING] = np.nan
+
+    # Row groups of 7 rows, so the skip and the split fall within row groups
+    pq.write_table(pa.table(data), path, row_group_size=7)
+
+    return WriterConfig(
+        outputs=edges, target_output=edges[0], sample_on=edges[0], ms_future=10
+    )
+
+
+@pytest.fixture
+def samples(tmp_path):
+    graph = make_graph()
+    path = str(tmp_path / "samples.parquet")
+    writer_config = write_samples(path, graph)
+    return (graph, path, writer_config)
+
+
+def make_loader(path: str, writer_config: WriterConfig) -> ParquetSampleLoader:
+    return ParquetSampleLoader(
+        path,
+        writer_config,
+        batch_size=4,
+        train_frac=TRAIN_FRAC,
+        skip_rows=SKIP_ROWS,
+        shuffle_row_groups=2,
+    )
+
+
+def test_splits_like_full_batch(samples):
+    (_, path, writer_config) = samples
+    loader = make_loader(path, writer_config)
+    loader.normalize_target()
+
+    full = load_full_batch(
+        path, writer_config, TRAIN_FRAC, 1, True, skip_rows=SKIP_ROWS
+    )
+
+    test_batches = list(loader.test_batches())
+    test_target = torch.cat([batch.target for batch in test_batches])
+    assert torch.allclose(test_target, full.test_target)
+    for edge in writer_config.outputs:
+        streamed = torch.cat([batch.edges[edge] for batch in test_batches])
+        assert torch.equal(streamed, full.test_inputs[edge])
+
+    # Training rows are shuffled, but are the same rows
+    train_target = torch.cat([batch.target for batch in loader.train_batches(0)])
+    assert torch.allclose(train_target.sort().values, full.train_target.sort().values)
+
+
+def test_normalizes_like_pandas(samples):
+    (_, path, writer_config) = samples
+    loader = make_loader(path, writer_config)
+    loader.normalize_target()
+
+    data = pd.read_parquet(path).dropna()[SKIP_ROWS:]
+    train = data.iloc[: int(len(data) * TRAIN_FRAC)]
+    returns = (train["target_future"] - train["target"]) / train["target"]
+
+    assert loader.target_mean == pytest.approx(returns.mean())
+    assert loader.target_std == pytest.approx(returns.std())
+
+
+def test_train_batches_reshuffle_per_epoch(samples):
+    (_, path, writer_config) = samples
+    loader = make_loader(path, writer_config)
+
+    def targets(epoch: int) -> torch.Tensor:
+        return torch.cat([batch.target for batch in loader.train_batches(epoch)])
+
+    assert torch.equal(targets(0), targets(0))
+    assert not torch.equal(targets(0), targets(1))
+    assert all(len(batch) <= 4 for batch in loader.train_batches(0))
+
+
+def test_batched_module_matches_dag_operator(samples):
+    (graph, path, writer_config) = samples
+    loader = make_loader(path, writer_config)
+    model = Model(graph, {"p": torch.tensor([2.0])})
+
+    for batch in loader.test_batches():
+        batched = model.create_batched_module()(batch.edges)
+        expected = model.create_module(batch.edges)()
+        assert torch.allclose(batched, expected)
@@ -0,0 +1,67 @@
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.normalizer import Normalizer
+from pycircuit.circuit_builder.signals.regressions.mlp import Layer, mlp
+from pycircuit.circuit_builder.signals.tree_sum import tree_sum
+from pycircuit.differentiator.graph import Graph, Model
+from pycircuit.differentiator.tensor import Precision
+
+
+def make_graph() -> Graph:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        inputs = [circuit.get_external(f"x{idx}", "double") for idx in range(4)]
+        normalized = [Normalizer(input).normalize(input) for input in inputs]
+        outputs = mlp(normalized, [Layer.parameter_layer(3, 4, prefix="out")])
+        root = tree_sum(outputs)
+
+    return Graph.discover_from_circuit(circuit, root)
+
+
+def evaluate(graph: Graph, precision: Precision):
+    torch.manual_seed(0)
+    initial = {
+        name: torch.randn(1, dtype=torch.float64)
+        for name in graph.find_parameter_names()
+    }
+    # Large offsets make float32 accumulation of the mean and std lossy
+    data = {
+        edge: 1e4 + torch.randn(10000, dtype=torch.float64)
+        for edge in graph.find_edges()
+    }
+
+    model = Model(graph, initial, precision=precision)
+    output = model.create_module(data)()
+    output.sum().backward()
+    return (output, model.parameters_list())
+
+
+def test_precision_sets_dtypes():
+    graph = make_graph()
+    for (precision, dtype) in [
+        (Precision.Float64, torch.float64),
+        (Precision.Float32, torch.float32),
+        (Precision.Mixed, torch.float32),
+    ]:
+        (output, parameters) = evaluate(graph, precision)
+        assert output.dtype == dtype
+        for param in parameters:
+            assert param.dtype == dtype
+            assert param.grad.dtype == dtype
+
+
+def test_mixed_accumulates_in_float64():
+    graph = make_graph()
+    (reference, _) = evaluate(graph, Precision.Float64)
+    (single, _) = evaluate(graph, Precision.Float32)
+    (mixed, _) = evaluate(graph, Precision.Mixed)
+
+    single_error = torch.max(torch.abs(single.double() - reference))
+    mixed_error = torch.max(torch.abs(mixed.double() - reference))
+
+    assert mixed_error < single_error
+    # What remains is from rounding the samples themselves to float32
+    assert torch.allclose(mixed.double(), reference, atol=1e-2)
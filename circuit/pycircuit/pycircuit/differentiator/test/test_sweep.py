@@ -0,0 +1,94 @@
+import json
+import math
+
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.unary_arithmetic import cexp
+from pycircuit.differentiator.graph import Graph
+from pycircuit.differentiator.trainer.sweep_graph_on import (
+    SweepConfig,
+    SweepOptions,
+    run_sweep,
+    write_best_parameters,
+)
+from pycircuit.differentiator.trainer.train_graph_on import FullBatch
+
+
+def make_graph() -> Graph:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        x = circuit.get_external("x", "double")
+        y = circuit.get_external("y", "double")
+        p = circuit.make_parameter("p")
+        q = circuit.make_parameter("q")
+
+        pred = x * p + cexp(y * q)
+        circuit.rename_component(pred, "pred")
+
+    return Graph.discover_from_circuit(circuit, pred)
+
+
+def make_samples(graph: Graph) -> FullBatch:
+    torch.manual_seed(0)
+
+    def inputs():
+        return {
+            edge: torch.randn(200, dtype=torch.float64) for edge in graph.find_edges()
+        }
+
+    def target(inputs):
+        (x, _) = inputs.values()
+        return 2 * x + 1
+
+    (train_inputs, test_inputs) = (inputs(), inputs())
+    return FullBatch(
+        train_inputs=train_inputs,
+        test_inputs=test_inputs,
+        train_target=target(train_inputs),
+        test_target=target(test_inputs),
+    )
+
+
+def sweep(lrs):
+    graph = make_graph()
+    options = SweepOptions(
+        graph_file_path="graph.json",
+        writer_config_path="writer.json",
+        parquet_path="samples.parquet",
+        epochs_per_run=50,
+        jobs=1,
+    )
+    configs = [SweepConfig(lr=lr, lr_shrink_by=5.0, seed=0) for lr in lrs]
+    return run_sweep(graph, make_samples(graph), options, configs)
+
+
+def test_sorts_by_test_loss():
+    results = sweep([0.001, 0.1])
+
+    assert [result.config.lr for result in results] == [0.1, 0.001]
+    assert results[0].test_loss < results[1].test_loss
+    assert set(results[0].parameters) == {"p", "q"}
+
+
+def test_diverged_config_is_last():
+    # Overflows the exponential, so the loss and then the parameters turn nan
+    results = sweep([1e30, 0.1])
+
+    assert [result.config.lr for result in results] == [0.1, 1e30]
+    assert math.isinf(results[1].test_loss)
+    assert math.isfinite(results[0].test_loss)
+
+
+def test_writes_best_over_base_params(tmp_path):
+    (best, _) = sweep([0.1, 0.001])
+
+    base_path = tmp_path / "base_params.json"
+    base_path.write_text(json.dumps({"p": 0.0, "other": 4.0}))
+    out_path = tmp_path / "params.json"
+
+    write_best_parameters(best, str(out_path), str(base_path))
+
+    assert json.loads(out_path.read_text()) == {**best.parameters, "other": 4.0}
@@ -0,0 +1,79 @@
+import torch
+
+from pycircuit.circuit_builder.circuit import CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.signals.regressions.activations import relu
+from pycircuit.circuit_builder.signals.regressions.mlp import Layer, mlp
+from pycircuit.circuit_builder.signals.tree_sum import tree_sum
+from pycircuit.differentiator.graph import Graph, Model, OperatorNode
+from pycircuit.differentiator.vectorize import vectorize_graph
+
+
+def make_graph() -> Graph:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        inputs = [circuit.get_external(f"x{idx}", "double") for idx in range(4)]
+        outputs = mlp(
+            inputs,
+            [
+                Layer.parameter_layer(6, 4, activation=relu, prefix="hidden"),
+                Layer.parameter_layer(3, 6, prefix="out"),
+            ],
+        )
+        root = tree_sum(outputs)
+
+    return Graph.discover_from_circuit(circuit, root)
+
+
+def count_operators(graph: Graph):
+    counts: dict = {}
+    for node in graph.nodes.values():
+        if isinstance(node, OperatorNode):
+            counts[node.operator_name] = counts.get(node.operator_name, 0) + 1
+    return counts
+
+
+def test_mlp_becomes_dot_products():
+    graph = make_graph()
+    vectorized = vectorize_graph(graph)
+
+    counts = count_operators(vectorized)
+
+    # One dot per row of the hidden layer, with the bias added on
+    assert counts["add"] == 6
+    assert "mul" not in counts
+    # The output layer is summed right away, so every product is one dot
+    # and the biases are summed alongside it
+    assert counts["dot"] == 6 + 1
+    assert counts["sum"] == 1
+    # The inputs are stacked once for every hidden row
+    assert counts["stack"] == (1 + 6) + 2 + 1
+
+    assert vectorized.find_edges() == graph.find_edges()
+    assert vectorized.find_parameter_names() == graph.find_parameter_names()
+
+
+def test_vectorized_model_matches():
+    graph = make_graph()
+
+    torch.manual_seed(0)
+    initial = {
+        name: torch.randn(1, dtype=torch.float64)
+        for name in graph.find_parameter_names()
+    }
+    data = {edge: torch.randn(100, dtype=torch.float64) for edge in graph.find_edges()}
+
+    scalar = Model(graph, initial, vectorize=False)
+    vectorized = Model(graph, initial)
+
+    scalar_out = scalar.create_module(data)()
+    vectorized_out = vectorized.create_module(data)()
+    assert torch.allclose(scalar_out, vectorized_out)
+
+    scalar_out.sum().backward()
+    vectorized_out.sum().backward()
+    for (scalar_param, vectorized_param) in zip(
+        scalar.parameters_list(), vectorized.parameters_list()
+    ):
+        assert torch.allclose(scalar_param.grad, vectorized_param.grad)
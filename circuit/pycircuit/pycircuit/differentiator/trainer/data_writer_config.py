@@ -3,6 +3,7 @@ from dataclasses_json import DataClassJsonMixin
 from typing import List, Set
 
 from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.graph import output_to_name
 
 
 @dataclass
@@ -11,3 +12,32 @@ class WriterConfig(DataClassJsonMixin):
     target_output: ComponentOutput
     sample_on: ComponentOutput
     ms_future: int
+
+    @staticmethod
+    def union(configs: List["WriterConfig"]) -> "WriterConfig":
+        """Combines configs sampling the same target into one writing every output"""
+        if not configs:
+            raise ValueError("No writer configs to combine")
+
+        first = configs[0]
+        for config in configs[1:]:
+            if (config.target_output, config.sample_on, config.ms_future) != (
+                first.target_output,
+                first.sample_on,
+                first.ms_future,
+            ):
+                raise ValueError(
+                    "Cannot combine writer configs with different targets or sampling: "
+                    f"{first} and {config}"
+                )
+
+        outputs: Set[ComponentOutput] = set()
+        for config in configs:
+            outputs.update(config.outputs)
+
+        return WriterConfig(
+            outputs=sorted(outputs, key=output_to_name),
+            target_output=first.target_output,
+            sample_on=first.sample_on,
+            ms_future=first.ms_future,
+        )
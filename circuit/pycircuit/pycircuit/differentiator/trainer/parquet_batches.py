@@ -0,0 +1,172 @@
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import torch
+
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.graph import output_to_name
+from pycircuit.differentiator.tensor import CircuitTensor, Precision
+from pycircuit.differentiator.trainer.data_writer_config import WriterConfig
+
+SAMPLE_COLUMNS = ["target", "target_future", "time"]
+
+
+@dataclass
+class SampleBatch:
+    edges: Dict[ComponentOutput, CircuitTensor]
+    target: CircuitTensor
+
+    def __len__(self) -> int:
+        return len(self.target)
+
+
+def expected_columns(writer_config: WriterConfig) -> List[str]:
+    return [output_to_name(output) for output in writer_config.outputs] + SAMPLE_COLUMNS
+
+
+class ParquetSampleLoader:
+    """Streams mini-batches of samples out of a parquet file, one row group at a time
+
+    Like the in-memory trainer, rows with missing values are dropped, then the first
+    skip_rows of the rest, and the remainder is split into train and test sets by
+    train_frac. Both count complete rows, so the splits are the same. Finding the
+    complete rows of each row group takes one pass over the file up front.
+
+    Training batches are shuffled by visiting row groups in a random order, and
+    shuffling rows within a window of shuffle_row_groups row groups at a time.
+    At most that many row groups are ever held in memory.
+
+    Edges and targets are loaded in the dtype of precision. Targets are normalized
+    in float64 before being cast to it
+    """
+
+    def __init__(
+        self,
+        path: str,
+        writer_config: WriterConfig,
+        batch_size: int,
+        train_frac: float = 0.8,
+        skip_rows: int = 1000,
+        scale_by: float = 1,
+        shuffle_row_groups: int = 4,
+        seed: int = 0,
+        precision: Precision = Precision.Float64,
+    ):
+        self._file = pq.ParquetFile(path)
+        self._outputs = writer_config.outputs
+        self._columns = expected_columns(writer_config)
+
+        if self._file.schema_arrow.names != self._columns:
+            raise ValueError(
+                f"""Input data and writer config recorded different edges.
+Input data: {self._file.schema_arrow.names}
+Writer: {self._columns}
+        """
+            )
+
+        self.batch_size = batch_size
+        self.scale_by = scale_by
+        self.shuffle_row_groups = max(shuffle_row_groups, 1)
+        self.seed = seed
+        self.precision = precision
+
+        self.target_mean = 0.0
+        self.target_std = 1.0
+
+        # Complete rows covered by each row group
+        self._row_groups: List[Tuple[int, int]] = []
+        start = 0
+        for idx in range(self._file.metadata.num_row_groups):
+            end = start + len(self._read_complete(idx))
+            self._row_groups.append((start, end))
+            start = end
+
+        usable = max(start - skip_rows, 0)
+        self._train_range = (skip_rows, skip_rows + int(usable * train_frac))
+        self._test_range = (self._train_range[1], start)
+
+    def _groups_in(self, rows: Tuple[int, int]) -> List[int]:
+        return [
+            idx
+            for (idx, (start, end)) in enumerate(self._row_groups)
+            if start < rows[1] and end > rows[0]
+        ]
+
+    def _read_complete(self, idx: int) -> pd.DataFrame:
+        data = self._file.read_row_group(idx, columns=self._columns).to_pandas()
+        return data.dropna()
+
+    def _read(self, idx: int, rows: Tuple[int, int]) -> pd.DataFrame:
+        (start, end) = self._row_groups[idx]
+        data = self._read_complete(idx)
+        return data.iloc[max(rows[0] - start, 0) : min(rows[1], end) - start]
+
+    def _to_batch(self, data: pd.DataFrame) -> SampleBatch:
+        returns = (data["target_future"] - data["target"]) / data["target"]
+        target = torch.tensor(returns.astype("float64").to_numpy() * self.scale_by)
+        return SampleBatch(
+            edges={
+                output: torch.tensor(
+                    data[output_to_name(output)]
+                    .astype(self.precision.numpy_dtype())
+                    .to_numpy()
+                )
+                for output in self._outputs
+            },
+            target=((target - self.target_mean) / self.target_std).to(
+                self.precision.dtype()
+            ),
+        )
+
+    def normalize_target(self):
+        """Normalizes targets by the mean and std of the training returns
+
+        Like the in-memory trainer, the statistics are of the unscaled returns
+        """
+        count = 0
+        total = 0.0
+        total_sq = 0.0
+        for idx in self._groups_in(self._train_range):
+            data = self._read(idx, self._train_range)
+            returns = (
+                (data["target_future"] - data["target"]) / data["target"]
+            ).to_numpy(dtype="float64")
+            count += len(returns)
+            total += float(returns.sum())
+            total_sq += float((returns * returns).sum())
+
+        if count < 2:
+            raise ValueError("Not enough training rows to normalize the target")
+
+        self.target_mean = total / count
+        self.target_std = float(
+            np.sqrt(max(total_sq - total * total / count, 0.0) / (count - 1))
+        )
+        print(
+            f"Normalizing target with mean {self.target_mean} and std {self.target_std}"
+        )
+
+    def _batches_of(self, data: pd.DataFrame) -> Iterator[SampleBatch]:
+        for start in range(0, len(data), self.batch_size):
+            yield self._to_batch(data.iloc[start : start + self.batch_size])
+
+    def train_batches(self, epoch: int) -> Iterator[SampleBatch]:
+        rng = np.random.default_rng((self.seed, epoch))
+        groups = list(rng.permutation(self._groups_in(self._train_range)))
+
+        for window in range(0, len(groups), self.shuffle_row_groups):
+            data = pd.concat(
+                [
+                    self._read(idx, self._train_range)
+                    for idx in groups[window : window + self.shuffle_row_groups]
+                ]
+            )
+            data = data.iloc[rng.permutation(len(data))]
+            yield from self._batches_of(data)
+
+    def test_batches(self) -> Iterator[SampleBatch]:
+        for idx in self._groups_in(self._test_range):
+            yield from self._batches_of(self._read(idx, self._test_range))
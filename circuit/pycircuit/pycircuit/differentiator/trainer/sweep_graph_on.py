@@ -0,0 +1,233 @@
+"""Trains one graph under many configurations in parallel
+
+The samples are loaded and the graph is parsed once, then every worker trains
+configurations out of the grid of learning rates, shrink factors and seeds.
+Sample tensors are moved into shared memory before the workers start,
+so each worker maps the same data instead of holding a copy of it.
+
+The parameters of the configuration with the lowest test loss are written
+as a params json of {name: value}, which is what DoubleParameter::init reads,
+merged over the params json at base_params_path if given
+"""
+
+from argparse_dataclass import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import torch
+import torch.multiprocessing
+import torchmetrics.functional
+from torch.optim import Adam
+
+from pycircuit.differentiator.graph import Graph, Model
+from pycircuit.differentiator.tensor import Precision
+from pycircuit.differentiator.trainer.train_graph_on import (
+    FullBatch,
+    load_full_batch,
+    load_graph,
+)
+
+
+@dataclass
+class SweepOptions:
+    graph_file_path: str
+    writer_config_path: str
+    parquet_path: str
+    out_path: str = "params.json"
+    # Parameters of every other component, i.e. the params.json written
+    # alongside the circuit, which the trained parameters are merged into
+    base_params_path: Optional[str] = None
+    lrs: List[float] = field(default_factory=lambda: [0.01], metadata=dict(nargs="+"))
+    lr_shrink_bys: List[float] = field(
+        default_factory=lambda: [5.0], metadata=dict(nargs="+")
+    )
+    # Seeds for the initial parameter values
+    seeds: List[int] = field(default_factory=lambda: [0], metadata=dict(nargs="+"))
+    lr_shrinkings: int = 1
+    epochs_per_run: int = 1000
+    scale_by: float = 1
+    train_frac: float = 0.8
+    skip_rows: int = 1000
+    normalize_target: bool = True
+    precision: Precision = field(
+        default=Precision.Float64, metadata=dict(choices=list(Precision))
+    )
+    jobs: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class SweepConfig:
+    lr: float
+    lr_shrink_by: float
+    seed: int
+
+
+@dataclass
+class SweepResult:
+    config: SweepConfig
+    # Infinite if training diverged
+    test_loss: float
+    test_r2: float
+    parameters: Dict[str, float]
+
+
+_graph: Optional[Graph] = None
+_samples: Optional[FullBatch] = None
+_options: Optional[SweepOptions] = None
+
+
+def _init_worker(
+    graph: Graph, samples: FullBatch, options: SweepOptions, threads: int
+):
+    global _graph, _samples, _options
+    _graph = graph
+    _samples = samples
+    _options = options
+    torch.set_num_threads(threads)
+
+
+def _train_config(config: SweepConfig) -> SweepResult:
+    assert _graph is not None and _samples is not None and _options is not None
+
+    torch.manual_seed(config.seed)
+    model = Model(_graph, precision=_options.precision)
+    module = model.create_module(_samples.train_inputs)
+    test_module = model.create_module(_samples.test_inputs)
+
+    optim = Adam(model.parameters_list(), lr=config.lr)
+    mse_loss = torch.nn.MSELoss()
+
+    for _ in range(0, _options.lr_shrinkings):
+        for _ in range(0, _options.epochs_per_run):
+            projected = module() * _options.scale_by
+            computed_loss = mse_loss(projected, _samples.train_target)
+
+            if torch.isnan(computed_loss):
+                return SweepResult(
+                    config=config, test_loss=math.inf, test_r2=-math.inf, parameters={}
+                )
+
+            optim.zero_grad()
+            computed_loss.backward()
+            optim.step()
+
+        for param_goup in optim.param_groups:
+            param_goup["lr"] /= config.lr_shrink_by
+
+    with torch.no_grad():
+        test_projected = test_module() * _options.scale_by
+        test_loss = float(mse_loss(test_projected, _samples.test_target))
+        test_r2 = float(
+            torchmetrics.functional.r2_score(test_projected, _samples.test_target)
+        )
+
+    if math.isnan(test_loss):
+        test_loss = math.inf
+
+    return SweepResult(
+        config=config,
+        test_loss=test_loss,
+        test_r2=test_r2,
+        parameters={
+            name: float(param.detach())
+            for (name, param) in model.parameters().items()
+        },
+    )
+
+
+def run_sweep(
+    graph: Graph,
+    samples: FullBatch,
+    options: SweepOptions,
+    configs: List[SweepConfig],
+) -> List[SweepResult]:
+    """Trains every config, and returns the results from best to worst"""
+    max_workers = options.jobs
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    max_workers = min(max_workers, len(configs))
+    threads = max((os.cpu_count() or 1) // max(max_workers, 1), 1)
+
+    if max_workers <= 1:
+        _init_worker(graph, samples, options, threads)
+        results = [_train_config(config) for config in configs]
+    else:
+        samples.share_memory()
+        # torch isn't fork-safe once its thread pools have started
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=torch.multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(graph, samples, options, threads),
+        ) as pool:
+            results = list(pool.map(_train_config, configs))
+
+    return sorted(results, key=lambda result: result.test_loss)
+
+
+def write_best_parameters(
+    best: SweepResult, out_path: str, base_params_path: Optional[str] = None
+):
+    """Writes the trained parameters of best, over those in base_params_path"""
+    if math.isinf(best.test_loss):
+        raise ValueError("Every configuration diverged")
+
+    params: Dict[str, object] = {}
+    if base_params_path is not None:
+        params.update(json.load(open(base_params_path)))
+    params.update(best.parameters)
+
+    with open(out_path, "w") as write_to:
+        write_to.write(json.dumps(params))
+
+
+def main():
+    args = ArgumentParser(SweepOptions).parse_args(sys.argv[1:])
+
+    (graph, writer_config) = load_graph(args.graph_file_path, args.writer_config_path)
+    samples = load_full_batch(
+        args.parquet_path,
+        writer_config,
+        args.train_frac,
+        args.scale_by,
+        args.normalize_target,
+        args.precision,
+        args.skip_rows,
+    )
+
+    configs = [
+        SweepConfig(lr=lr, lr_shrink_by=lr_shrink_by, seed=seed)
+        for (lr, lr_shrink_by, seed) in itertools.product(
+            args.lrs, args.lr_shrink_bys, args.seeds
+        )
+    ]
+
+    start = time.time()
+    results = run_sweep(graph, samples, args, configs)
+    print(f"Trained {len(configs)} configurations in {time.time() - start} seconds")
+
+    for result in results:
+        print(
+            f"lr {result.config.lr}, shrink by {result.config.lr_shrink_by}, "
+            f"seed {result.config.seed}: "
+            f"test MSE loss {result.test_loss}, test r^2 {result.test_r2}"
+        )
+
+    best = results[0]
+    write_best_parameters(best, args.out_path, args.base_params_path)
+
+    print(f"Wrote parameters of lr {best.config.lr}, ", end="")
+    print(f"shrink by {best.config.lr_shrink_by}, seed {best.config.seed}")
+    print(f"to {args.out_path}")
+
+
+if __name__ == "__main__":
+    main()
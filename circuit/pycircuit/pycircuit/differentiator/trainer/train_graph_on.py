@@ -1,6 +1,7 @@
 from argparse_dataclass import ArgumentParser
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import json
+from typing import Dict, Iterator, Optional, Tuple
 import sys
 
 import pandas as pd
@@ -11,11 +12,13 @@ from torch.optim import SGD, Adam
 import time
 
 from pycircuit.differentiator.trainer.data_writer_config import WriterConfig
+from pycircuit.differentiator.trainer.parquet_batches import (
+    ParquetSampleLoader,
+    SampleBatch,
+)
+from pycircuit.circuit_builder.component import ComponentOutput
 from pycircuit.differentiator.graph import Graph, output_to_name, Model
-
-import sys
-
-sys.setrecursionlimit(5000)
+from pycircuit.differentiator.tensor import Precision
 
 
 @dataclass
@@ -29,19 +32,166 @@ class TrainerOptions:
     lr_shrink_by: float = 5
     epochs_per_run: int = 1000
     print_params: bool = False
+    # Lowers the graph into a straight-line module and compiles it with torch.compile
     torch_compile: bool = False
     train_frac: float = 0.8
+    # Skipped before splitting, counting only rows without missing values
+    skip_rows: int = 1000
     normalize_target: bool = True
+    # When set, stream shuffled mini-batches of this many rows out of the parquet file
+    # instead of training on every row at once. epochs_per_run then counts full passes
+    batch_size: Optional[int] = None
+    shuffle_row_groups: int = 4
+    seed: int = 0
+    # Recompute this many segments of the graph during backward instead of
+    # keeping every intermediate alive. Can't be combined with torch_compile
+    checkpoint_segments: int = 0
+    # float32 halves the memory of the samples and model,
+    # mixed also accumulates mean, std and sums in float64
+    precision: Precision = field(
+        default=Precision.Float64, metadata=dict(choices=list(Precision))
+    )
 
 
-def main():
-    args = ArgumentParser(TrainerOptions).parse_args(sys.argv[1:])
+@dataclass
+class RegressionStats:
+    """Accumulates the mse and r^2 of predictions over many batches"""
 
-    # Hacks since book fair is garbage around early day
-    in_data = pd.DataFrame(pd.read_parquet(args.parquet_path).dropna()[1000:])
+    count: int = 0
+    squared_error: float = 0.0
+    target_sum: float = 0.0
+    target_sq_sum: float = 0.0
+
+    def add(self, projected: torch.Tensor, target: torch.Tensor):
+        self.count += len(target)
+        self.squared_error += float(torch.sum((projected - target) ** 2))
+        self.target_sum += float(torch.sum(target))
+        self.target_sq_sum += float(torch.sum(target**2))
+
+    def mse(self) -> float:
+        if self.count == 0:
+            raise ValueError("No rows to evaluate on")
+        return self.squared_error / self.count
+
+    def r2(self) -> float:
+        if self.count == 0:
+            raise ValueError("No rows to evaluate on")
+        total_variance = self.target_sq_sum - self.target_sum**2 / self.count
+        return 1 - self.squared_error / total_variance
+
+
+@torch.no_grad()
+def evaluate_batches(
+    module: torch.nn.Module, batches: Iterator[SampleBatch], scale_by: float
+) -> Tuple[float, float]:
+    """Returns the mse and r^2 of the module over every batch"""
+    stats = RegressionStats()
+    for batch in batches:
+        stats.add(module(batch.edges) * scale_by, batch.target)
+
+    return (stats.mse(), stats.r2())
+
+
+def train_streaming(args: TrainerOptions, graph: Graph, writer_config: WriterConfig):
+    """Trains on shuffled mini-batches streamed out of the parquet file
+
+    Summary operators (mean, std) see a single batch at a time,
+    so batches should be large enough for those to be stable
+    """
+    assert args.batch_size is not None
+
+    loader = ParquetSampleLoader(
+        args.parquet_path,
+        writer_config,
+        batch_size=args.batch_size,
+        train_frac=args.train_frac,
+        skip_rows=args.skip_rows,
+        scale_by=args.scale_by,
+        shuffle_row_groups=args.shuffle_row_groups,
+        seed=args.seed,
+        precision=args.precision,
+    )
+
+    if args.normalize_target:
+        loader.normalize_target()
+
+    model = Model(graph, precision=args.precision)
+    batched_module = model.create_batched_module(args.checkpoint_segments)
+    module: torch.nn.Module = batched_module
+    if args.torch_compile:
+        # The last batch of each window is shorter, don't recompile for every length
+        module = torch.compile(batched_module.lower(), dynamic=True)
+
+    optim = Adam(
+        model.parameters_list(),
+        lr=args.lr,
+    )
+    mse_loss = torch.nn.MSELoss()
+
+    def report():
+        (train_mse, train_r2) = evaluate_batches(
+            module, loader.train_batches(0), args.scale_by
+        )
+        (test_mse, test_r2) = evaluate_batches(
+            module, loader.test_batches(), args.scale_by
+        )
+        print("Train MSE loss: ", train_mse)
+        print("Test MSE loss: ", test_mse)
+        print("Train r^2: ", train_r2)
+        print("Test r^2: ", test_r2)
+
+        if args.print_params:
+            for (p_name, param) in model.parameters().items():
+                print(f"{p_name}: {float(param)}")
+
+    epoch = 0
+    for _ in range(0, args.lr_shrinkings):
+        for idx in range(0, args.epochs_per_run):
+            start = time.time()
+            batches = 0
+            for batch in loader.train_batches(epoch):
+                projected = module(batch.edges) * args.scale_by
+                computed_loss = mse_loss(projected, batch.target)
+
+                if torch.isnan(computed_loss):
+                    print(batched_module.diagnose(batch.edges).report())
+                    raise ValueError(f"Nan encountered in batch {batches}")
+
+                optim.zero_grad()
+                computed_loss.backward()
+                optim.step()
+                batches += 1
+
+            epoch += 1
+
+            if idx % 10 == 0 or idx == args.epochs_per_run - 1:
+                print(
+                    f"Pass over {batches} batches took {time.time() - start} seconds"
+                )
+                report()
+                print()
+                print()
+
+        for param_goup in optim.param_groups:
+            param_goup["lr"] /= args.lr_shrink_by
+
+    report()
+
+
+def check_compile_options(torch_compile: bool, checkpoint_segments: int):
+    # The lowered graph is a single straight-line function without the schedule
+    if torch_compile and checkpoint_segments > 1:
+        raise ValueError(
+            "checkpoint_segments can't be combined with torch_compile, "
+            "the compiled graph keeps every intermediate alive"
+        )
 
-    graph = Graph.from_dict(json.load(open(args.graph_file_path)))
-    writer_config = WriterConfig.from_dict(json.load(open(args.writer_config_path)))
+
+def load_graph(
+    graph_file_path: str, writer_config_path: str
+) -> Tuple[Graph, WriterConfig]:
+    graph = Graph.from_dict(json.load(open(graph_file_path)))
+    writer_config = WriterConfig.from_dict(json.load(open(writer_config_path)))
 
     if graph.find_edges() != writer_config.outputs:
         raise ValueError(
@@ -51,6 +201,42 @@ Writer: {writer_config.outputs}
         """
         )
 
+    return (graph, writer_config)
+
+
+@dataclass
+class FullBatch:
+    train_inputs: Dict[ComponentOutput, torch.Tensor]
+    test_inputs: Dict[ComponentOutput, torch.Tensor]
+    train_target: torch.Tensor
+    test_target: torch.Tensor
+
+    def share_memory(self) -> "FullBatch":
+        """Moves every tensor into shared memory, so worker processes don't copy them"""
+        for inputs in (self.train_inputs, self.test_inputs):
+            for tensor in inputs.values():
+                tensor.share_memory_()
+        self.train_target.share_memory_()
+        self.test_target.share_memory_()
+        return self
+
+
+def load_full_batch(
+    parquet_path: str,
+    writer_config: WriterConfig,
+    train_frac: float,
+    scale_by: float,
+    normalize_target: bool,
+    precision: Precision = Precision.Float64,
+    skip_rows: int = 1000,
+) -> FullBatch:
+    """Loads every sample into memory, with edges and targets in precision's dtype
+
+    Targets are normalized in float64 before being cast
+    """
+    # Hacks since book fair is garbage around early day
+    in_data = pd.DataFrame(pd.read_parquet(parquet_path).dropna()[skip_rows:])
+
     named_outputs = [output_to_name(output) for output in writer_config.outputs] + [
         "target",
         "target_future",
@@ -65,7 +251,7 @@ Writer: {named_outputs}
         """
         )
 
-    split_at = int(len(in_data) * args.train_frac)
+    split_at = int(len(in_data) * train_frac)
     train_data = in_data.iloc[:split_at]
     test_data = in_data.drop(train_data.index)
     train_target_returns = (
@@ -77,28 +263,29 @@ Writer: {named_outputs}
 
     in_data = None
 
+    numpy_dtype = precision.numpy_dtype()
     train_inputs = {
         output: torch.tensor(
-            train_data[output_to_name(output)].astype("float64").to_numpy()
+            train_data[output_to_name(output)].astype(numpy_dtype).to_numpy()
         )
         for output in writer_config.outputs
     }
 
     test_inputs = {
         output: torch.tensor(
-            test_data[output_to_name(output)].astype("float64").to_numpy()
+            test_data[output_to_name(output)].astype(numpy_dtype).to_numpy()
         )
         for output in writer_config.outputs
     }
 
     train_target = torch.tensor(
-        train_target_returns.astype("float64").to_numpy() * args.scale_by
+        train_target_returns.astype("float64").to_numpy() * scale_by
     )
     test_target = torch.tensor(
-        test_target_returns.astype("float64").to_numpy() * args.scale_by
+        test_target_returns.astype("float64").to_numpy() * scale_by
     )
 
-    if args.normalize_target:
+    if normalize_target:
         train_mean = train_target_returns.mean()
         train_std = train_target_returns.std()
 
@@ -107,10 +294,42 @@ Writer: {named_outputs}
         train_mean = 0.0
         train_std = 1.0
 
-    train_target = (train_target - train_mean) / train_std
-    test_target = (test_target - train_mean) / train_std
+    train_target = ((train_target - train_mean) / train_std).to(precision.dtype())
+    test_target = ((test_target - train_mean) / train_std).to(precision.dtype())
+
+    return FullBatch(
+        train_inputs=train_inputs,
+        test_inputs=test_inputs,
+        train_target=train_target,
+        test_target=test_target,
+    )
 
-    model = Model(graph)
+
+def main():
+    args = ArgumentParser(TrainerOptions).parse_args(sys.argv[1:])
+    check_compile_options(args.torch_compile, args.checkpoint_segments)
+
+    (graph, writer_config) = load_graph(args.graph_file_path, args.writer_config_path)
+
+    if args.batch_size is not None:
+        train_streaming(args, graph, writer_config)
+        return
+
+    samples = load_full_batch(
+        args.parquet_path,
+        writer_config,
+        args.train_frac,
+        args.scale_by,
+        args.normalize_target,
+        args.precision,
+        args.skip_rows,
+    )
+    train_inputs = samples.train_inputs
+    train_target = samples.train_target
+    test_inputs = samples.test_inputs
+    test_target = samples.test_target
+
+    model = Model(graph, precision=args.precision)
 
     optim = Adam(
         model.parameters_list(),
@@ -118,29 +337,17 @@ Writer: {named_outputs}
     )
     mse_loss = torch.nn.MSELoss()
 
-    module = model.create_module(train_inputs)
+    dag_module = model.create_module(train_inputs, args.checkpoint_segments)
+    module = dag_module
     test_module = model.create_module(test_inputs)
 
+    if args.torch_compile:
+        module = torch.compile(dag_module.lower())
+        test_module = torch.compile(test_module.lower())
+
     def detect_nan(projected, loss):
         if torch.isnan(loss) or torch.any(torch.isnan(projected)):
-            from pycircuit.differentiator import operator
-
-            operator.VERBOSE = True
-
-            projected_nan = torch.isnan(projected)
-
-            first_true = index(projected_nan, True)
-
-            adjusted_data = {
-                name: data[first_true] for (name, data) in train_inputs.items()
-            }
-
-            adjusted_module = model.create_module(adjusted_data)
-
-            adjusted_module()
-
-            operator.VERBOSE = False
-
+            print(dag_module.diagnose().report())
             raise ValueError("Nan encountered")
 
     @torch.no_grad()
@@ -201,28 +408,5 @@ Writer: {named_outputs}
     report(projected, computed_loss)
 
 
-def index(tensor: torch.Tensor, value, ith_match: int = 0) -> torch.Tensor:
-    """
-    Returns generalized index (i.e. location/coordinate) of the first occurence of value
-    in Tensor. For flat tensors (i.e. arrays/lists) it returns the indices of the occurrences
-    of the value you are looking for. Otherwise, it returns the "index" as a coordinate.
-    If there are multiple occurences then you need to choose which one you want with ith_index.
-    e.g. ith_index=0 gives first occurence.
-
-    Reference: https://stackoverflow.com/a/67175757/1601580
-    :return:
-    """
-    # bool tensor of where value occurred
-    places_where_value_occurs = tensor == value
-    # get matches as a "coordinate list" where occurence happened
-    matches = (tensor == value).nonzero()  # [number_of_matches, tensor_dimension]
-    if matches.size(0) == 0:  # no matches
-        return -1
-    else:
-        # get index/coordinate of the occurence you want (e.g. 1st occurence ith_match=0)
-        index = matches[ith_match]
-        return index
-
-
 if __name__ == "__main__":
     main()
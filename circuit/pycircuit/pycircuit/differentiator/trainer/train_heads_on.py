@@ -0,0 +1,175 @@
+from argparse_dataclass import ArgumentParser
+from dataclasses import dataclass, field
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List
+
+import torch
+from torch.optim import Adam
+
+from pycircuit.differentiator.graph import Graph, Model
+from pycircuit.differentiator.joint import merge_graphs
+from pycircuit.differentiator.tensor import Precision
+from pycircuit.differentiator.trainer.data_writer_config import WriterConfig
+from pycircuit.differentiator.trainer.parquet_batches import (
+    ParquetSampleLoader,
+    SampleBatch,
+)
+from pycircuit.differentiator.trainer.train_graph_on import (
+    RegressionStats,
+    check_compile_options,
+)
+
+
+@dataclass
+class JointTrainerOptions:
+    # Each graph is a head, named after its file
+    graph_file_paths: List[str] = field(metadata=dict(nargs="+"))
+    # Must write every edge of every graph, i.e. the joint writer config
+    writer_config_path: str
+    parquet_path: str
+    batch_size: int = 1 << 16
+    scale_by: float = 1
+    lr: float = 0.01
+    lr_shrinkings: int = 1
+    lr_shrink_by: float = 5
+    epochs_per_run: int = 100
+    print_params: bool = False
+    torch_compile: bool = False
+    train_frac: float = 0.8
+    skip_rows: int = 1000
+    normalize_target: bool = True
+    shuffle_row_groups: int = 4
+    seed: int = 0
+    checkpoint_segments: int = 0
+    precision: Precision = field(
+        default=Precision.Float64, metadata=dict(choices=list(Precision))
+    )
+
+
+def head_name(graph_file_path: str) -> str:
+    file_name = os.path.basename(graph_file_path)
+    return file_name.removesuffix(".json").removesuffix("_graph")
+
+
+@torch.no_grad()
+def evaluate_heads(
+    module: torch.nn.Module,
+    heads: List[str],
+    batches: Iterator[SampleBatch],
+    scale_by: float,
+) -> Dict[str, RegressionStats]:
+    stats = {head: RegressionStats() for head in heads}
+    for batch in batches:
+        for (head, projected) in zip(heads, module(batch.edges)):
+            stats[head].add(projected * scale_by, batch.target)
+    return stats
+
+
+def main():
+    args = ArgumentParser(JointTrainerOptions).parse_args(sys.argv[1:])
+    check_compile_options(args.torch_compile, args.checkpoint_segments)
+
+    graphs = {
+        head_name(path): Graph.from_dict(json.load(open(path)))
+        for path in args.graph_file_paths
+    }
+    if len(graphs) != len(args.graph_file_paths):
+        raise ValueError(f"Graph files {args.graph_file_paths} have duplicate names")
+
+    writer_config = WriterConfig.from_dict(json.load(open(args.writer_config_path)))
+
+    for (head, graph) in graphs.items():
+        missing = set(graph.find_edges()) - set(writer_config.outputs)
+        if missing:
+            raise ValueError(
+                f"Writer config does not record edges {missing} of graph {head}"
+            )
+
+    joint = merge_graphs(graphs)
+    heads = list(joint.heads.keys())
+    print(
+        f"Merged {sum(len(graph.nodes) for graph in graphs.values())} nodes "
+        f"of {len(heads)} graphs into {len(joint.graph.nodes)}"
+    )
+
+    loader = ParquetSampleLoader(
+        args.parquet_path,
+        writer_config,
+        batch_size=args.batch_size,
+        train_frac=args.train_frac,
+        skip_rows=args.skip_rows,
+        scale_by=args.scale_by,
+        shuffle_row_groups=args.shuffle_row_groups,
+        seed=args.seed,
+        precision=args.precision,
+    )
+
+    if args.normalize_target:
+        loader.normalize_target()
+
+    model = Model(joint.graph, roots=joint.roots(), precision=args.precision)
+    batched_module = model.create_batched_module(args.checkpoint_segments)
+    module: torch.nn.Module = batched_module
+    if args.torch_compile:
+        module = torch.compile(batched_module.lower(), dynamic=True)
+
+    optim = Adam(
+        model.parameters_list(),
+        lr=args.lr,
+    )
+    mse_loss = torch.nn.MSELoss()
+
+    def report():
+        test_stats = evaluate_heads(module, heads, loader.test_batches(), args.scale_by)
+        for (head, stats) in test_stats.items():
+            print(f"{head}: test MSE loss {stats.mse()}, test r^2 {stats.r2()}")
+
+        if args.print_params:
+            for (p_name, param) in model.parameters().items():
+                print(f"{p_name}: {float(param)}")
+
+    epoch = 0
+    for _ in range(0, args.lr_shrinkings):
+        for idx in range(0, args.epochs_per_run):
+            start = time.time()
+            train_stats = {head: RegressionStats() for head in heads}
+            for batch in loader.train_batches(epoch):
+                projections = module(batch.edges)
+
+                # Each head is fit to the target on its own,
+                # shared parameters get the gradient of every head using them
+                losses = []
+                for (head, projected) in zip(heads, projections):
+                    projected = projected * args.scale_by
+                    head_loss = mse_loss(projected, batch.target)
+                    if torch.isnan(head_loss):
+                        print(batched_module.diagnose(batch.edges).report())
+                        raise ValueError(f"Nan encountered in head {head}")
+                    losses.append(head_loss)
+                    train_stats[head].add(projected.detach(), batch.target)
+
+                optim.zero_grad()
+                torch.stack(losses).sum().backward()
+                optim.step()
+
+            epoch += 1
+
+            if idx % 10 == 0 or idx == args.epochs_per_run - 1:
+                print(f"Pass took {time.time() - start} seconds")
+                for (head, stats) in train_stats.items():
+                    print(f"{head}: train MSE loss {stats.mse()}")
+                report()
+                print()
+                print()
+
+        for param_goup in optim.param_groups:
+            param_goup["lr"] /= args.lr_shrink_by
+
+    report()
+
+
+if __name__ == "__main__":
+    main()
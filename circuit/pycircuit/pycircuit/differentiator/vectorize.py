@@ -0,0 +1,180 @@
+"""Rewrites the scalar arithmetic of a graph into stacked tensor operations
+
+Circuits only have scalar operators, so a linear regression or a matrix multiply
+is built as a tree of adds over products (see tree_sum and Matrix.multiply).
+Evaluated node by node, a layer of an mlp costs rows * columns operators.
+
+vectorize_graph finds each tree of adds and rewrites it into
+    * a dot of two stacks, if the terms are products
+    * a sum of a stack, for any other terms
+Only adds and products consumed by nothing but the tree are rewritten away.
+Identical stacks are shared, so the rows of a matrix multiply
+only stack the column they are multiplied by once.
+"""
+
+from typing import Dict, Iterable, List, Set, Tuple
+
+from pycircuit.circuit_builder.component import ComponentOutput
+from pycircuit.differentiator.graph import (
+    Graph,
+    Node,
+    NodeBatch,
+    OperatorNode,
+    node_inputs,
+)
+
+VECTORIZED_PREFIX = "vectorized"
+
+
+class _Vectorizer:
+    def __init__(self, graph: Graph, keep: Iterable[ComponentOutput]):
+        self.keep = {graph.root, *keep}
+        self.nodes: Dict[ComponentOutput, Node] = dict(graph.nodes)
+        self.stacks: Dict[Tuple[ComponentOutput, ...], ComponentOutput] = {}
+        self.created = 0
+
+        self.consumers: Dict[ComponentOutput, List[ComponentOutput]] = {
+            output: [] for output in self.nodes
+        }
+        for (output, node) in self.nodes.items():
+            for input in node_inputs(node):
+                self.consumers[input].append(output)
+
+        # Adds summed directly into another add, which belong to the tree of that one.
+        # Found up front since rewriting changes the operators of roots
+        self.absorbed: Set[ComponentOutput] = {
+            output
+            for output in self.nodes
+            if self._is_exclusive(output, "add")
+            and self._is_op(self.consumers[output][0], "add")
+        }
+
+    def _is_op(self, output: ComponentOutput, operator_name: str) -> bool:
+        node = self.nodes.get(output)
+        return isinstance(node, OperatorNode) and node.operator_name == operator_name
+
+    def _is_exclusive(self, output: ComponentOutput, operator_name: str) -> bool:
+        return (
+            output not in self.keep
+            and self._is_op(output, operator_name)
+            and len(self.consumers[output]) == 1
+        )
+
+    def _new_output(self, kind: str) -> ComponentOutput:
+        while True:
+            output = ComponentOutput(
+                parent=f"{VECTORIZED_PREFIX}_{kind}_{self.created}", output_name="out"
+            )
+            self.created += 1
+            if output not in self.nodes:
+                return output
+
+    def _stack(self, outputs: List[ComponentOutput]) -> ComponentOutput:
+        key = tuple(outputs)
+        if key not in self.stacks:
+            stacked = self._new_output("stack")
+            self.nodes[stacked] = OperatorNode(
+                output=stacked,
+                operator_name="stack",
+                single_inputs={},
+                array_inputs={
+                    "values": [NodeBatch(nodes={"a": output}) for output in outputs]
+                },
+            )
+            self.stacks[key] = stacked
+        return self.stacks[key]
+
+    def _terms(
+        self, root: ComponentOutput
+    ) -> Tuple[List[ComponentOutput], List[ComponentOutput]]:
+        """Returns the terms summed by the tree of adds at root, and the adds inside it"""
+        terms: List[ComponentOutput] = []
+        absorbed: List[ComponentOutput] = []
+        stack = [root]
+        while stack:
+            output = stack.pop()
+            if output != root and output not in self.absorbed:
+                terms.append(output)
+                continue
+            if output != root:
+                absorbed.append(output)
+            node = self.nodes[output]
+            assert isinstance(node, OperatorNode)
+            stack.append(node.single_inputs["b"])
+            stack.append(node.single_inputs["a"])
+        return (terms, absorbed)
+
+    def rewrite(self, root: ComponentOutput) -> bool:
+        (terms, absorbed) = self._terms(root)
+
+        # A single add is already as cheap as it gets
+        if len(terms) < 3:
+            return False
+
+        products = [term for term in terms if self._is_exclusive(term, "mul")]
+        if len(products) >= 2:
+            rest = [term for term in terms if term not in products]
+            dot = self._new_output("dot") if rest else root
+
+            factors = [self.nodes[product] for product in products]
+            self.nodes[dot] = OperatorNode(
+                output=dot,
+                operator_name="dot",
+                single_inputs={
+                    input_name: self._stack(
+                        [
+                            factor.single_inputs[input_name]
+                            for factor in factors
+                            if isinstance(factor, OperatorNode)
+                        ]
+                    )
+                    for input_name in ("a", "b")
+                },
+                array_inputs={},
+            )
+            absorbed += products
+            rest.append(dot)
+        else:
+            rest = terms
+
+        match rest:
+            case [only] if only == root:
+                pass
+            case [a, b]:
+                self.nodes[root] = OperatorNode(
+                    output=root,
+                    operator_name="add",
+                    single_inputs={"a": a, "b": b},
+                    array_inputs={},
+                )
+            case _:
+                self.nodes[root] = OperatorNode(
+                    output=root,
+                    operator_name="sum",
+                    single_inputs={"a": self._stack(rest)},
+                    array_inputs={},
+                )
+
+        for output in absorbed:
+            del self.nodes[output]
+
+        return True
+
+
+def vectorize_graph(graph: Graph, keep: Iterable[ComponentOutput] = ()) -> Graph:
+    """Returns a graph computing the same as graph, with sums as stacked operators
+
+    The root and any outputs in keep are still computed by a node of their own
+    """
+    vectorizer = _Vectorizer(graph, keep)
+
+    roots = [
+        output
+        for output in graph.nodes
+        if vectorizer._is_op(output, "add") and output not in vectorizer.absorbed
+    ]
+
+    for root in roots:
+        vectorizer.rewrite(root)
+
+    return Graph(nodes=vectorizer.nodes, root=graph.root)
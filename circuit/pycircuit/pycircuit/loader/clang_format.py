@@ -0,0 +1,180 @@
+import hashlib
+import os
+import subprocess
+import tempfile
+from typing import Dict, List, Optional
+
+DEFAULT_CACHE_DIR = os.path.join("~", ".cache", "pycircuit", "clang-format")
+CACHE_DIR_ENV = "PYCIRCUIT_FORMAT_CACHE"
+
+STYLE_FILES = [".clang-format", "_clang-format"]
+
+# Keep well under any command line length limits
+MAX_FILES_PER_CALL = 256
+
+
+def _find_style(start: str) -> str:
+    """Returns the style file clang-format would pick up from start, if any"""
+    directory = os.path.abspath(start)
+    while True:
+        for name in STYLE_FILES:
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                with open(path) as style_file:
+                    return style_file.read()
+
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return ""
+        directory = parent
+
+
+def _run(command: List[str], on_input: Optional[str] = None) -> str:
+    p = subprocess.Popen(
+        command,
+        stdin=subprocess.PIPE if on_input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    (outs, errs) = p.communicate(
+        input=str.encode(on_input) if on_input is not None else None
+    )
+
+    if p.returncode != 0:
+        msg = f"""clang-format failed with returncode {p.returncode}:
+        {errs!r}"""
+        raise RuntimeError(msg)
+
+    return outs.decode(encoding="utf-8")
+
+
+class ClangFormatter:
+    """Formats buffers with clang-format, many at a time, behind an on-disk cache
+
+    Formatted output is cached by a hash of the input along with the clang-format
+    version and style, so rerunning generation on identical output never
+    spawns clang-format. Misses are written out to temporary files and formatted
+    in place by a single clang-format invocation.
+
+    Buffers are formatted as if read from stdin in the working directory,
+    so the same style file is picked up as by piping into clang-format.
+    The temporary files are written under the system temporary directory,
+    along with a copy of that style file.
+
+    Calling a formatter formats many buffers, so one can be handed to
+    emit_circuit_files.
+    """
+
+    def __init__(
+        self, command: List[str] = ["clang-format"], cache_dir: Optional[str] = None
+    ):
+        if cache_dir is None:
+            cache_dir = os.environ.get(CACHE_DIR_ENV, DEFAULT_CACHE_DIR)
+
+        self.command = list(command)
+        self.cache_dir = os.path.expanduser(cache_dir)
+        self._salt: Optional[str] = None
+
+    def cache_salt(self) -> str:
+        """The clang-format version and style, which formatted output depends on"""
+        if self._salt is None:
+            version = _run(self.command + ["--version"])
+            self._salt = version + _find_style(os.getcwd())
+        return self._salt
+
+    def _key_for(self, content: str) -> str:
+        return hashlib.sha256((self.cache_salt() + content).encode()).hexdigest()
+
+    def _cache_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _load_cached(self, key: str) -> Optional[str]:
+        try:
+            with open(self._cache_path(key)) as cached:
+                return cached.read()
+        except FileNotFoundError:
+            return None
+
+    def _store_cached(self, key: str, formatted: str):
+        path = self._cache_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Many processes may share a cache, so only ever expose complete entries
+        (fd, tmp_path) = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w") as tmp_file:
+            tmp_file.write(formatted)
+        os.replace(tmp_path, path)
+
+    def _format_uncached(self, contents: List[str]) -> List[str]:
+        formatted = []
+        style = _find_style(os.getcwd())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # clang-format picks up the style file next to the files it formats
+            if style:
+                with open(os.path.join(tmp_dir, STYLE_FILES[0]), "w") as style_file:
+                    style_file.write(style)
+
+            for start in range(0, len(contents), MAX_FILES_PER_CALL):
+                batch = contents[start : start + MAX_FILES_PER_CALL]
+                paths = [
+                    os.path.join(tmp_dir, f"buffer_{start + idx}.cc")
+                    for idx in range(len(batch))
+                ]
+                for (path, content) in zip(paths, batch):
+                    with open(path, "w") as write_to:
+                        write_to.write(content)
+
+                _run(self.command + ["-i"] + paths)
+
+                for path in paths:
+                    with open(path) as read_from:
+                        formatted.append(read_from.read())
+
+        return formatted
+
+    def format_many(self, contents: List[str]) -> List[str]:
+        keys = [self._key_for(content) for content in contents]
+
+        results: List[Optional[str]] = [self._load_cached(key) for key in keys]
+
+        # Identical buffers only need to be formatted once
+        missing: Dict[str, str] = {}
+        for (key, content, result) in zip(keys, contents, results):
+            if result is None:
+                missing[key] = content
+
+        if missing:
+            formatted = self._format_uncached(list(missing.values()))
+            for (key, result) in zip(missing.keys(), formatted):
+                self._store_cached(key, result)
+                missing[key] = result
+
+        return [
+            result if result is not None else missing[key]
+            for (key, result) in zip(keys, results)
+        ]
+
+    def format(self, content: str) -> str:
+        return self.format_many([content])[0]
+
+    def __call__(self, contents: List[str]) -> List[str]:
+        return self.format_many(contents)
+
+
+_DEFAULT_FORMATTER: Optional[ClangFormatter] = None
+
+
+def default_formatter() -> ClangFormatter:
+    global _DEFAULT_FORMATTER
+    if _DEFAULT_FORMATTER is None:
+        _DEFAULT_FORMATTER = ClangFormatter()
+    return _DEFAULT_FORMATTER
+
+
+def call_clang_format(on_content: str) -> str:
+    return default_formatter().format(on_content)
+
+
+def call_clang_format_batch(on_contents: List[str]) -> List[str]:
+    return default_formatter().format_many(on_contents)
@@ -0,0 +1,104 @@
+"""Reports where triggers spend their time, from the cycle counters of a circuit
+
+Circuits generated with cycle_counts in the loader config time every component
+call into a counter per (call or timer, component). Circuit::write_cycle_counts
+dumps those as json, which this maps back to the components and definitions
+of the circuit.
+"""
+
+import json
+import sys
+from dataclasses import dataclass
+from typing import Any, Dict, List
+
+from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
+from pycircuit.circuit_builder.circuit import CircuitData
+
+
+@dataclass
+class CycleCountOptions:
+    circuit_json: str
+    cycle_counts: str
+
+
+@dataclass
+class CycleCountRow:
+    trigger: str
+    component: str
+    class_name: str
+    header: str
+    cycles: int
+    calls: int
+
+    def cycles_per_call(self) -> float:
+        return self.cycles / self.calls if self.calls else 0.0
+
+
+def build_cycle_count_report(
+    circuit: CircuitData, counts: List[Dict[str, Any]]
+) -> List[CycleCountRow]:
+    rows = []
+    for count in counts:
+        component = circuit.components.get(count["component"])
+        if component is None:
+            raise ValueError(
+                f"Component {count['component']} timed by {count['trigger']} "
+                "is not in the circuit"
+            )
+        rows.append(
+            CycleCountRow(
+                trigger=count["trigger"],
+                component=component.name,
+                class_name=component.definition.class_name,
+                header=component.definition.header,
+                cycles=count["cycles"],
+                calls=count["calls"],
+            )
+        )
+    return rows
+
+
+def format_cycle_count_report(rows: List[CycleCountRow]) -> str:
+    """Lists the components of each trigger by the cycles they took
+
+    Triggers are ordered by their total cycles, most expensive first
+    """
+    by_trigger: Dict[str, List[CycleCountRow]] = {}
+    for row in rows:
+        by_trigger.setdefault(row.trigger, []).append(row)
+
+    totals = {
+        trigger: sum(row.cycles for row in trigger_rows)
+        for (trigger, trigger_rows) in by_trigger.items()
+    }
+
+    blocks = []
+    for trigger in sorted(by_trigger, key=lambda trigger: -totals[trigger]):
+        total = totals[trigger]
+        lines = [f"{trigger}: {total} cycles"]
+        for row in sorted(by_trigger[trigger], key=lambda row: -row.cycles):
+            share = 100 * row.cycles / total if total else 0.0
+            lines.append(
+                f"  {share:5.1f}% {row.cycles:>14} cycles {row.calls:>10} calls "
+                f"{row.cycles_per_call():>10.1f} per call  "
+                f"{row.component} ({row.class_name})"
+            )
+        blocks.append("\n".join(lines))
+
+    return "\n\n".join(blocks)
+
+
+def main():
+    args = ArgumentParser(CycleCountOptions).parse_args(sys.argv[1:])
+
+    circuit = load_circuit_file(args.circuit_json)
+
+    with open(args.cycle_counts) as counts_file:
+        counts = json.load(counts_file)
+
+    print(format_cycle_count_report(build_cycle_count_report(circuit, counts)))
+
+
+if __name__ == "__main__":
+    main()
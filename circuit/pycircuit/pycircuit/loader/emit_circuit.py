@@ -0,0 +1,292 @@
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Union
+
+from pycircuit.circuit_builder.circuit import CircuitData
+from pycircuit.cpp_codegen.generation_metadata import (
+    GenerationMetadata,
+    frozen_circuit,
+    generate_global_metadata,
+    prime_global_metadata,
+)
+from pycircuit.loader.clang_format import ClangFormatter
+from pycircuit.loader.emit_manifest import (
+    EmissionFingerprinter,
+    load_manifest,
+    write_if_changed,
+    write_manifest,
+)
+from pycircuit.loader.loader_config import CoreLoaderConfig
+from pycircuit.loader.write_circuit_call import CallStructOptions, generate_circuit_call
+from pycircuit.loader.write_circuit_call_dot import generate_circuit_call_dot
+from pycircuit.loader.write_circuit_dot import generate_full_circuit_dot
+from pycircuit.loader.write_circuit_init import InitStructOptions, generate_circuit_init
+from pycircuit.loader.write_circuit_struct import generate_circuit_struct_file
+from pycircuit.loader.write_timer_call import (
+    TimerCallStructOptions,
+    generate_timer_call,
+)
+
+# Formats many buffers at once, see loader/clang_format.py
+Formatter = Callable[[List[str]], List[str]]
+
+
+@dataclass(frozen=True)
+class CallEmission:
+    file_name: str
+    options: CallStructOptions
+
+
+@dataclass(frozen=True)
+class CallDotEmission:
+    file_name: str
+    options: CallStructOptions
+
+
+@dataclass(frozen=True)
+class TimerEmission:
+    file_name: str
+    options: TimerCallStructOptions
+
+
+@dataclass(frozen=True)
+class StructEmission:
+    file_name: str
+    struct_name: str
+
+
+@dataclass(frozen=True)
+class InitEmission:
+    file_name: str
+    options: InitStructOptions
+
+
+@dataclass(frozen=True)
+class CircuitDotEmission:
+    file_name: str
+
+
+@dataclass(frozen=True)
+class RawEmission:
+    """Content generated up front by the caller, which is optionally formatted"""
+
+    file_name: str
+    content: str
+    format: bool = True
+
+
+Emission = Union[
+    CallEmission,
+    CallDotEmission,
+    TimerEmission,
+    StructEmission,
+    InitEmission,
+    CircuitDotEmission,
+    RawEmission,
+]
+
+
+def _generate(
+    emission: Emission,
+    config: CoreLoaderConfig,
+    circuit: CircuitData,
+) -> str:
+    match emission:
+        case CallEmission(options=options):
+            return generate_circuit_call(options, config, circuit)
+        case CallDotEmission(options=options):
+            return generate_circuit_call_dot(options, config, circuit)
+        case TimerEmission(options=options):
+            return generate_timer_call(options, config, circuit)
+        case StructEmission(struct_name=struct_name):
+            return generate_circuit_struct_file(struct_name, config, circuit)
+        case InitEmission(options=options):
+            return generate_circuit_init(options, config, circuit)
+        case CircuitDotEmission():
+            return generate_full_circuit_dot(circuit)
+        case RawEmission(content=content):
+            return content
+
+    raise ValueError(f"Unknown emission {emission}")
+
+
+def _needs_format(emission: Emission) -> bool:
+    match emission:
+        case CallDotEmission() | CircuitDotEmission():
+            return False
+        case RawEmission(format=format):
+            return format
+        case _:
+            return True
+
+
+def _formatter_salt(formatter: Formatter) -> str:
+    if isinstance(formatter, ClangFormatter):
+        # Output changes along with the clang-format version and style
+        return formatter.cache_salt()
+    return f"{formatter.__module__}.{formatter.__qualname__}"
+
+
+def _fingerprint(emission: Emission, fingerprinter: EmissionFingerprinter) -> str:
+    match emission:
+        case CallEmission(options=options) | CallDotEmission(options=options):
+            return fingerprinter.for_call(options.call_name, emission)
+        case TimerEmission(options=options):
+            return fingerprinter.for_timer(options.component_name, emission)
+        case RawEmission():
+            return fingerprinter.for_content(emission)
+        case _:
+            return fingerprinter.for_circuit(emission)
+
+
+def _write_emissions(
+    emissions: List[Emission],
+    out_dir: str,
+    config: CoreLoaderConfig,
+    circuit: CircuitData,
+    formatter: Formatter,
+) -> List[str]:
+    contents = [_generate(emission, config, circuit) for emission in emissions]
+
+    to_format = [idx for (idx, em) in enumerate(emissions) if _needs_format(em)]
+    formatted = formatter([contents[idx] for idx in to_format])
+    for (idx, content) in zip(to_format, formatted):
+        contents[idx] = content
+
+    for (emission, content) in zip(emissions, contents):
+        write_if_changed(f"{out_dir}/{emission.file_name}", content)
+
+    return [emission.file_name for emission in emissions]
+
+
+@dataclass
+class _WorkerState:
+    out_dir: str
+    config: CoreLoaderConfig
+    circuit: CircuitData
+    formatter: Formatter
+
+
+_WORKER_STATE: Optional[_WorkerState] = None
+
+
+def _init_worker(
+    snapshot: bytes, out_dir: str, config: CoreLoaderConfig, formatter: Formatter
+):
+    global _WORKER_STATE
+
+    # The metadata references the circuit, so both come out of one pickle
+    # and the cache is keyed on the very circuit object the emitters see
+    circuit, metadata = pickle.loads(snapshot)
+    prime_global_metadata(metadata)
+
+    _WORKER_STATE = _WorkerState(
+        out_dir=out_dir, config=config, circuit=circuit, formatter=formatter
+    )
+
+
+def _emit_in_worker(emissions: List[Emission]) -> List[str]:
+    state = _WORKER_STATE
+    assert state is not None, "Emission worker was never initialized"
+    return _write_emissions(
+        emissions, state.out_dir, state.config, state.circuit, state.formatter
+    )
+
+
+def emit_circuit_files(
+    emissions: List[Emission],
+    out_dir: str,
+    config: CoreLoaderConfig,
+    circuit: CircuitData,
+    formatter: Formatter,
+    max_workers: Optional[int] = None,
+    incremental: bool = True,
+) -> List[str]:
+    """Generates, formats and writes every emission into out_dir
+
+    Generation and formatting are fanned out over a process pool. The circuit and its
+    global metadata are analysed once here and shipped to each worker as a single
+    snapshot, so workers only do the per-file work. The formatter is handed every
+    buffer a worker generates at once, and must be picklable (i.e. a module-level
+    function or a ClangFormatter).
+
+    A manifest in out_dir records a hash of the call subgraph behind each file.
+    When incremental, files whose hash is unchanged are left untouched on disk,
+    and files from the previous manifest that are no longer emitted are removed.
+
+    Returns the names of the files which were regenerated, in the order of the emissions
+    """
+
+    # Nothing mutates the circuit while emitting, so every emitter shares one hash
+    with frozen_circuit(circuit):
+        metadata = generate_global_metadata(
+            circuit,
+            [],
+            "",
+            packed_validity=config.packed_validity,
+            trigger_layout=config.trigger_layout,
+            cycle_counts=config.cycle_counts,
+        )
+
+        fingerprinter = EmissionFingerprinter(
+            metadata, (config, _formatter_salt(formatter))
+        )
+        fingerprints = {
+            emission.file_name: _fingerprint(emission, fingerprinter)
+            for emission in emissions
+        }
+
+        previous = load_manifest(out_dir) if incremental else {}
+
+        for file_name in previous.keys() - fingerprints.keys():
+            if os.path.exists(f"{out_dir}/{file_name}"):
+                os.remove(f"{out_dir}/{file_name}")
+
+        stale = [
+            emission
+            for emission in emissions
+            if previous.get(emission.file_name) != fingerprints[emission.file_name]
+            or not os.path.exists(f"{out_dir}/{emission.file_name}")
+        ]
+
+        written = _emit_all(
+            stale, out_dir, config, circuit, metadata, formatter, max_workers
+        )
+
+    write_manifest(out_dir, fingerprints)
+
+    return written
+
+
+def _emit_all(
+    emissions: List[Emission],
+    out_dir: str,
+    config: CoreLoaderConfig,
+    circuit: CircuitData,
+    metadata: GenerationMetadata,
+    formatter: Formatter,
+    max_workers: Optional[int],
+) -> List[str]:
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+
+    max_workers = min(max_workers, len(emissions))
+
+    if max_workers <= 1:
+        return _write_emissions(emissions, out_dir, config, circuit, formatter)
+
+    snapshot = pickle.dumps((circuit, metadata))
+
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        initializer=_init_worker,
+        initargs=(snapshot, out_dir, config, formatter),
+    ) as pool:
+        # Each worker generates a slice of the files and formats them in one batch
+        slices = [emissions[idx::max_workers] for idx in range(max_workers)]
+        for _ in pool.map(_emit_in_worker, slices):
+            pass
+
+    return [emission.file_name for emission in emissions]
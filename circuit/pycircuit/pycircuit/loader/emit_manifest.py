@@ -0,0 +1,194 @@
+import dataclasses
+import hashlib
+import json
+import os
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Mapping, Set, Tuple
+
+from pycircuit.cpp_codegen.call_generation.find_children_of import (
+    find_all_children_of,
+    find_all_children_of_from_outputs,
+)
+from pycircuit.cpp_codegen.generation_metadata import (
+    GenerationMetadata,
+    timer_subgraph_name,
+)
+
+MANIFEST_NAME = "manifest.json"
+
+# Bump this whenever the code generators change what they emit,
+# so that every file is regenerated on the next run
+MANIFEST_VERSION = 1
+
+
+def _canonical(obj: Any) -> Any:
+    """Converts an object into nested tuples with a process-independent repr
+
+    Sets are sorted since their iteration order depends on the hash seed.
+    Mappings keep their order, as it can be reflected in the generated code
+    """
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return (
+            type(obj).__name__,
+            tuple(
+                (field.name, _canonical(getattr(obj, field.name)))
+                for field in dataclasses.fields(obj)
+            ),
+        )
+    elif isinstance(obj, Mapping):
+        return tuple((_canonical(k), _canonical(v)) for (k, v) in obj.items())
+    elif isinstance(obj, (set, frozenset)):
+        return tuple(sorted((_canonical(v) for v in obj), key=repr))
+    elif isinstance(obj, (list, tuple)):
+        return tuple(_canonical(v) for v in obj)
+    elif isinstance(obj, Enum):
+        return repr(obj)
+    elif obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    else:
+        # FrozenList and friends
+        try:
+            return tuple(_canonical(v) for v in obj)
+        except TypeError:
+            return repr(obj)
+
+
+def stable_digest(*objs: Any) -> str:
+    return hashlib.sha256(repr(_canonical(objs)).encode()).hexdigest()
+
+
+class EmissionFingerprinter:
+    """Computes the manifest hash of each generated file
+
+    A call file depends on the components it calls, along with the metadata
+    of those components and the outputs they read. Whole-circuit files
+    (the struct, init and circuit dot) depend on every component.
+    Per-component digests are computed once and shared between files.
+
+    With cycle counts, the counter slots a call or timer records into are
+    hashed too, since components added to one trigger shift the slots
+    of every trigger after it.
+    """
+
+    def __init__(self, metadata: GenerationMetadata, extra: Any):
+        self._metadata = metadata
+        self._extra = extra
+        self._component_digests: Dict[str, str] = {}
+
+        circuit = metadata.circuit
+        self._shared = stable_digest(
+            MANIFEST_VERSION,
+            extra,
+            circuit.external_inputs,
+            circuit.call_groups,
+            circuit.call_structs,
+        )
+
+    def _component_digest(self, name: str) -> str:
+        digest = self._component_digests.get(name)
+        if digest is None:
+            annotated = self._metadata.annotated_components[name]
+            digest = stable_digest(annotated)
+            self._component_digests[name] = digest
+        return digest
+
+    def _cycle_count_slots(self, subgraph_name: str) -> List[Tuple[str, int]]:
+        if not self._metadata.cycle_counts:
+            return []
+        return [
+            (component_name, slot)
+            for ((name, component_name), slot) in (
+                self._metadata.cycle_count_slots.items()
+            )
+            if name == subgraph_name
+        ]
+
+    def _subgraph_digest(self, called_names: Iterable[str], *extra: Any) -> str:
+        circuit = self._metadata.circuit
+        names: List[str] = []
+        seen: Set[str] = set()
+
+        def add(name: str):
+            if name != "external" and name not in seen:
+                seen.add(name)
+                names.append(name)
+
+        for name in called_names:
+            add(name)
+            for comp_input in circuit.components[name].inputs.values():
+                for output in comp_input.outputs():
+                    add(output.parent)
+
+        return stable_digest(
+            self._shared,
+            extra,
+            [(name, self._component_digest(name)) for name in names],
+        )
+
+    def for_call(self, call_name: str, *extra: Any) -> str:
+        group = self._metadata.circuit.call_groups[call_name]
+        called = find_all_children_of(group.inputs, self._metadata.circuit)
+        return self._subgraph_digest(
+            [child.component.name for child in called],
+            call_name,
+            [child.callset for child in called],
+            self._cycle_count_slots(call_name),
+            *extra,
+        )
+
+    def for_timer(self, component_name: str, *extra: Any) -> str:
+        component = self._metadata.circuit.components[component_name]
+        timer = component.definition.timer_callset
+        assert timer is not None
+        triggered = {component.output(which) for which in timer.outputs}
+        called = find_all_children_of_from_outputs(self._metadata.circuit, triggered)
+        return self._subgraph_digest(
+            [component_name] + [child.component.name for child in called],
+            [child.callset for child in called],
+            self._cycle_count_slots(timer_subgraph_name(component)),
+            *extra,
+        )
+
+    def for_circuit(self, *extra: Any) -> str:
+        return self._subgraph_digest(
+            self._metadata.circuit.components.keys(),
+            self._metadata.required_validity_markers,
+            *extra,
+        )
+
+    def for_content(self, *extra: Any) -> str:
+        return stable_digest(MANIFEST_VERSION, self._extra, extra)
+
+
+def load_manifest(out_dir: str) -> Dict[str, str]:
+    path = f"{out_dir}/{MANIFEST_NAME}"
+    if not os.path.exists(path):
+        return {}
+
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    if manifest.get("version") != MANIFEST_VERSION:
+        return {}
+
+    return manifest["files"]
+
+
+def write_manifest(out_dir: str, files: Dict[str, str]):
+    with open(f"{out_dir}/{MANIFEST_NAME}", "w") as manifest_file:
+        json.dump(
+            {"version": MANIFEST_VERSION, "files": files}, manifest_file, indent=2
+        )
+
+
+def write_if_changed(path: str, content: str) -> bool:
+    """Writes content to path unless it's already there, so the mtime is preserved"""
+    if os.path.exists(path):
+        with open(path) as existing:
+            if existing.read() == content:
+                return False
+
+    with open(path, "w") as write_to:
+        write_to.write(content)
+
+    return True
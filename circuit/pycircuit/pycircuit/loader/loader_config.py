@@ -1,9 +1,21 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Dict, List
 
 from dataclasses_json import DataClassJsonMixin
+from pycircuit.circuit_builder.component import ComponentOutput
 
 
 @dataclass
 class CoreLoaderConfig(DataClassJsonMixin):
     root_cppcuit_path: str
     root_signals_path: str
+    # Store validity markers as bits of words, see cppcuit/validity_bits.hh
+    packed_validity: bool = False
+    # Cluster struct state by the triggers touching it, see struct_layout.py
+    trigger_layout: bool = False
+    # Also generate <call>_batch entry points applying a span of inputs
+    batch_calls: bool = False
+    # By call name, the batch calls outward only when one of these changes
+    watched_outputs: Dict[str, List[ComponentOutput]] = field(default_factory=dict)
+    # Time every component call into per-trigger counters, see cycle_count_report.py
+    cycle_counts: bool = False
@@ -3,9 +3,11 @@ import sys
 from dataclasses import dataclass
 
 from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
 from pycircuit.cpp_codegen.call_generation.generate_call_for_trigger import (
+    generate_external_batch_body_for,
     generate_external_call_body_for,
 )
 from pycircuit.cpp_codegen.generation_metadata import generate_global_metadata
@@ -36,15 +38,33 @@ def generate_circuit_call(
         raise ValueError(
             f"Call {struct_options.call_name} not contained in circuit config"
         )
+    unknown_watched = set(config.watched_outputs) - set(circuit.call_groups)
+    if unknown_watched:
+        raise ValueError(
+            f"Watched outputs given for calls not in circuit config: "
+            f"{sorted(unknown_watched)}"
+        )
 
     call = circuit.call_groups[struct_options.call_name]
     metadata = CallMetaData(triggered=call.inputs, call_name=struct_options.call_name)
 
     gen_metadata = generate_global_metadata(
-        circuit, [metadata], struct_options.struct_name
+        circuit,
+        [metadata],
+        struct_options.struct_name,
+        packed_validity=config.packed_validity,
+        trigger_layout=config.trigger_layout,
+        cycle_counts=config.cycle_counts,
     )
 
     call_str = generate_external_call_body_for(metadata, gen_metadata)
+    if config.batch_calls:
+        batch_str = generate_external_batch_body_for(
+            metadata,
+            gen_metadata,
+            config.watched_outputs.get(struct_options.call_name, []),
+        )
+        call_str = f"{call_str}\n\n{batch_str}"
 
     struct_include = f'#include "{struct_options.struct_header}.hh"'
 
@@ -60,7 +80,7 @@ def main():
 
     config = CoreLoaderConfig.from_dict(json.load(open(args.loader_config)))
 
-    circuit = CircuitData.from_dict(json.load(open(args.circuit_json)))
+    circuit = load_circuit_file(args.circuit_json)
 
     struct = CallStructOptions(
         call_name=args.call_name,
@@ -2,6 +2,7 @@ import json
 import sys
 
 from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
 from pycircuit.cpp_codegen.call_generation.generate_dot_for_trigger import (
@@ -25,7 +26,11 @@ def generate_circuit_call_dot(
     metadata = CallMetaData(triggered=call.inputs, call_name=struct_options.call_name)
 
     gen_metadata = generate_global_metadata(
-        circuit, [metadata], struct_options.struct_name
+        circuit,
+        [metadata],
+        struct_options.struct_name,
+        packed_validity=config.packed_validity,
+        trigger_layout=config.trigger_layout,
     )
 
     return generate_external_dot_body_for(metadata, gen_metadata)
@@ -36,7 +41,7 @@ def main():
 
     config = CoreLoaderConfig.from_dict(json.load(open(args.loader_config)))
 
-    circuit = CircuitData.from_dict(json.load(open(args.circuit_json)))
+    circuit = load_circuit_file(args.circuit_json)
 
     struct = CallStructOptions(
         call_name=args.call_name,
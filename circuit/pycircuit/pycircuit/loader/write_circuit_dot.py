@@ -1,8 +1,8 @@
 from dataclasses import dataclass
-import json
 import sys
 
 from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.call_generation.generate_dot_for_circuit import (
     generate_full_circuit_dot,
@@ -21,7 +21,7 @@ def generate_circuit_dot(circuit: CircuitData) -> str:
 def main():
     args = ArgumentParser(CircuitDotStructOptions).parse_args(sys.argv[1:])
 
-    circuit = CircuitData.from_dict(json.load(open(args.circuit_json)))
+    circuit = load_circuit_file(args.circuit_json)
 
     print(generate_circuit_dot(circuit))
 
@@ -3,6 +3,7 @@ import sys
 from dataclasses import dataclass
 
 from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.call_generation.init_generation.generate_init_call import (
     generate_init_call,
@@ -17,7 +18,7 @@ from pycircuit.cpp_codegen.call_generation.call_lookup.generate_call_lookup impo
     top_level_real_loader,
 )
 
-INCLUDES = ["nlohmann/json.hpp"]
+INCLUDES = ["algorithm", "array", "string_view", "nlohmann/json.hpp"]
 
 
 @dataclass
@@ -39,11 +40,19 @@ def generate_circuit_init(
     struct_options: InitStructOptions, config: CoreLoaderConfig, circuit: CircuitData
 ) -> str:
 
-    gen_metadata = generate_global_metadata(circuit, [], struct_options.struct_name)
+    gen_metadata = generate_global_metadata(
+        circuit,
+        [],
+        struct_options.struct_name,
+        packed_validity=config.packed_validity,
+        trigger_layout=config.trigger_layout,
+    )
 
     init_str = generate_init_call(struct_options.struct_name, gen_metadata)
     loader_prefix = f"{struct_options.struct_name}::"
-    lookup_str = generate_true_loader_body(circuit.call_groups, prefix=loader_prefix)
+    lookup_str = generate_true_loader_body(
+        circuit.call_groups, prefix=loader_prefix, batch_calls=config.batch_calls
+    )
     lookup_signature = top_level_real_loader(prefix=loader_prefix)
     val_lookup_str = generate_checks_for_all_components(
         list(gen_metadata.annotated_components.values()), struct_options.struct_name
@@ -72,7 +81,7 @@ def main():
 
     config = CoreLoaderConfig.from_dict(json.load(open(args.loader_config)))
 
-    circuit = CircuitData.from_dict(json.load(open(args.circuit_json)))
+    circuit = load_circuit_file(args.circuit_json)
 
     struct = InitStructOptions(
         struct_header=args.struct_header,
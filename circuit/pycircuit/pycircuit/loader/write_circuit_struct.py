@@ -3,6 +3,7 @@ import sys
 from dataclasses import dataclass
 
 from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
 from pycircuit.cpp_codegen.generation_metadata import generate_global_metadata
@@ -33,7 +34,14 @@ def generate_circuit_struct_file(
         CallMetaData(triggered=call.inputs, call_name=name)
         for (name, call) in circuit.call_groups.items()
     ]
-    gen_metadata = generate_global_metadata(circuit, all_calls, struct_name)
+    gen_metadata = generate_global_metadata(
+        circuit,
+        all_calls,
+        struct_name,
+        packed_validity=config.packed_validity,
+        trigger_layout=config.trigger_layout,
+        cycle_counts=config.cycle_counts,
+    )
 
     signal_headers = get_struct_headers_for(gen_metadata)
 
@@ -43,7 +51,9 @@ def generate_circuit_struct_file(
 
     std_includes = "\n".join(f"#include <{header}>" for header in STD_HEADERS)
 
-    struct = generate_circuit_struct(circuit, gen_metadata)
+    struct = generate_circuit_struct(
+        circuit, gen_metadata, batch_calls=config.batch_calls
+    )
 
     return f"""
         {std_includes}
@@ -59,7 +69,7 @@ def main():
 
     config = CoreLoaderConfig.from_dict(json.load(open(args.loader_config)))
 
-    circuit = CircuitData.from_dict(json.load(open(args.circuit_json)))
+    circuit = load_circuit_file(args.circuit_json)
 
     print(generate_circuit_struct_file(args.struct_name, config, circuit))
 
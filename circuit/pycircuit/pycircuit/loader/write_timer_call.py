@@ -3,6 +3,7 @@ import sys
 from dataclasses import dataclass
 
 from argparse_dataclass import ArgumentParser
+from pycircuit.circuit_builder.binary_format import load_circuit_file
 from pycircuit.circuit_builder.circuit import CircuitData
 from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
 from pycircuit.cpp_codegen.call_generation.generate_call_for_trigger import (
@@ -38,7 +39,14 @@ def generate_timer_call(
     if struct_options.component_name not in circuit.components:
         raise ValueError(f"Component {struct_options.component_name} does not exist")
 
-    gen_metadata = generate_global_metadata(circuit, [], struct_options.struct_name)
+    gen_metadata = generate_global_metadata(
+        circuit,
+        [],
+        struct_options.struct_name,
+        packed_validity=config.packed_validity,
+        trigger_layout=config.trigger_layout,
+        cycle_counts=config.cycle_counts,
+    )
 
     annotated = gen_metadata.annotated_components[struct_options.component_name]
 
@@ -57,7 +65,7 @@ def main():
 
     config = CoreLoaderConfig.from_dict(json.load(open(args.loader_config)))
 
-    circuit = CircuitData.from_dict(json.load(open(args.circuit_json)))
+    circuit = load_circuit_file(args.circuit_json)
 
     struct = TimerCallStructOptions(
         call_name=args.call_name,
@@ -31,7 +31,7 @@ from pycircuit.loader.write_circuit_dot import generate_full_circuit_dot
 from pycircuit.circuit_builder.signals.tree_sum import tree_sum
 from pycircuit.circuit_builder.signals.bbo import bbo_mid, bbo_wmid
 
-from pycircuit.trade_pressure.call_clang_format import call_clang_format
+from pycircuit.loader.clang_format import call_clang_format
 
 HEADER = "pressure"
 STRUCT = "TradePressure"
@@ -1,6 +1,6 @@
 from dataclasses import dataclass
 from shutil import rmtree
-from typing import Dict
+from typing import Dict, Optional
 
 from argparse_dataclass import ArgumentParser
 from pycircuit.circuit_builder.circuit import (
@@ -9,6 +9,7 @@ from pycircuit.circuit_builder.circuit import (
     ComponentOutput,
     OutputOptions,
 )
+from pycircuit.loader.emit_manifest import write_if_changed
 from pycircuit.loader.loader_config import CoreLoaderConfig
 from pycircuit.circuit_builder.circuit import CallStruct
 from pycircuit.circuit_builder.circuit_context import CircuitContextManager
@@ -34,17 +35,19 @@ def generate_all_tests(
     all_tests: Dict[str, CircuitTestGroup],
     global_test_dir: str,
     core_config: CoreLoaderConfig,
+    max_workers: Optional[int] = None,
 ):
 
     for (test_name, test_cases) in all_tests.items():
-        generate_test_in(test_cases, global_test_dir, test_name, core_config)
+        generate_test_in(
+            test_cases, global_test_dir, test_name, core_config, max_workers
+        )
 
     subdirs = list(all_tests.keys())
 
     cmake_lines = "\n".join(f"add_subdirectory({test_dir})" for test_dir in subdirs)
 
-    with open(f"{global_test_dir}/CMakeLists.txt", "w") as cmake_file:
-        cmake_file.write(cmake_lines)
+    write_if_changed(f"{global_test_dir}/CMakeLists.txt", cmake_lines)
 
 
 def test_circuit() -> CircuitTestGroup:
@@ -138,6 +141,13 @@ def test_wide_call() -> CircuitTestGroup:
 @dataclass
 class TestGenOptions:
     out_dir: str
+    jobs: Optional[int] = None
+    clean: bool = False
+    # Override the matching options of the loader config
+    packed_validity: bool = False
+    trigger_layout: bool = False
+    batch_calls: bool = False
+    cycle_counts: bool = False
 
 
 def main():
@@ -148,18 +158,27 @@ def main():
 
     import os
 
-    if os.path.exists(args.out_dir):
+    if args.clean and os.path.exists(args.out_dir):
         rmtree(args.out_dir)
-    os.mkdir(args.out_dir)
+    os.makedirs(args.out_dir, exist_ok=True)
 
     dir_path = os.path.dirname(os.path.realpath(__file__))
     loader_config_str = open(f"{dir_path}/loader.json").read()
     core_config = CoreLoaderConfig.from_json(loader_config_str)
+    if args.packed_validity:
+        core_config.packed_validity = True
+    if args.trigger_layout:
+        core_config.trigger_layout = True
+    if args.batch_calls:
+        core_config.batch_calls = True
+    if args.cycle_counts:
+        core_config.cycle_counts = True
 
     generate_all_tests(
         {"add_test": test_circuit(), "wide_add_tests": test_wide_call()},
         args.out_dir,
         core_config,
+        max_workers=args.jobs,
     )
 
 
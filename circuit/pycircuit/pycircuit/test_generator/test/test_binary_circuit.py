@@ -0,0 +1,62 @@
+import copy
+import json
+
+import pytest
+from pycircuit.circuit_builder.binary_format import is_binary_circuit, load_circuit_file
+from pycircuit.circuit_builder.circuit import CircuitData
+from pycircuit.test_generator import generate_all_tests
+
+
+def comparable(circuit: CircuitData):
+    # Sets in definitions serialize in iteration order, which isn't preserved
+    # by a round trip, so definitions are compared as objects
+    as_dict = circuit.to_dict()
+    del as_dict["definitions"]
+    return (as_dict, dict(circuit.definitions))
+
+
+@pytest.mark.parametrize(
+    "make_circuit", [generate_all_tests.test_circuit, generate_all_tests.test_wide_call]
+)
+def test_binary_roundtrip(make_circuit):
+    circuit = make_circuit().circuit
+
+    encoded = circuit.to_binary()
+    assert is_binary_circuit(encoded)
+
+    decoded = CircuitData.from_binary(encoded)
+
+    assert comparable(decoded) == comparable(circuit)
+    assert comparable(CircuitData.from_binary(decoded.to_binary())) == comparable(
+        circuit
+    )
+
+
+def test_json_roundtrip():
+    circuit = generate_all_tests.test_wide_call().circuit
+    as_dict = circuit.to_dict()
+
+    assert comparable(CircuitData.from_dict(copy.deepcopy(as_dict))) == comparable(
+        circuit
+    )
+
+
+def test_load_either_format(tmp_path):
+    circuit = generate_all_tests.test_wide_call().circuit
+
+    binary_path = tmp_path / "circuit.bin"
+    binary_path.write_bytes(circuit.to_binary())
+
+    json_path = tmp_path / "circuit.json"
+    json_path.write_text(json.dumps(circuit.to_dict()))
+
+    assert comparable(load_circuit_file(str(binary_path))) == comparable(circuit)
+    assert comparable(load_circuit_file(str(json_path))) == comparable(circuit)
+
+
+def test_rejects_bad_version():
+    encoded = bytearray(generate_all_tests.test_wide_call().circuit.to_binary())
+    encoded[8] = 99
+
+    with pytest.raises(ValueError, match="version"):
+        CircuitData.from_binary(encoded)
@@ -0,0 +1,86 @@
+import os
+import sys
+
+from pycircuit.loader.clang_format import ClangFormatter
+
+# Uppercases files in place, appending the style file found next to them,
+# and logs every invocation
+FAKE_CLANG_FORMAT = """
+import os
+import sys
+
+with open(sys.argv[1], "a") as log:
+    log.write(" ".join(sys.argv[2:]) + "\\n")
+
+if sys.argv[2] == "--version":
+    print("fake 1.0")
+else:
+    for path in sys.argv[3:]:
+        content = open(path).read().upper()
+        style_path = os.path.join(os.path.dirname(path), ".clang-format")
+        if os.path.exists(style_path):
+            content += open(style_path).read()
+        open(path, "w").write(content)
+"""
+
+
+def make_formatter(tmp_path):
+    script = tmp_path / "fake_clang_format.py"
+    script.write_text(FAKE_CLANG_FORMAT)
+    log = tmp_path / "log"
+    log.touch()
+
+    formatter = ClangFormatter(
+        command=[sys.executable, str(script), str(log)],
+        cache_dir=str(tmp_path / "cache"),
+    )
+    return (formatter, log)
+
+
+def format_calls(log) -> int:
+    return sum(1 for line in log.read_text().splitlines() if line.startswith("-i"))
+
+
+def test_formats_in_one_call(tmp_path):
+    (formatter, log) = make_formatter(tmp_path)
+
+    assert formatter.format_many(["a", "b", "a"]) == ["A", "B", "A"]
+    assert format_calls(log) == 1
+
+
+def test_cache_hits_skip_clang_format(tmp_path):
+    (formatter, log) = make_formatter(tmp_path)
+    formatter.format_many(["a", "b"])
+
+    (fresh_formatter, _) = make_formatter(tmp_path)
+
+    assert fresh_formatter.format_many(["b", "c", "a"]) == ["B", "C", "A"]
+    assert format_calls(log) == 2
+    assert fresh_formatter.format("c") == "C"
+    assert format_calls(log) == 2
+
+
+def test_formats_outside_working_directory(tmp_path, monkeypatch):
+    (formatter, log) = make_formatter(tmp_path)
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    (work_dir / ".clang-format").write_text(" style")
+    monkeypatch.chdir(work_dir)
+
+    assert formatter(["a"]) == ["A style"]
+
+    formatted_path = log.read_text().splitlines()[-1].split()[-1]
+    assert not formatted_path.startswith(str(work_dir))
+    assert os.listdir(work_dir) == [".clang-format"]
+
+
+def test_style_changes_cache_salt(tmp_path, monkeypatch):
+    (formatter, _) = make_formatter(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    unstyled = formatter.cache_salt()
+
+    (tmp_path / ".clang-format").write_text("style")
+    (fresh_formatter, _) = make_formatter(tmp_path)
+
+    assert fresh_formatter.cache_salt() != unstyled
+    assert fresh_formatter.cache_salt().startswith("fake 1.0")
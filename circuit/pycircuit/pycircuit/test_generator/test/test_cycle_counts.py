@@ -0,0 +1,95 @@
+import pytest
+from pycircuit.cpp_codegen.call_generation.call_metadata import CallMetaData
+from pycircuit.cpp_codegen.call_generation.generate_call_for_trigger import (
+    generate_external_call_body_for,
+)
+from pycircuit.cpp_codegen.generation_metadata import compute_global_metadata
+from pycircuit.cpp_codegen.struct_generation.generate_struct import (
+    generate_cycle_counters,
+)
+from pycircuit.loader.cycle_count_report import (
+    build_cycle_count_report,
+    format_cycle_count_report,
+)
+from pycircuit.test_generator import generate_all_tests
+
+
+def wide_metadata(cycle_counts: bool):
+    circuit = generate_all_tests.test_wide_call().circuit
+    meta = CallMetaData(triggered={"c"}, call_name="trigger_add_c")
+    metadata = compute_global_metadata(circuit, [meta], "wide")
+    metadata.cycle_counts = cycle_counts
+    return (meta, metadata)
+
+
+def test_slots_per_trigger_and_component():
+    (_, metadata) = wide_metadata(cycle_counts=True)
+    add = metadata.circuit.components["add_out"].inputs["a"].output().parent
+
+    assert metadata.cycle_count_slots == {
+        ("trigger_add_ab", add): 0,
+        ("trigger_add_ab", "add_out"): 1,
+        ("trigger_add_c", "add_out"): 2,
+    }
+
+
+@pytest.mark.parametrize("cycle_counts", [True, False])
+def test_probes_calls(cycle_counts: bool):
+    (meta, metadata) = wide_metadata(cycle_counts=cycle_counts)
+    body = generate_external_call_body_for(meta, metadata)
+
+    probe = (
+        "__myself->cycle_counters[2].record(read_cycle_counter() - __cycles_start__);"
+    )
+    assert (probe in body) == cycle_counts
+    assert ("cycle_counters" in generate_cycle_counters(metadata)) == cycle_counts
+
+
+def test_report():
+    (_, metadata) = wide_metadata(cycle_counts=True)
+    add = metadata.circuit.components["add_out"].inputs["a"].output().parent
+
+    rows = build_cycle_count_report(
+        metadata.circuit,
+        [
+            {"trigger": "trigger_add_ab", "component": add, "cycles": 100, "calls": 4},
+            {
+                "trigger": "trigger_add_ab",
+                "component": "add_out",
+                "cycles": 300,
+                "calls": 4,
+            },
+            {
+                "trigger": "trigger_add_c",
+                "component": "add_out",
+                "cycles": 10,
+                "calls": 1,
+            },
+        ],
+    )
+
+    assert [row.class_name for row in rows] == ["AddComponent"] * 3
+    assert rows[1].cycles_per_call() == 75
+
+    report = format_cycle_count_report(rows).splitlines()
+    assert report[0] == "trigger_add_ab: 400 cycles"
+    assert report[1].strip().startswith("75.0%")
+    assert report[1].endswith("add_out (AddComponent)")
+    assert report[4] == "trigger_add_c: 10 cycles"
+
+
+def test_report_rejects_unknown_components():
+    (_, metadata) = wide_metadata(cycle_counts=True)
+
+    with pytest.raises(ValueError, match="not in the circuit"):
+        build_cycle_count_report(
+            metadata.circuit,
+            [
+                {
+                    "trigger": "trigger_add_c",
+                    "component": "gone",
+                    "cycles": 1,
+                    "calls": 1,
+                }
+            ],
+        )
@@ -0,0 +1,190 @@
+import os
+from typing import List
+
+from pycircuit.circuit_builder.circuit import CallGroup, CallStruct, CircuitBuilder
+from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.loader.emit_circuit import (
+    CallDotEmission,
+    CallEmission,
+    CircuitDotEmission,
+    InitEmission,
+    RawEmission,
+    StructEmission,
+    emit_circuit_files,
+)
+from pycircuit.loader.loader_config import CoreLoaderConfig
+from pycircuit.loader.write_circuit_call import CallStructOptions
+from pycircuit.loader.write_circuit_init import InitStructOptions
+from pycircuit.test_generator import generate_all_tests
+from pycircuit.test_generator.test.test_clang_format import make_formatter
+
+STRUCT_NAME = "wide"
+HEADER = "wide_header"
+
+
+def no_format(contents: List[str]) -> List[str]:
+    return contents
+
+
+def make_emissions():
+    emissions = [RawEmission("raw.txt", "raw content", format=False)]
+    for call_name in ["trigger_add_ab", "trigger_add_c"]:
+        options = CallStructOptions(
+            struct_name=STRUCT_NAME, struct_header=HEADER, call_name=call_name
+        )
+        emissions.append(CallEmission(f"{call_name}.cc", options))
+        emissions.append(CallDotEmission(f"{call_name}.dot", options))
+
+    emissions.append(StructEmission(f"{HEADER}.hh", STRUCT_NAME))
+    emissions.append(CircuitDotEmission(f"{HEADER}.dot"))
+    emissions.append(
+        InitEmission(
+            "init.cc", InitStructOptions(struct_name=STRUCT_NAME, struct_header=HEADER)
+        )
+    )
+    return emissions
+
+
+def read_all(out_dir: str):
+    return {name: open(f"{out_dir}/{name}").read() for name in os.listdir(out_dir)}
+
+
+def test_parallel_matches_serial(tmp_path):
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    config = CoreLoaderConfig.from_json(open(f"{dir_path}/../loader.json").read())
+    circuit = generate_all_tests.test_wide_call().circuit
+
+    serial_dir = tmp_path / "serial"
+    parallel_dir = tmp_path / "parallel"
+    serial_dir.mkdir()
+    parallel_dir.mkdir()
+
+    emissions = make_emissions()
+
+    serial_names = emit_circuit_files(
+        emissions, str(serial_dir), config, circuit, no_format, max_workers=1
+    )
+    parallel_names = emit_circuit_files(
+        emissions, str(parallel_dir), config, circuit, no_format, max_workers=2
+    )
+
+    assert serial_names == parallel_names == [em.file_name for em in emissions]
+    assert read_all(str(serial_dir)) == read_all(str(parallel_dir))
+    assert read_all(str(serial_dir))["raw.txt"] == "raw content"
+
+
+def make_split_circuit() -> CircuitBuilder:
+    circuit = CircuitBuilder({})
+
+    with CircuitContextManager(circuit):
+        a = circuit.get_external("a", "int")
+        b = circuit.get_external("b", "int")
+        c = circuit.get_external("c", "int")
+        d = circuit.get_external("d", "int")
+
+        a_b = a + b
+        circuit.rename_component(a_b, "a_b")
+        a_b.force_stored()
+
+        c_d = c + d
+        circuit.rename_component(c_d, "c_d")
+        c_d.force_stored()
+
+    circuit.add_call_struct("AB", CallStruct.from_inputs(a="int", b="int"))
+    circuit.add_call_group("trigger_ab", CallGroup("AB", {"a": "a", "b": "b"}))
+    circuit.add_call_struct("CD", CallStruct.from_inputs(c="int", d="int"))
+    circuit.add_call_group("trigger_cd", CallGroup("CD", {"c": "c", "d": "d"}))
+
+    return circuit
+
+
+def test_unchanged_files_not_regenerated(tmp_path):
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    config = CoreLoaderConfig.from_json(open(f"{dir_path}/../loader.json").read())
+    circuit = make_split_circuit()
+    out_dir = str(tmp_path)
+
+    emissions = [
+        CallEmission(
+            f"{call_name}.cc",
+            CallStructOptions(
+                struct_name=STRUCT_NAME, struct_header=HEADER, call_name=call_name
+            ),
+        )
+        for call_name in ["trigger_ab", "trigger_cd"]
+    ] + [StructEmission(f"{HEADER}.hh", STRUCT_NAME)]
+
+    def emit(emissions):
+        return emit_circuit_files(
+            emissions, out_dir, config, circuit, no_format, max_workers=1
+        )
+
+    assert emit(emissions) == ["trigger_ab.cc", "trigger_cd.cc", f"{HEADER}.hh"]
+    assert emit(emissions) == []
+
+    circuit.lookup("a_b").block_propagation()
+
+    assert emit(emissions) == ["trigger_ab.cc", f"{HEADER}.hh"]
+
+    assert emit(emissions[1:]) == []
+    assert not os.path.exists(f"{out_dir}/trigger_ab.cc")
+
+
+def test_shifted_cycle_count_slots_regenerated(tmp_path):
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    config = CoreLoaderConfig.from_json(open(f"{dir_path}/../loader.json").read())
+    config.cycle_counts = True
+    circuit = make_split_circuit()
+    out_dir = str(tmp_path)
+
+    emissions = [
+        CallEmission(
+            f"{call_name}.cc",
+            CallStructOptions(
+                struct_name=STRUCT_NAME, struct_header=HEADER, call_name=call_name
+            ),
+        )
+        for call_name in ["trigger_ab", "trigger_cd"]
+    ]
+
+    def emit():
+        return emit_circuit_files(
+            emissions, out_dir, config, circuit, no_format, max_workers=1
+        )
+
+    assert emit() == ["trigger_ab.cc", "trigger_cd.cc"]
+    before = open(f"{out_dir}/trigger_cd.cc").read()
+
+    # Times one more component in trigger_ab, which moves the counters of trigger_cd
+    with CircuitContextManager(circuit):
+        a_b_a = circuit.lookup("a_b") + circuit.get_external("a", "int")
+        a_b_a.force_stored()
+
+    assert emit() == ["trigger_ab.cc", "trigger_cd.cc"]
+    assert open(f"{out_dir}/trigger_cd.cc").read() != before
+
+
+def test_style_change_regenerates(tmp_path, monkeypatch):
+    dir_path = os.path.dirname(os.path.realpath(__file__))
+    config = CoreLoaderConfig.from_json(open(f"{dir_path}/../loader.json").read())
+    circuit = make_split_circuit()
+    out_dir = tmp_path / "out"
+    out_dir.mkdir()
+    monkeypatch.chdir(tmp_path)
+
+    emissions = [StructEmission(f"{HEADER}.hh", STRUCT_NAME)]
+
+    def emit():
+        # A fresh formatter per run, like a fresh generator process
+        (formatter, _) = make_formatter(tmp_path)
+        return emit_circuit_files(
+            emissions, str(out_dir), config, circuit, formatter, max_workers=1
+        )
+
+    assert emit() == [f"{HEADER}.hh"]
+    assert emit() == []
+
+    (tmp_path / ".clang-format").write_text("style")
+
+    assert emit() == [f"{HEADER}.hh"]
+    assert open(f"{out_dir}/{HEADER}.hh").read().endswith("style")
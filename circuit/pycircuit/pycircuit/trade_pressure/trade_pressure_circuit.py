@@ -2,7 +2,7 @@ import json
 import sys
 from dataclasses import dataclass
 from shutil import rmtree
-from typing import List, Set, Tuple
+from typing import List, Optional, Set, Tuple
 
 from argparse_dataclass import ArgumentParser
 from pycircuit.circuit_builder.circuit import (
@@ -11,17 +11,25 @@ from pycircuit.circuit_builder.circuit import (
     CircuitData,
 )
 from pycircuit.circuit_builder.circuit_context import CircuitContextManager
+from pycircuit.circuit_builder.liveness import prune_dead_components
+from pycircuit.circuit_builder.simplify import simplify_circuit
 from pycircuit.circuit_builder.definition import Definitions
 from pycircuit.loader.loader_config import CoreLoaderConfig
-from pycircuit.loader.write_circuit_call import CallStructOptions, generate_circuit_call
-from pycircuit.loader.write_circuit_call_dot import generate_circuit_call_dot
-from pycircuit.loader.write_circuit_init import InitStructOptions, generate_circuit_init
-from pycircuit.loader.write_circuit_struct import generate_circuit_struct_file
-from pycircuit.differentiator.trainer.data_writer_config import WriterConfig
-from pycircuit.loader.write_timer_call import (
-    TimerCallStructOptions,
-    generate_timer_call,
+from pycircuit.loader.emit_circuit import (
+    CallDotEmission,
+    CallEmission,
+    CircuitDotEmission,
+    Emission,
+    InitEmission,
+    StructEmission,
+    TimerEmission,
+    emit_circuit_files,
 )
+from pycircuit.loader.emit_manifest import write_if_changed
+from pycircuit.loader.write_circuit_call import CallStructOptions
+from pycircuit.loader.write_circuit_init import InitStructOptions
+from pycircuit.differentiator.trainer.data_writer_config import WriterConfig
+from pycircuit.loader.write_timer_call import TimerCallStructOptions
 from pycircuit.circuit_builder.circuit import ExternalStruct
 from pycircuit.circuit_builder.circuit import OutputArray
 from pycircuit.circuit_builder.component import HasOutput
@@ -44,9 +52,8 @@ from pycircuit.trade_pressure.trade_pressure_config import (
     TradePressureMarketConfig,
     TradePressureVenueConfig,
 )
-from pycircuit.loader.write_circuit_dot import generate_full_circuit_dot
 
-from .call_clang_format import call_clang_format
+from pycircuit.loader.clang_format import default_formatter
 from pycircuit.circuit_builder.signals.tree_sum import tree_sum
 from pycircuit.circuit_builder.signals.bbo import bbo_wmid, bbo_mid
 from pycircuit.circuit_builder.signals.returns.sided_bbo_returns import (
@@ -70,6 +77,17 @@ USE_LINREG = True
 @dataclass
 class TradePressureOptions:
     out_dir: str
+    jobs: Optional[int] = None
+    clean: bool = False
+    keep_dead: bool = False
+    no_simplify: bool = False
+    # Sample everything graphs read, instead of recording parameter-free subgraphs
+    full_graphs: bool = False
+    # Override the matching options of the loader config
+    packed_validity: bool = False
+    trigger_layout: bool = False
+    batch_calls: bool = False
+    cycle_counts: bool = False
 
 
 def pointless_mlp(inputs: List[HasOutput], prefix: str) -> List[HasOutput]:
@@ -540,6 +558,26 @@ def generate_trade_pressure_circuit(
 # trigger the always-valid checks
 
 
+def check_written_names(
+    circuit: CircuitBuilder, graph: Graph, writer_config: WriterConfig
+):
+    """Checks that a graph and its writer only name components of the emitted circuit
+
+    Otherwise the sampler records columns nobody computes,
+    and training writes parameters that are never read
+    """
+    outputs = list(graph.nodes.keys()) + writer_config.outputs
+    outputs += [writer_config.target_output, writer_config.sample_on]
+    names = {output.parent for output in outputs if output.parent != "external"}
+    names.update(graph.find_parameter_names())
+
+    missing = sorted(names - circuit.components.keys())
+    if missing:
+        raise ValueError(
+            f"Graph and writer config reference removed components {missing}"
+        )
+
+
 def generate_cmake_file(cc_names) -> str:
     ccs = " ".join(cc_names)
     return f"""\
@@ -562,13 +600,22 @@ def main():
     definitions_str = open(f"{dir_path}/definitions.json").read()
     trade_pressure_str = open(f"{dir_path}/trade_pressure_config.json").read()
     loader_config_str = open(f"{dir_path}/loader.json").read()
-    if os.path.exists(out_dir):
+    # Unchanged files are left alone so that C++ rebuilds only touch what changed
+    if args.clean and os.path.exists(out_dir):
         rmtree(out_dir)
-    os.mkdir(out_dir)
+    os.makedirs(out_dir, exist_ok=True)
 
     definitions = Definitions.from_json(definitions_str)
     trade_pressure = BasicSignalConfig.from_json(trade_pressure_str)
     core_config = CoreLoaderConfig.from_json(loader_config_str)
+    if args.packed_validity:
+        core_config.packed_validity = True
+    if args.trigger_layout:
+        core_config.trigger_layout = True
+    if args.batch_calls:
+        core_config.batch_calls = True
+    if args.cycle_counts:
+        core_config.cycle_counts = True
 
     circuit = CircuitBuilder(definitions=definitions.definitions)
 
@@ -606,6 +653,43 @@ def main():
     with CircuitContextManager(circuit):
         generate_trade_pressure_circuit(circuit, trade_pressure, decay_sources)
 
+    # HACKS since I know I only have one venue per market lol
+    sampled_venues = [
+        (market, next(iter(market_config.venues.keys())))
+        for (market, market_config) in trade_pressure.markets.items()
+        if market_config.venues
+    ]
+
+    def sampled_roots(market: str, venue: str) -> List[Component]:
+        return [
+            circuit.components[name]
+            for name in [
+                f"{market}_trade_pressure",
+                f"{market}_{venue}_depth_move",
+                f"{market}_{venue}_static_fair_projection",
+                f"{market}_overall_pred",
+                f"{market}_{venue}_mid",
+                f"{market}_{venue}_bucket_sampler",
+            ]
+        ]
+
+    # Every market's predictions are consumed out of the struct,
+    # whether or not they're being sampled for training.
+    # Graphs are discovered from the simplified circuit, so they only
+    # reference components which are emitted, and keep whatever they sample alive
+    keep = [
+        circuit.components[f"{market}_overall_pred"]
+        for market in trade_pressure.markets.keys()
+    ]
+    for (market, venue) in sampled_venues:
+        keep += sampled_roots(market, venue)
+
+    if not args.no_simplify:
+        print(simplify_circuit(circuit, keep=keep).summary())
+
+    if not args.keep_dead:
+        print(prune_dead_components(circuit, keep=keep).summary())
+
     # SO much duplicate code here
 
     def write_simmable(
@@ -614,16 +698,16 @@ def main():
         track: HasOutput,
         block: Set[ComponentOutput],
         postfix: str,
-    ):
+    ) -> WriterConfig:
         market_venue_graph = Graph.discover_from_circuit(
-            circuit, track, block_propagating=block
+            circuit,
+            track,
+            block_propagating=block,
+            minimal_sampling=not args.full_graphs,
         )
 
         market_venue_graph.mark_stored(circuit)
 
-        with open(f"{out_dir}/{market}_{venue}_{postfix}_graph.json", "w") as write_to:
-            write_to.write(market_venue_graph.to_json())
-
         target = circuit.components[f"{market}_{venue}_mid"]
         sampler = circuit.components[f"{market}_{venue}_bucket_sampler"]
 
@@ -637,95 +721,76 @@ def main():
             ms_future=1000 * 2,
         )
 
+        check_written_names(circuit, market_venue_graph, sample_config)
+
+        with open(f"{out_dir}/{market}_{venue}_{postfix}_graph.json", "w") as write_to:
+            write_to.write(market_venue_graph.to_json())
+
         with open(
             f"{out_dir}/{market}_{venue}_{postfix}_writer_config.json", "w"
         ) as write_to:
             write_to.write(sample_config.to_json())
 
-    for (market, market_config) in trade_pressure.markets.items():
-        for venue in market_config.venues.keys():
-            market_tp = circuit.components[f"{market}_trade_pressure"].output()
-            market_move = circuit.components[f"{market}_{venue}_depth_move"].output()
-            market_static = circuit.components[
-                f"{market}_{venue}_static_fair_projection"
-            ].output()
-            market_overall = circuit.components[f"{market}_overall_pred"].output()
-
-            # In a real-world trading setup, you'd need to do this incrementally
-            # and have most new signals track the overall prediction instead of their own
-            # Since the value isn't
-            #   "Who can have a standalone better prediction"
-            # it's
-            #   "Who can overall increase the value of the feature set"
-            #
-            # However I don't have the parameterization set up that well to do so
-            # You could have more debate about whether this gradient propagation would
-            # should go all the way up the tree per round,
-            # or just do whatever increases local performance the best
-            write_simmable(market, venue, market_tp, {market_move}, "trade_pressure")
-            write_simmable(market, venue, market_move, {market_tp}, "depth")
-            write_simmable(market, venue, market_overall, {}, "overall")
-            write_simmable(market, venue, market_static, {}, "static_fair")
-
-            # HACKS since I know I only have one lol
-            break
-
-    # This could be much better abstracted...
+        return sample_config
+
+    for (market, venue) in sampled_venues:
+        market_tp = circuit.components[f"{market}_trade_pressure"].output()
+        market_move = circuit.components[f"{market}_{venue}_depth_move"].output()
+        market_static = circuit.components[
+            f"{market}_{venue}_static_fair_projection"
+        ].output()
+        market_overall = circuit.components[f"{market}_overall_pred"].output()
+
+        # In a real-world trading setup, you'd need to do this incrementally
+        # and have most new signals track the overall prediction instead of their own
+        # Since the value isn't
+        #   "Who can have a standalone better prediction"
+        # it's
+        #   "Who can overall increase the value of the feature set"
+        #
+        # However I don't have the parameterization set up that well to do so
+        # You could have more debate about whether this gradient propagation would
+        # should go all the way up the tree per round,
+        # or just do whatever increases local performance the best
+        sample_configs = [
+            write_simmable(
+                market, venue, market_tp, {market_move}, "trade_pressure"
+            ),
+            write_simmable(market, venue, market_move, {market_tp}, "depth"),
+            write_simmable(market, venue, market_overall, {}, "overall"),
+            write_simmable(market, venue, market_static, {}, "static_fair"),
+        ]
+
+        # Samples every graph's edges at once, for training them jointly
+        with open(
+            f"{out_dir}/{market}_{venue}_joint_writer_config.json", "w"
+        ) as write_to:
+            write_to.write(WriterConfig.union(sample_configs).to_json())
+
     cc_names = []
+    emissions: List[Emission] = []
     for (market, market_config) in trade_pressure.markets.items():
         for venue in market_config.venues.keys():
-            local_name = f"{market}_{venue}_trades.cc"
-            cc_names.append(local_name)
-            file_name = f"{out_dir}/{local_name}"
             trades_call_name = f"{market}_{venue}_trades"
-
             options = CallStructOptions(
                 struct_name=STRUCT,
                 struct_header=HEADER,
                 call_name=trades_call_name,
             )
-            content = generate_circuit_call(
-                struct_options=options,
-                config=core_config,
-                circuit=circuit,
-            )
-            with open(file_name, "w") as write_to:
-                write_to.write(call_clang_format(content))
-
-            dot_content = generate_circuit_call_dot(
-                struct_options=options,
-                config=core_config,
-                circuit=circuit,
-            )
-
-            with open(f"{out_dir}/{market}_{venue}_trades.dot", "w") as write_to:
-                write_to.write(dot_content)
+            cc_names.append(f"{trades_call_name}.cc")
+            emissions.append(CallEmission(f"{trades_call_name}.cc", options))
+            emissions.append(CallDotEmission(f"{trades_call_name}.dot", options))
 
     for (market, market_config) in trade_pressure.markets.items():
         for venue in market_config.venues.keys():
-            local_name = f"{market}_{venue}_depth.cc"
-            cc_names.append(local_name)
-            file_name = f"{out_dir}/{local_name}"
             depth_call_name = f"{market}_{venue}_depth"
-
             options = CallStructOptions(
                 struct_name=STRUCT,
                 struct_header=HEADER,
                 call_name=depth_call_name,
             )
-            content = generate_circuit_call(
-                struct_options=options,
-                config=core_config,
-                circuit=circuit,
-            )
-            with open(file_name, "w") as write_to:
-                write_to.write(call_clang_format(content))
-
-            dot_content = generate_circuit_call_dot(
-                struct_options=options,
-                config=core_config,
-                circuit=circuit,
-            )
+            cc_names.append(f"{depth_call_name}.cc")
+            emissions.append(CallEmission(f"{depth_call_name}.cc", options))
 
     # Fill out some timer calls
     for component in circuit.components.values():
@@ -735,44 +800,39 @@ def main():
         fname = f"{component.name}_timer_callback.cc"
 
         cc_names.append(fname)
-
-        call = generate_timer_call(
-            TimerCallStructOptions(
-                struct_name=STRUCT, struct_header=HEADER, component_name=component.name
-            ),
-            core_config,
-            circuit,
+        emissions.append(
+            TimerEmission(
+                fname,
+                TimerCallStructOptions(
+                    struct_name=STRUCT,
+                    struct_header=HEADER,
+                    component_name=component.name,
+                ),
+            )
         )
 
-        with open(f"{out_dir}/{fname}", "w") as timer_file:
-            timer_file.write(call_clang_format(call))
+    emissions.append(StructEmission(f"{HEADER}.hh", STRUCT))
+    emissions.append(CircuitDotEmission(f"{HEADER}.dot"))
 
-    struct_content = generate_circuit_struct_file(
-        STRUCT, config=core_config, circuit=circuit
+    cc_names.append("init.cc")
+    emissions.append(
+        InitEmission(
+            "init.cc", InitStructOptions(struct_name=STRUCT, struct_header=HEADER)
+        )
     )
-    with open(f"{out_dir}/{HEADER}.hh", "w") as struct_file:
-        struct_file.write(call_clang_format(struct_content))
-
-    with open(f"{out_dir}/params.json", "w") as params_file:
-        json.dump(circuit.parameters(), params_file)
-
-    dot_content = generate_full_circuit_dot(circuit)
 
-    with open(f"{out_dir}/{HEADER}.dot", "w") as circuit_dot_file:
-        circuit_dot_file.write(dot_content)
+    write_if_changed(f"{out_dir}/params.json", json.dumps(circuit.parameters()))
 
-    init_content = generate_circuit_init(
-        InitStructOptions(struct_name=STRUCT, struct_header=HEADER),
-        config=core_config,
-        circuit=circuit,
+    emit_circuit_files(
+        emissions,
+        out_dir,
+        core_config,
+        circuit,
+        default_formatter(),
+        max_workers=args.jobs,
     )
-    cc_names.append("init.cc")
-
-    with open(f"{out_dir}/init.cc", "w") as init_file:
-        init_file.write(call_clang_format(init_content))
 
-    with open(f"{out_dir}/CMakeLists.txt", "w") as cmake_file:
-        cmake_file.write(generate_cmake_file(cc_names))
+    write_if_changed(f"{out_dir}/CMakeLists.txt", generate_cmake_file(cc_names))
 
 
 if __name__ == "__main__":